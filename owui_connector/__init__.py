@@ -1,15 +1,41 @@
+from .broadcast import BroadcastSubscriber, StreamBroadcast
+from .compression import BodyCompression, TransferStats
 from .connector import OpenWebUiConnector
+from .deadline import Deadline
+from .ingestion import (
+    IngestionIndex,
+    IngestionProgress,
+    IngestionResult,
+    KnowledgeIngestion,
+)
+from .model_catalog import ModelCatalog, ModelInfo
 from .models import (
+    BulkDeleteResult,
     Chat,
     ChatReference,
     MessageRoles,
     ModelChatResponse,
     ModelChatResponseInfo,
     OllamaRequest,
+    UploadedFile,
     User,
     UserChatMessage,
     WeekChatReference,
 )
+from .replica import ChatReplica
+from .router import ModelReservation, ModelRouter, ModelStats, RoutingContext
+from .scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    QueueStats,
+    RequestScheduler,
+)
+from .search_index import ChatSearchIndex, SearchResult
+from .socket_io import SocketIoClient
+from .stream_modes import SentenceSegmenter, coalesce_stream, iter_sentences
+from .streaming import ComparisonStream, StopConditions, StreamHandle
+from .sync_client import SyncOpenWebUiConnector, SyncStream
+from .worker_pool import ConsistentHashRing, WorkerPool
 
 __all__ = [
     "User",
@@ -22,4 +48,39 @@ __all__ = [
     "ModelChatResponseInfo",
     "MessageRoles",
     "OpenWebUiConnector",
+    "BulkDeleteResult",
+    "ChatSearchIndex",
+    "SearchResult",
+    "ChatReplica",
+    "SocketIoClient",
+    "SyncOpenWebUiConnector",
+    "SyncStream",
+    "ConsistentHashRing",
+    "WorkerPool",
+    "StopConditions",
+    "StreamHandle",
+    "StreamBroadcast",
+    "BroadcastSubscriber",
+    "SentenceSegmenter",
+    "coalesce_stream",
+    "iter_sentences",
+    "ModelCatalog",
+    "ModelInfo",
+    "ComparisonStream",
+    "UploadedFile",
+    "IngestionIndex",
+    "IngestionProgress",
+    "IngestionResult",
+    "KnowledgeIngestion",
+    "ModelRouter",
+    "ModelReservation",
+    "ModelStats",
+    "RoutingContext",
+    "BodyCompression",
+    "TransferStats",
+    "RequestScheduler",
+    "QueueStats",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_BATCH",
+    "Deadline",
 ]
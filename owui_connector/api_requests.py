@@ -3,15 +3,43 @@ This File houses the HTTP Operations for the OWUI Connector
 """
 
 from json import dumps
+from mimetypes import guess_type
+from os.path import basename, getsize
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, AsyncGenerator
 from uuid import uuid4
+from weakref import finalize
 
-from scarletio import get_or_create_event_loop, from_json
+from scarletio import AsyncIO, Task, get_or_create_event_loop, from_json
 from scarletio.http_client import HTTPClient
+from scarletio.web_common import FormData
 from scarletio.web_socket import WebSocketClient
-from scarletio.web_common import ConnectionClosed
 from scarletio.http_client.client_response import ClientResponse
 
+from .concurrency import map_bounded
+from .deadline import (
+    PHASE_GENERATION,
+    PHASE_SYNC,
+    Deadline,
+    run_connect,
+    run_phase,
+)
+from .router import ModelReservation
+from .scheduler import POOL_OLLAMA, POOL_PANEL, PRIORITY_INTERACTIVE, Slot
+from .socket_io import SocketIoClient
+from .stream_modes import SentenceSegmenter, get_last_sentence
+from .streaming import (
+    STOP_REASON_CANCELLED,
+    STOP_REASON_DEADLINE,
+    STOP_REASON_MAX_TOKENS,
+    STOP_REASON_STOP_SEQUENCE,
+    ComparisonStream,
+    IdleWatchdog,
+    StopConditions,
+    StreamHandle,
+)
 from .models import (
+    BulkDeleteResult,
     Chat,
     ChatReference,
     ModelChatResponse,
@@ -24,8 +52,25 @@ from .models import (
     CompletedModelMessage,
     CompletedModelMessageInfo,
     ModelChatResponseInfo,
+    MessageRoles,
+    UploadedFile,
 )
 
+if TYPE_CHECKING:
+    import numpy as np
+
+    from .compression import BodyCompression
+    from .embeddings import EmbeddingCache
+    from .ingestion import IngestionIndex
+    from .model_catalog import ModelCatalog
+    from .replica import ChatReplica
+    from .router import ModelRouter
+    from .scheduler import RequestScheduler
+    from .session_cache import SessionCache
+    from .search_index import ChatSearchIndex
+    from .semantic_cache import SemanticCache
+    from .usage import UsageLedger
+
 
 class ApiRequests:
     http_client: HTTPClient
@@ -37,6 +82,20 @@ class ApiRequests:
     session_id: str = ""
     transport_id: str
     ws_connection: WebSocketClient
+    socket: SocketIoClient
+    semantic_cache: "SemanticCache | None" = None
+    search_index: "ChatSearchIndex | None" = None
+    replica: "ChatReplica | None" = None
+    session_cache: "SessionCache | None" = None
+    model_catalog: "ModelCatalog | None" = None
+    ingestion_index: "IngestionIndex | None" = None
+    embedding_cache: "EmbeddingCache | None" = None
+    usage_ledger: "UsageLedger | None" = None
+    model_router: "ModelRouter | None" = None
+    body_compression: "BodyCompression | None" = None
+    scheduler: "RequestScheduler | None" = None
+    ollama_url: str | None = None
+    handshake_duration: float = 0.0
 
     def __init__(
         self,
@@ -52,45 +111,132 @@ class ApiRequests:
         self.token = token
         self.is_ssl = is_ssl
         self.transport_id = str(uuid4())
+        self.socket = SocketIoClient(self)
+        self.mirror_tasks: set[Task] = set()
+
+    async def connect(self, timeout: float = 30.0):
+        started_at = perf_counter()
+        loop = get_or_create_event_loop()
+
+        cached_user = None
+        user_saved_at = None
+        resumed = False
+        if self.session_cache is not None:
+            entry = self.session_cache.load(self.base_url, self.token)
+            cached_user = entry.user
+            user_saved_at = entry.user_saved_at if cached_user is not None else None
+
+            if entry.session_id is not None and entry.transport_id is not None:
+                self.session_id = entry.session_id
+                self.transport_id = entry.transport_id
+                resumed = True
+
+        # the user and the session do not depend on each other, so lets get them at once
+        user_task = None
+        if cached_user is None:
+            user_task = loop.create_task(self.get_panel_user())
+
+        try:
+            if not resumed:
+                await self.open_session()
+        except BaseException:
+            if user_task is not None:
+                user_task.cancel()
+            raise
+
+        if user_task is not None:
+            cached_user = await user_task
+
+        self.api_user = cached_user
+
+        # lets start the websocket connection, it is kept alive in the background
+        # a resumed session that went stale is replaced by a fresh one right away
+        self.socket.start(resumed)
+
+        waiter = loop.create_task(self._wait_connected())
+        waiter.apply_timeout(timeout)
+        try:
+            await waiter
+        except TimeoutError:
+            # the socket would keep reconnecting in the background otherwise
+            await self.socket.stop()
+            raise ConnectionError("Failed to connect to the OpenWebUi panel") from None
+
+        self.handshake_duration = perf_counter() - started_at
+
+        if self.session_cache is not None:
+            self.session_cache.save(
+                self.base_url,
+                self.token,
+                self.api_user,
+                self.session_id if self.session_cache.resume_session else None,
+                self.transport_id if self.session_cache.resume_session else None,
+                user_saved_at,
+            )
 
-    async def connect(self):
-        # get the session id and the user
-        self.session_id = await self.get_session_id()
-        self.api_user: User = await self.get_panel_user()
+    async def _wait_connected(self):
+        await self.socket.connected
 
-        # auth the session id so we can start using the api
+    async def open_session(self):
+        """
+        Opens a new socket.io session and authenticates it, so we can start using the api.
+        """
+        self.session_id = await self.get_session_id()
         await self.auth_session()
 
-        # lets start the websocket connection
-        async with self.http_client.connect_web_socket(
-            f"{self.ws_url}/ws/socket.io/?EIO=4&transport=websocket&sid={self.session_id}",
-        ) as websocket:
-            if not websocket:
-                raise ConnectionError("Failed to connect to the OpenWebUi panel")
+    async def close(self):
+        # the chats generated directly on Ollama still have to reach the panel
+        await self.wait_mirrored()
 
-            self.ws_connection = websocket
+        await self.socket.stop()
 
-            try:
-                await websocket.ensure_open()
-                # send 2probe to the server
-                await websocket.send("2probe")
+        if self.model_catalog is not None:
+            self.model_catalog.stop()
 
-            except ConnectionClosed:
-                # TODO: Implement reconnect logic
-                print("OpenWebUI Connector - Websocket Connection closed")
+        # a closed websocket ends its session on the panel too
+        if self.session_cache is not None:
+            self.session_cache.forget_session(self.base_url, self.token)
 
-            while True:
-                message = await websocket.receive()
+    def _get_chat_endpoint(self) -> tuple[str, dict[str, str]]:
+        """
+        Returns the url and the headers generations are requested with, Ollama itself in
+        the direct mode, and the Ollama proxy of the panel otherwise.
+        """
+        if self.ollama_url is not None:
+            return f"{self.ollama_url}/api/chat", {"Content-Type": "application/json"}
 
-                if message == "3probe":
-                    await websocket.send("5")
-                    break
+        return f"{self.base_url}/ollama/api/chat", {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+        }
 
-                if message == "2":
-                    await websocket.send("3")
-                    break
+    def _mirror(self, coroutine) -> Task:
+        """
+        Syncs a finished turn to the panel in the background.
+        """
+        task = get_or_create_event_loop().create_task(self._mirror_quietly(coroutine))
+        self.mirror_tasks.add(task)
+        task.add_done_callback(self.mirror_tasks.discard)
+        return task
+
+    async def _mirror_quietly(self, coroutine):
+        try:
+            await coroutine
+        except ConnectionError as error:
+            print(
+                f"OpenWebUI Connector - Failed to mirror a chat to the panel: {error!r}"
+            )
 
-                print(f"OpenWebUI Connector - Unhandled Websocket event: {message}")
+    async def wait_mirrored(self):
+        """
+        Waits until every turn generated directly on Ollama is synced to the panel.
+        """
+        while self.mirror_tasks:
+            tasks = list(self.mirror_tasks)
+            for task in tasks:
+                await task
+
+            self.mirror_tasks.difference_update(tasks)
 
     async def get_session_id(self) -> str:
         response: ClientResponse | None = await self.http_client.get(
@@ -100,8 +246,11 @@ class ApiRequests:
         if not isinstance(response, ClientResponse) or response.status != 200:
             raise ConnectionError("Failed to connect to the OpenWebUi panel")
 
-        response = await response.text()
-        response_json = from_json(str(response).replace("0", ""))
+        # the body is an engine.io open packet, a "0" followed by the handshake json
+        response = str(await response.text())
+        response_json = from_json(
+            response[1:] if response.startswith("0") else response
+        )
 
         return str(response_json["sid"])
 
@@ -133,8 +282,12 @@ class ApiRequests:
         return user
 
     async def get_week_chats(self) -> list[WeekChatReference]:
+        return await self.get_chats_page(None)
+
+    async def get_chats_page(self, page: int | None) -> list[WeekChatReference]:
         response: ClientResponse | None = await self.http_client.get(
-            f"{self.base_url}/api/v1/chats/",
+            f"{self.base_url}/api/v1/chats/"
+            + (f"?page={page}" if page is not None else ""),
             headers={"Authorization": f"Bearer {self.token}"},
         )
         if not isinstance(response, ClientResponse) or response.status != 200:
@@ -149,8 +302,7 @@ class ApiRequests:
             raise ConnectionError(
                 "Failed to get the week chats. The response is not a list."
             )
-        print("Week Chats")
-        print(response_json)
+
         week_chats = [
             WeekChatReference(
                 chat["id"],
@@ -162,7 +314,74 @@ class ApiRequests:
         ]
         return week_chats
 
-    async def get_chat_by_id(self, chat_id: str) -> dict:
+    async def iter_chats(
+        self,
+        updated_since: int | None = None,
+        title_prefix: str | None = None,
+    ) -> AsyncGenerator[WeekChatReference, None]:
+        """
+        Walks every page of the chat list, while the next page is already being fetched
+        in the background. Only two pages are held in memory at any time.
+
+        The panel returns the chats ordered by `updated_at` descending, so when filtering
+        with `updated_since` the walk stops at the first page that has no newer chat.
+
+        The walk also stops at the first page shorter than the first one, and at a page
+        without a chat that was not on the page before, which is what a panel ignoring
+        the page parameter returns. A chat moved to the next page by an update during
+        the walk is only yielded once.
+        """
+        loop = get_or_create_event_loop()
+        page = 1
+        page_size = None
+        previous_ids = set()
+        next_page_task = loop.create_task(self.get_chats_page(page))
+
+        try:
+            while True:
+                chats = await next_page_task
+                new_chats = [chat for chat in chats if chat.id not in previous_ids]
+                if not new_chats:
+                    return
+
+                is_last_page = page_size is not None and len(chats) < page_size
+                if page_size is None:
+                    page_size = len(chats)
+
+                if not is_last_page:
+                    page += 1
+                    next_page_task = loop.create_task(self.get_chats_page(page))
+
+                previous_ids = {chat.id for chat in chats}
+
+                has_newer_chat = False
+                for chat in new_chats:
+                    if updated_since is not None:
+                        if int(chat.updated_at) < updated_since:
+                            continue
+
+                        has_newer_chat = True
+
+                    if title_prefix is not None and not chat.title.startswith(
+                        title_prefix
+                    ):
+                        continue
+
+                    yield chat
+
+                if is_last_page or (updated_since is not None and not has_newer_chat):
+                    return
+
+        finally:
+            if not next_page_task.is_done():
+                next_page_task.cancel()
+
+    async def get_chat_by_id(self, chat_id: str, use_replica: bool = True) -> dict:
+        if use_replica and self.replica is not None:
+            chat = self.replica.get_chat_by_id(chat_id)
+            if chat is not None:
+                return chat
+
         response: ClientResponse | None = await self.http_client.get(
             f"{self.base_url}/api/v1/chats/{chat_id}/",
             headers={"Authorization": f"Bearer {self.token}"},
@@ -180,11 +399,25 @@ class ApiRequests:
                 "Failed to get the week chat. The response is not a dictionary."
             )
 
+        if self.replica is not None:
+            self.replica.upsert_chat(response_json)
+
         return response_json
 
     async def get_chat_by_title(self, chat_title: str) -> dict | None:
-        week_chats = await self.get_week_chats()
-        chat = next((chat for chat in week_chats if chat.title == chat_title), None)
+        # a synced replica knows every chat, so a miss there is a miss on the panel too
+        if self.replica is not None and self.replica.watermark is not None:
+            return self.replica.get_chat_by_title(chat_title)
+
+        chat = None
+        chats = self.iter_chats(title_prefix=chat_title)
+        try:
+            async for week_chat in chats:
+                if week_chat.title == chat_title:
+                    chat = week_chat
+                    break
+        finally:
+            await chats.aclose()
 
         if not isinstance(chat, WeekChatReference):
             return None
@@ -206,18 +439,47 @@ class ApiRequests:
 
         return response
 
-    async def create_chat(self, chat: Chat) -> ClientResponse:
-        chat_json = chat.to_dict(is_new=True)
-
-        response: ClientResponse | None = await self.http_client.post(
-            f"{self.base_url}/api/v1/chats/new",
-            headers={
+    def _slot(
+        self,
+        pool: str,
+        priority: str,
+        tenant: str | None,
+        deadline: float | None = None,
+    ) -> Slot:
+        # without a scheduler the slot does not wait for anything. the panel calls get no
+        # deadline here, their caller already runs them within the budget of their phase
+        return Slot(self.scheduler, pool, priority, tenant, deadline)
+
+    async def _encode_body(
+        self, body: str, headers: dict[str, str]
+    ) -> tuple[str | bytes, dict[str, str]]:
+        # the chat syncs post the whole history, so they are compressed if enabled
+        if self.body_compression is None:
+            return body, headers
+
+        return await self.body_compression.encode(body, headers)
+
+    async def create_chat(
+        self,
+        chat: Chat | dict,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> ClientResponse:
+        # already serialized chats are replayed as they are, for example on imports
+        chat_json = chat.to_dict(is_new=True) if isinstance(chat, Chat) else chat
+
+        data, headers = await self._encode_body(
+            dumps(chat_json),
+            {
                 "Authorization": f"Bearer {self.token}",
                 "Connection": "keep-alive",
                 "Content-Type": "application/json",
             },
-            data=dumps(chat_json),
         )
+        async with self._slot(POOL_PANEL, priority, tenant):
+            response: ClientResponse | None = await self.http_client.post(
+                f"{self.base_url}/api/v1/chats/new", headers=headers, data=data
+            )
 
         if not isinstance(response, ClientResponse) or response.status != 200:
             raise ConnectionError(
@@ -225,6 +487,9 @@ class ApiRequests:
                 Maybe the token is invalid, or the panel is unreachable?"
             )
 
+        if self.replica is not None:
+            self.replica.upsert_chat(await response.json())
+
         return response
 
     async def delete_chat_by_id(self, chat_id: str) -> ClientResponse:
@@ -239,8 +504,31 @@ class ApiRequests:
                 Maybe the token is invalid, or the panel is unreachable?"
             )
 
+        if self.search_index is not None:
+            self.search_index.remove_chat(chat_id)
+
+        if self.replica is not None:
+            self.replica.remove_chat(chat_id)
+
         return response
 
+    async def delete_chats_by_id(
+        self, chat_ids: list[str], concurrency: int = 8
+    ) -> BulkDeleteResult:
+        result = BulkDeleteResult([], {})
+
+        results = map_bounded(self.delete_chat_by_id, chat_ids, concurrency)
+        try:
+            async for chat_id, _, exception in results:
+                if exception is None:
+                    result.deleted.append(chat_id)
+                else:
+                    result.failed[chat_id] = exception
+        finally:
+            await results.aclose()
+
+        return result
+
     async def delete_chat_by_title(self, chat_title: str) -> ClientResponse:
         chat = await self.get_chat_by_title(chat_title)
         if not chat:
@@ -248,132 +536,861 @@ class ApiRequests:
 
         return await self.delete_chat_by_id(chat["chat"]["id"])
 
+    async def upload_file(
+        self,
+        path: str,
+        content_type: str | None = None,
+        chunk_size: int = 1 << 20,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> UploadedFile:
+        """
+        Uploads a file to the panel. The file is streamed from the disk in chunks of
+        `chunk_size` bytes, so even huge files are never held in memory at once.
+        """
+        if content_type is None:
+            content_type = guess_type(path)[0] or "application/octet-stream"
+
+        form = FormData()
+        form.add_field(
+            "file",
+            self._read_file_chunks(path, chunk_size),
+            content_type=content_type,
+            file_name=basename(path),
+        )
+
+        async with self._slot(POOL_PANEL, priority, tenant):
+            response: ClientResponse | None = await self.http_client.post(
+                f"{self.base_url}/api/v1/files/",
+                headers={"Authorization": f"Bearer {self.token}"},
+                data=form,
+            )
+
+        if not isinstance(response, ClientResponse) or response.status != 200:
+            raise ConnectionError(
+                f"Failed to upload the file {path} to the OpenWebUi panel"
+            )
+
+        response_json = await response.json()
+        if not isinstance(response_json, dict) or "id" not in response_json:
+            raise ConnectionError(
+                "Failed to upload the file. The response is not a dictionary."
+            )
+
+        uploaded_file = UploadedFile.from_response(response_json)
+        if not uploaded_file.size:
+            uploaded_file.size = getsize(path)
+
+        return uploaded_file
+
+    async def upload_files(
+        self,
+        paths: list[str],
+        concurrency: int = 4,
+        chunk_size: int = 1 << 20,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> list[UploadedFile]:
+        """
+        Uploads several files, at most `concurrency` at a time. The files are returned in
+        the order of their paths, and the first failed upload cancels the others.
+        """
+        uploaded_files: dict[str, UploadedFile] = {}
+
+        results = map_bounded(
+            lambda path: self.upload_file(
+                path, chunk_size=chunk_size, priority=priority, tenant=tenant
+            ),
+            dict.fromkeys(paths),
+            concurrency,
+        )
+        try:
+            async for path, uploaded_file, exception in results:
+                if exception is not None:
+                    raise exception
+
+                uploaded_files[path] = uploaded_file
+        finally:
+            await results.aclose()
+
+        return [uploaded_files[path] for path in paths]
+
+    async def add_file_to_knowledge(
+        self,
+        knowledge_id: str,
+        file_id: str,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> dict:
+        """
+        Adds an uploaded file to a knowledge base, the panel embeds it for retrieval.
+        """
+        async with self._slot(POOL_PANEL, priority, tenant):
+            response: ClientResponse | None = await self.http_client.post(
+                f"{self.base_url}/api/v1/knowledge/{knowledge_id}/file/add",
+                headers={
+                    "Authorization": f"Bearer {self.token}",
+                    "Content-Type": "application/json",
+                },
+                data=dumps({"file_id": file_id}),
+            )
+
+        if not isinstance(response, ClientResponse) or response.status != 200:
+            raise ConnectionError(
+                f"Failed to add the file {file_id} to the knowledge base {knowledge_id}"
+            )
+
+        response_json = await response.json()
+        if not isinstance(response_json, dict):
+            raise ConnectionError(
+                "Failed to add the file. The response is not a dictionary."
+            )
+
+        return response_json
+
+    async def _read_file_chunks(
+        self, path: str, chunk_size: int
+    ) -> AsyncGenerator[bytes, None]:
+        # the reads run on an executor thread, so the event loop keeps streaming
+        file = await AsyncIO(path, "rb")
+        try:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+
+                yield chunk
+        finally:
+            file.close()
+
+    async def get_embeddings(
+        self,
+        model: str,
+        texts: list[str],
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> list[list[float]]:
+        async with self._slot(POOL_OLLAMA, priority, tenant):
+            response: ClientResponse | None = await self.http_client.post(
+                f"{self.base_url}/ollama/api/embed",
+                headers={
+                    "Authorization": f"Bearer {self.token}",
+                    "Content-Type": "application/json",
+                },
+                data=dumps({"model": model, "input": texts}),
+            )
+
+        if not isinstance(response, ClientResponse) or response.status != 200:
+            raise ConnectionError(
+                "Failed to get the embeddings.\
+                Maybe the model is not pulled, or the panel is unreachable?"
+            )
+
+        response_json = await response.json()
+
+        if not isinstance(response_json, dict) or "embeddings" not in response_json:
+            raise ConnectionError(
+                "Failed to get the embeddings. The response is not a dictionary."
+            )
+
+        return response_json["embeddings"]
+
+    async def get_embedding(
+        self,
+        model: str,
+        text: str,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> list[float]:
+        return (await self.get_embeddings(model, [text], priority, tenant))[0]
+
+    async def embed(
+        self,
+        model: str,
+        texts: list[str],
+        batch_size: int = 256,
+        concurrency: int = 4,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> "np.ndarray":
+        """
+        Embeds any amount of texts in concurrent batches, returning a contiguous float32
+        matrix with one row per text. Requires the `numpy` extra.
+        """
+        from .embeddings import embed_texts
+
+        return await embed_texts(
+            self,
+            model,
+            texts,
+            batch_size,
+            concurrency,
+            self.embedding_cache,
+            priority,
+            tenant,
+        )
+
+    async def get_ollama_models(self) -> list[dict]:
+        response: ClientResponse | None = await self.http_client.get(
+            f"{self.base_url}/ollama/api/tags",
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+
+        if not isinstance(response, ClientResponse) or response.status != 200:
+            raise ConnectionError("Failed to get the models of the OpenWebUi panel")
+
+        response_json = await response.json()
+        if not isinstance(response_json, dict) or "models" not in response_json:
+            raise ConnectionError(
+                "Failed to get the models. The response is not a dictionary."
+            )
+
+        return response_json["models"]
+
+    async def show_ollama_model(self, model: str) -> dict:
+        response: ClientResponse | None = await self.http_client.post(
+            f"{self.base_url}/ollama/api/show",
+            headers={
+                "Authorization": f"Bearer {self.token}",
+                "Content-Type": "application/json",
+            },
+            data=dumps({"model": model}),
+        )
+
+        if not isinstance(response, ClientResponse) or response.status != 200:
+            raise ConnectionError(
+                f"Failed to get the details of the model {model} from the OpenWebUi panel"
+            )
+
+        response_json = await response.json()
+        if not isinstance(response_json, dict):
+            raise ConnectionError(
+                "Failed to get the model details. The response is not a dictionary."
+            )
+
+        return response_json
+
     async def send_ollama_request(
         self,
         ollama_request: OllamaRequest,
         chat_reference: ChatReference,
         stream: bool = True,
+        stop_conditions: StopConditions | None = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+        reservation: ModelReservation | None = None,
     ):
+        """
+        Sends a chat request to Ollama through the panel. Streamed requests return a
+        `StreamHandle`, that yields the Ollama chunks and can cancel the generation.
+        `stop_conditions` only apply to streamed requests.
+
+        With a scheduler, the request waits for an Ollama slot of its `priority` class,
+        accounted to `tenant`. With a `deadline`, the generation and the sync each have
+        to finish within their budget.
+
+        The request takes over the `reservation` of its model, if the model was resolved
+        by the model router, and gives it back once it finished.
+        """
+        if reservation is None:
+            reservation = self._reserve_model(ollama_request.model)
+
+        # check the semantic cache before we bother the model
+        prompt_vector = None
+        cache_prompt = self._get_cache_prompt(ollama_request)
+        if self.semantic_cache is not None and cache_prompt is not None:
+            try:
+                prompt_vector = await run_phase(
+                    deadline,
+                    PHASE_GENERATION,
+                    self.semantic_cache.embed(cache_prompt),
+                )
+            except BaseException:
+                reservation.cancel()
+                raise
+
+            cache_hit = self.semantic_cache.lookup(prompt_vector, ollama_request.model)
+            if cache_hit is not None:
+                # the model does not run for a cached answer
+                reservation.cancel()
+                if stream:
+                    handle = StreamHandle()
+                    handle.message = chat_reference.messages[-1]
+                    handle.stream = self._cached_response_generator(
+                        ollama_request,
+                        chat_reference,
+                        handle,
+                        cache_hit.answer,
+                        priority,
+                        tenant,
+                        deadline,
+                    )
+                    return handle
+
+                return await self._cached_response(
+                    ollama_request,
+                    chat_reference,
+                    cache_hit.answer,
+                    priority,
+                    tenant,
+                    deadline,
+                )
+
         # if we got stream true we need to return an async generator
         if stream:
-            return self._stream_response_generator(ollama_request, chat_reference)
+            handle = StreamHandle()
+            handle.message = chat_reference.messages[-1]
+            handle.stream = self._stream_response_generator(
+                ollama_request,
+                chat_reference,
+                handle,
+                prompt_vector,
+                stop_conditions,
+                priority=priority,
+                tenant=tenant,
+                deadline=deadline,
+                reservation=reservation,
+            )
+            # a stream dropped without being started gives its reservation back
+            finalize(handle, reservation.cancel)
+            return handle
 
         if self.http_client is None:
+            reservation.cancel()
             raise ValueError("Http client not initialized")
 
         # if we got stream false we need to return the response
-        async with self.http_client.post(
-            f"{self.base_url}/ollama/api/chat",
-            data=dumps(ollama_request.__dict__),
-            headers={
-                "Authorization": f"Bearer {self.token}",
-                "Content-Type": "application/json",
-            },
-        ) as response:
-            if response and response.status != 200 or not response:
-                raise ConnectionError("Failed to create chat on the OpenWebUi panel")
-
-            response_content = await response.json()
-            complete_model_message_info = CompletedModelMessageInfo(
-                total_duration=response_content["total_duration"],
-                load_duration=response_content["load_duration"],
-                prompt_eval_count=response_content["prompt_eval_count"],
-                prompt_eval_duration=response_content["prompt_eval_duration"],
-                eval_count=response_content["eval_count"],
-                eval_duration=response_content["eval_duration"],
+        complete_model_message_info = None
+        try:
+            response, response_content, complete_model_message_info = await run_phase(
+                deadline,
+                PHASE_GENERATION,
+                self._generate_response(ollama_request, priority, tenant, deadline),
             )
 
-            response_content = response_content["message"]["content"]
-
-            response = await response.json()
-
             # check if is type dict
             if not isinstance(response, dict):
                 raise ConnectionError("Ollama returned an invalid response")
 
-            await self._send_chat_completion(
+            sync = run_phase(
+                deadline,
+                PHASE_SYNC,
+                self._send_chat_completion(
+                    response_content,
+                    complete_model_message_info,
+                    chat_reference,
+                    ollama_request.id,
+                    priority=priority,
+                    tenant=tenant,
+                ),
+            )
+            if self.ollama_url is not None:
+                # the reply does not wait for the panel in the direct mode
+                self._mirror(sync)
+            else:
+                await sync
+
+            self._remember_response(ollama_request, prompt_vector, response_content)
+            return response
+
+        finally:
+            reservation.release(complete_model_message_info)
+
+    async def _generate_response(
+        self,
+        ollama_request: OllamaRequest,
+        priority: str,
+        tenant: str | None,
+        deadline: Deadline | None,
+    ) -> tuple[dict, str, CompletedModelMessageInfo]:
+        """
+        This internal function generates a reply without streaming it.
+        """
+        url, headers = self._get_chat_endpoint()
+        slot_deadline = (
+            None if deadline is None else deadline.get_phase_end(PHASE_GENERATION)
+        )
+        # the slot is only held while Ollama generates, not while the panel syncs
+        async with self._slot(POOL_OLLAMA, priority, tenant, slot_deadline):
+            request = self.http_client.post(
+                url, data=dumps(ollama_request.__dict__), headers=headers
+            )
+            await self._open_response(request, deadline)
+
+            async with request as response:
+                if response and response.status != 200 or not response:
+                    raise ConnectionError(
+                        "Failed to create chat on the OpenWebUi panel"
+                    )
+
+                response_content = await response.json()
+                complete_model_message_info = CompletedModelMessageInfo(
+                    total_duration=response_content["total_duration"],
+                    load_duration=response_content["load_duration"],
+                    prompt_eval_count=response_content["prompt_eval_count"],
+                    prompt_eval_duration=response_content["prompt_eval_duration"],
+                    eval_count=response_content["eval_count"],
+                    eval_duration=response_content["eval_duration"],
+                )
+
+                response_content = response_content["message"]["content"]
+
+                response = await response.json()
+
+        return response, response_content, complete_model_message_info
+
+    def send_comparison_requests(
+        self,
+        ollama_requests: list[OllamaRequest],
+        chat_reference: ChatReference,
+        messages: list[ModelChatResponse],
+        stop_conditions: StopConditions | None = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+        reservations: list[ModelReservation] | None = None,
+    ) -> ComparisonStream:
+        """
+        Streams the same prompt from several models at once, each reply into its own
+        sibling message. The replies are synced to the panel together.
+
+        Every reply takes over the reservation of its model, if the models were resolved
+        by the model router.
+        """
+        if reservations is None:
+            reservations = [
+                self._reserve_model(ollama_request.model)
+                for ollama_request in ollama_requests
+            ]
+
+        handles = {}
+        for ollama_request, message, reservation in zip(
+            ollama_requests, messages, reservations, strict=True
+        ):
+            handle = StreamHandle()
+            handle.message = message
+            handle.stream = self._stream_response_generator(
+                ollama_request,
+                chat_reference,
+                handle,
+                stop_conditions=stop_conditions,
+                persist=False,
+                priority=priority,
+                tenant=tenant,
+                deadline=deadline,
+                reservation=reservation,
+            )
+            # a stream dropped without being started gives its reservation back
+            finalize(handle, reservation.cancel)
+            handles[ollama_request.model] = handle
+
+        return ComparisonStream(
+            handles,
+            lambda: run_phase(
+                deadline,
+                PHASE_SYNC,
+                self._sync_chat(
+                    chat_reference, ollama_requests[0].id, messages, priority, tenant
+                ),
+            ),
+        )
+
+    def _reserve_model(self, model: str) -> ModelReservation:
+        """
+        This internal function counts a request of the model in flight, if the model
+        router is enabled.
+        """
+        if self.model_router is None:
+            return ModelReservation(None, model)
+
+        return self.model_router.reserve(model)
+
+    def _get_cache_prompt(self, ollama_request: OllamaRequest) -> str | None:
+        """
+        This internal function returns the prompt a request is cached by, or None if the
+        request can not be answered from the semantic cache.
+
+        Only a conversation of a single user message is cached. The meaning of a follow-up
+        ("yes", "continue", "explain more") and of a system prompt depends on the messages
+        around it, so a cached answer of a similar line would be an answer to another
+        conversation.
+        """
+        if len(ollama_request.messages) != 1:
+            return None
+
+        message = ollama_request.messages[0]
+        if message["role"] != MessageRoles.USER.value:
+            return None
+
+        return message["content"]
+
+    def _remember_response(
+        self,
+        ollama_request: OllamaRequest,
+        prompt_vector,
+        response_content: str,
+    ):
+        """
+        This internal function stores a finished response in the semantic cache, if enabled.
+        """
+        if self.semantic_cache is None or prompt_vector is None or not response_content:
+            return
+
+        self.semantic_cache.store(
+            prompt_vector,
+            ollama_request.model,
+            self._get_cache_prompt(ollama_request),
+            response_content,
+        )
+
+    def _build_cached_response(
+        self, ollama_request: OllamaRequest, response_content: str
+    ) -> dict:
+        """
+        This internal function builds an Ollama shaped response for a semantic cache hit.
+        """
+        return {
+            "model": ollama_request.model,
+            "message": {
+                "role": "assistant",
+                "content": response_content,
+            },
+            "done": True,
+            "total_duration": 0,
+            "load_duration": 0,
+            "prompt_eval_count": 0,
+            "prompt_eval_duration": 0,
+            "eval_count": 0,
+            "eval_duration": 0,
+        }
+
+    async def _cached_response(
+        self,
+        ollama_request: OllamaRequest,
+        chat_reference: ChatReference,
+        response_content: str,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+    ) -> dict:
+        """
+        This internal function answers a non streamed request from the semantic cache,
+        and keeps the panel in sync like a normal completion would.
+        """
+        await run_phase(
+            deadline,
+            PHASE_SYNC,
+            self._send_chat_completion(
                 response_content,
-                complete_model_message_info,
+                CompletedModelMessageInfo(0, 0, 0, 0, 0, 0),
                 chat_reference,
                 ollama_request.id,
+                priority=priority,
+                tenant=tenant,
+            ),
+        )
+        return self._build_cached_response(ollama_request, response_content)
+
+    async def _cached_response_generator(
+        self,
+        ollama_request: OllamaRequest,
+        chat_reference: ChatReference,
+        handle: StreamHandle,
+        response_content: str,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+    ):
+        """
+        This internal function answers a streamed request from the semantic cache
+        with a single, already finished chunk, into `handle.message`.
+        """
+        try:
+            yield self._build_cached_response(ollama_request, response_content)
+
+        finally:
+            self._apply_completion(
+                handle.message,
+                response_content,
+                CompletedModelMessageInfo(0, 0, 0, 0, 0, 0),
             )
-            return response
+            sync = run_phase(
+                deadline,
+                PHASE_SYNC,
+                self._sync_chat(
+                    chat_reference,
+                    ollama_request.id,
+                    [handle.message],
+                    priority,
+                    tenant,
+                ),
+            )
+            handle.completion_task = (
+                self._mirror(sync)
+                if self.ollama_url is not None
+                else get_or_create_event_loop().create_task(sync)
+            )
+            handle.finished.set()
 
     async def _stream_response_generator(
         self,
         data: OllamaRequest,
         chat_reference: ChatReference,
+        handle: StreamHandle,
+        prompt_vector=None,
+        stop_conditions: StopConditions | None = None,
+        persist: bool = True,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+        reservation: ModelReservation | None = None,
     ):
         """
-        This internal function is used to create an async generator that streams the response.
+        This internal function is used to create an async generator that streams the response
+        into `handle.message`.
+
+        Whatever way the stream ends, the reply is stored once: complete if the model or a
+        stop condition finished it, and marked as cancelled otherwise. Unless `persist` is
+        unset, it is then synced to the panel.
+
+        With a scheduler, the Ollama slot is held until the stream ends. A stream whose
+        deadline passes while it waits for the slot fails with a `TimeoutError`.
+
+        With a `deadline`, the generation phase ends the stream like the deadline of the
+        stop conditions, and the connect timeout raises a `TimeoutError`. The first byte
+        and idle timeouts end the stream with the "timeout" stop reason.
         """
         if self.http_client is None:
             raise ValueError("Http client not initialized")
 
-        async with self.http_client.post(
-            f"{self.base_url}/ollama/api/chat",
-            data=dumps(data.__dict__),
-            headers={
-                "Authorization": f"Bearer {self.token}",
-                "Content-Type": "application/json",
-            },
-        ) as response:
+        loop = get_or_create_event_loop()
+        response_content = ""
+        complete_model_message_info = CompletedModelMessageInfo(
+            total_duration=0,
+            load_duration=0,
+            prompt_eval_count=0,
+            prompt_eval_duration=0,
+            eval_count=0,
+            eval_duration=0,
+        )
+        segmenter = SentenceSegmenter()
+        started = False
+        done = False
+        deadline_timer = None
+        watchdog = None
+        ticket = None
+
+        # the earlier of the stop condition deadline and the end of the generation phase
+        stream_deadlines = []
+        if stop_conditions is not None and stop_conditions.deadline is not None:
+            stream_deadlines.append(stop_conditions.deadline)
+
+        if deadline is not None:
+            stream_deadlines.append(deadline.get_phase_end(PHASE_GENERATION))
+
+        stream_deadline = min(stream_deadlines) if stream_deadlines else None
+
+        if reservation is None:
+            reservation = self._reserve_model(data.model)
+
+        url, headers = self._get_chat_endpoint()
+        try:
+            if self.scheduler is not None:
+                ticket = await self.scheduler.acquire(
+                    POOL_OLLAMA, priority, tenant, stream_deadline
+                )
 
-            if response and response.status != 200 or not response:
-                raise ConnectionError("Failed to create chat on the OpenWebUi panel")
+            request = self.http_client.post(
+                url, data=dumps(data.__dict__), headers=headers
+            )
+            await self._open_response(request, deadline)
 
-            response_content = ""
+            async with request as response:
 
-            complete_model_message_info = CompletedModelMessageInfo(
-                total_duration=0,
-                load_duration=0,
-                prompt_eval_count=0,
-                prompt_eval_duration=0,
-                eval_count=0,
-                eval_duration=0,
-            )
+                if response and response.status != 200 or not response:
+                    raise ConnectionError(
+                        "Failed to create chat on the OpenWebUi panel"
+                    )
 
-            payload_stream = response.payload_stream
+                started = True
+                handle.response = response
+                if stream_deadline is not None:
+                    # the deadline has to fire even if the model stalls between chunks
+                    deadline_timer = loop.call_after(
+                        max(stream_deadline - monotonic(), 0.0),
+                        handle.abort,
+                        STOP_REASON_DEADLINE,
+                    )
 
-            payload_stream.add_done_callback(
-                lambda _: get_or_create_event_loop().ensure_future(
-                    self._send_chat_completion(
-                        response_content,
-                        complete_model_message_info,
-                        chat_reference,
-                        data.id,
+                if deadline is not None and (
+                    deadline.first_byte_timeout is not None
+                    or deadline.idle_timeout is not None
+                ):
+                    watchdog = IdleWatchdog(
+                        handle, deadline.first_byte_timeout, deadline.idle_timeout
                     )
+
+                held_content = ""
+                token_count = 0
+
+                try:
+                    payload_stream = response.payload_stream
+                    if payload_stream is not None:
+                        # dropping the iterator of an unfinished payload returns the
+                        # connection to the pool, so keep it until the response is closed
+                        chunks = payload_stream.__aiter__()
+                        async for chunk in chunks:
+                            if watchdog is not None:
+                                watchdog.feed()
+
+                            json_content = from_json(chunk.tobytes()[:-1])
+
+                            if json_content.get("done") is True:
+                                done = True
+                                # lets add the eval time to the info
+                                complete_model_message_info.total_duration += (
+                                    json_content["total_duration"]
+                                )
+                                complete_model_message_info.load_duration += (
+                                    json_content["load_duration"]
+                                )
+                                complete_model_message_info.prompt_eval_count += (
+                                    json_content["prompt_eval_count"]
+                                )
+                                complete_model_message_info.prompt_eval_duration += (
+                                    json_content["prompt_eval_duration"]
+                                )
+                                complete_model_message_info.eval_count += json_content[
+                                    "eval_count"
+                                ]
+                                complete_model_message_info.eval_duration += (
+                                    json_content["eval_duration"]
+                                )
+
+                            if stop_conditions is not None:
+                                token_count += 1
+                                content, held_content, stopped = stop_conditions.split(
+                                    held_content + json_content["message"]["content"]
+                                )
+                                if done:
+                                    content += held_content
+                                elif stopped:
+                                    handle.stop_reason = STOP_REASON_STOP_SEQUENCE
+                                elif (
+                                    stop_conditions.max_tokens is not None
+                                    and token_count >= stop_conditions.max_tokens
+                                ):
+                                    content += held_content
+                                    handle.stop_reason = STOP_REASON_MAX_TOKENS
+
+                                json_content["message"]["content"] = content
+                                if handle.stop_reason is not None:
+                                    json_content["done"] = True
+                                    json_content["done_reason"] = handle.stop_reason
+
+                            response_content += json_content["message"]["content"]
+                            for sentence in segmenter.feed(
+                                json_content["message"]["content"]
+                            ):
+                                handle.message.last_sentence = sentence
+
+                            yield json_content
+
+                            if handle.stop_reason is not None:
+                                break
+
+                except ConnectionError:
+                    # closing the response from the handle wakes the reader up this way
+                    if handle.stop_reason is None:
+                        raise
+
+                finally:
+                    if not done:
+                        # closing the connection makes Ollama abort the generation
+                        response.close()
+
+        finally:
+            if deadline_timer is not None:
+                deadline_timer.cancel()
+
+            if watchdog is not None:
+                watchdog.stop()
+
+            if ticket is not None:
+                ticket.release()
+
+            # only a finished reply has meaningful statistics
+            reservation.release(complete_model_message_info if done else None)
+
+            if started:
+                last_sentence = segmenter.flush()
+                if last_sentence is not None:
+                    handle.message.last_sentence = last_sentence
+
+                cancelled = not done and (
+                    handle.stop_reason is None
+                    or handle.stop_reason == STOP_REASON_CANCELLED
                 )
-            )
+                if cancelled:
+                    handle.stop_reason = STOP_REASON_CANCELLED
+                elif done and handle.stop_reason is None:
+                    # a reply cut short by a limit of this caller is no answer for others
+                    self._remember_response(data, prompt_vector, response_content)
+
+                self._apply_completion(
+                    handle.message,
+                    response_content,
+                    complete_model_message_info,
+                    cancelled,
+                )
+                if persist:
+                    sync = run_phase(
+                        deadline,
+                        PHASE_SYNC,
+                        self._sync_chat(
+                            chat_reference, data.id, [handle.message], priority, tenant
+                        ),
+                    )
+                    handle.completion_task = (
+                        self._mirror(sync)
+                        if self.ollama_url is not None
+                        else loop.create_task(sync)
+                    )
+
+            handle.finished.set()
+
+    async def _open_response(self, request, deadline: Deadline | None):
+        """
+        This internal function waits for the response headers of a generation, within the
+        connect timeout of the deadline.
+        """
+        await run_connect(deadline, request.__aenter__())
 
-            if payload_stream is not None:
-                async for chunk in payload_stream:
-                    json_content = from_json(chunk.tobytes()[:-1])
-
-                    if json_content.get("done") is True:
-                        # lets add the eval time to the info
-                        complete_model_message_info.total_duration += json_content[
-                            "total_duration"
-                        ]
-                        complete_model_message_info.load_duration += json_content[
-                            "load_duration"
-                        ]
-                        complete_model_message_info.prompt_eval_count += json_content[
-                            "prompt_eval_count"
-                        ]
-                        complete_model_message_info.prompt_eval_duration += (
-                            json_content["prompt_eval_duration"]
-                        )
-                        complete_model_message_info.eval_count += json_content[
-                            "eval_count"
-                        ]
-                        complete_model_message_info.eval_duration += json_content[
-                            "eval_duration"
-                        ]
-
-                    response_content += json_content["message"]["content"]
-
-                    yield json_content
+    def _apply_completion(
+        self,
+        message: ModelChatResponse,
+        response_content: str,
+        complete_model_message_info: CompletedModelMessageInfo,
+        cancelled: bool = False,
+    ):
+        """
+        This internal function stores the finished response in its chat message.
+        """
+        message.content = response_content
+        message.cancelled = cancelled
+        if not message.last_sentence:
+            message.last_sentence = get_last_sentence(response_content)
+
+        info = complete_model_message_info
+        message.info = ModelChatResponseInfo(
+            total_duration=info.total_duration,
+            load_duration=info.load_duration,
+            prompt_eval_count=info.prompt_eval_count,
+            prompt_eval_duration=info.prompt_eval_duration,
+            eval_count=info.eval_count,
+            eval_duration=info.eval_duration,
+        )
 
     async def _send_chat_completion(
         self,
@@ -381,13 +1398,51 @@ class ApiRequests:
         complete_model_message_info: CompletedModelMessageInfo,
         chat_reference: ChatReference,
         ollama_request_id: str,
+        cancelled: bool = False,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
     ):
         """
         This internal function is send, immediately after the chat is completed,
         to keep the panel in sync with the wrapper.
         """
         # set the message in the chat references content to the response content
-        chat_reference.messages[-1].content = response_content
+        self._apply_completion(
+            chat_reference.messages[-1],
+            response_content,
+            complete_model_message_info,
+            cancelled,
+        )
+        await self._sync_chat(
+            chat_reference,
+            ollama_request_id,
+            [chat_reference.messages[-1]],
+            priority,
+            tenant,
+        )
+
+    async def _sync_chat(
+        self,
+        chat_reference: ChatReference,
+        ollama_request_id: str,
+        completed_messages: list[ModelChatResponse],
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ):
+        """
+        This internal function syncs a chat to the panel, once its responses are stored
+        with `_apply_completion`. Sibling responses of several models share one sync.
+        """
+        if self.usage_ledger is not None:
+            for message in completed_messages:
+                if message.info is not None:
+                    self.usage_ledger.record(
+                        message.model,
+                        chat_reference.id,
+                        self.api_user.id,
+                        message.info,
+                        message.cancelled,
+                    )
 
         messages = []
         for message in chat_reference.messages:
@@ -401,22 +1456,12 @@ class ApiRequests:
                 )
 
             if isinstance(message, ModelChatResponse):
-                # if its the last message we need to add the info, otherwise, we just use the normal class
-                if message == chat_reference.messages[-1]:
-                    info = complete_model_message_info
-                    message.info = ModelChatResponseInfo(
-                        total_duration=info.total_duration,
-                        load_duration=info.load_duration,
-                        prompt_eval_count=info.prompt_eval_count,
-                        prompt_eval_duration=info.prompt_eval_duration,
-                        eval_count=info.eval_count,
-                        eval_duration=info.eval_duration,
-                    )
-
-                else:
-                    info = message.info
-
-                # lets add the info to the last message
+                # a response that failed before it started has no info
+                info = (
+                    message.info
+                    if message.info is not None
+                    else CompletedModelMessageInfo(0, 0, 0, 0, 0, 0)
+                )
 
                 messages.append(
                     CompletedModelMessage(
@@ -442,14 +1487,17 @@ class ApiRequests:
             raise ValueError("Http client not initialized")
 
         # Lets do the post request
-        response = await self.http_client.post(
-            f"{self.base_url}/api/chat/completed",
-            data=dumps(request.__dict__),
-            headers={
+        data, headers = await self._encode_body(
+            dumps(request.__dict__),
+            {
                 "Authorization": f"Bearer {self.token}",
                 "Content-Type": "application/json",
             },
         )
+        async with self._slot(POOL_PANEL, priority, tenant):
+            response = await self.http_client.post(
+                f"{self.base_url}/api/chat/completed", data=data, headers=headers
+            )
 
         if not isinstance(response, ClientResponse) or response.status != 200:
             raise ConnectionError(
@@ -458,10 +1506,11 @@ class ApiRequests:
 
         print(await response.json())
 
-        # update the history of the chat reference
-        chat_reference.history = chat_reference.chat_messages_to_history(
-            chat_reference.messages
-        )
+        # update the history of the chat reference, only the responses changed
+        for message in completed_messages:
+            chat_reference.tree.update(message)
+
+        chat_reference.history = chat_reference.tree.history
 
         # set every chat msg to done
         for message in chat_reference.messages:
@@ -469,18 +1518,31 @@ class ApiRequests:
                 message.done = True
 
         # lets post to the chat
-        response = await self.http_client.post(
-            f"{self.base_url}/api/v1/chats/{chat_reference.id}/",
-            headers={
+        data, headers = await self._encode_body(
+            dumps(Chat(chat_reference).to_dict()),
+            {
                 "Authorization": f"Bearer {self.token}",
                 "Content-Type": "application/json",
             },
-            data=dumps(Chat(chat_reference).to_dict()),
         )
+        async with self._slot(POOL_PANEL, priority, tenant):
+            response = await self.http_client.post(
+                f"{self.base_url}/api/v1/chats/{chat_reference.id}/",
+                headers=headers,
+                data=data,
+            )
 
         if response and response.status != 200 or not response:
             raise ConnectionError(
                 "Failed to send chat completion to the OpenWebUi panel"
             )
 
-        print(await response.json())
+        chat_json = await response.json()
+        print(chat_json)
+
+        if self.replica is not None and isinstance(chat_json, dict):
+            self.replica.upsert_chat(chat_json)
+
+        if self.search_index is not None:
+            for message in completed_messages:
+                self.search_index.index_completion(chat_reference, message)
@@ -0,0 +1,219 @@
+"""
+This module houses the broadcast of one stream to many subscribers.
+
+A single pump task consumes the source stream once, and hands every item to the buffers of
+the attached subscribers. Subscribers attaching late can be replayed the items that were
+already emitted, and a slow subscriber is handled by the policy of the broadcast.
+"""
+
+from collections import deque
+from typing import Any, AsyncIterator, Literal
+
+from scarletio import CancelledError, Event, Task, get_or_create_event_loop
+
+from .streaming import StreamHandle
+
+SlowConsumerPolicy = Literal["drop", "block", "disconnect"]
+
+
+class BroadcastSubscriber:
+    """
+    One consumer of a `StreamBroadcast`, iterated like the source stream.
+
+    Attributes:
+        broadcast (StreamBroadcast): The broadcast the subscriber is attached to.
+        replay_items (deque[Any]): The already emitted items, that are replayed first.
+        buffer (deque[Any]): The items emitted since the subscriber attached.
+        dropped (int): The amount of items dropped, because the subscriber fell behind.
+        disconnected (bool): Whether the subscriber was disconnected for falling behind.
+        closed (bool): Whether the subscriber detached itself.
+    """
+
+    broadcast: "StreamBroadcast"
+    replay_items: deque[Any]
+    buffer: deque[Any]
+    dropped: int
+    disconnected: bool
+    closed: bool
+
+    def __init__(self, broadcast: "StreamBroadcast", replay_items: list[Any]):
+        self.broadcast = broadcast
+        self.replay_items = deque(replay_items)
+        self.buffer = deque()
+        self.dropped = 0
+        self.disconnected = False
+        self.closed = False
+
+        loop = get_or_create_event_loop()
+        self._readable = Event(loop)
+        self._writable = Event(loop)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        while True:
+            if self.replay_items:
+                return self.replay_items.popleft()
+
+            if self.disconnected:
+                raise RuntimeError(
+                    "The subscriber fell behind the broadcast and was disconnected"
+                )
+
+            if self.buffer:
+                item = self.buffer.popleft()
+                self._writable.set()
+                return item
+
+            if self.closed:
+                raise StopAsyncIteration
+
+            if self.broadcast.done:
+                if self.broadcast.exception is not None:
+                    raise self.broadcast.exception
+
+                raise StopAsyncIteration
+
+            self._readable.clear()
+            await self._readable
+
+    async def aclose(self):
+        """
+        Detaches the subscriber, the broadcast goes on for the others.
+        """
+        self.closed = True
+        self.buffer.clear()
+        self.replay_items.clear()
+        self.broadcast._unsubscribe(self)
+        self._writable.set()
+        self._readable.set()
+
+    def _put(self, item: Any):
+        self.buffer.append(item)
+        self._readable.set()
+
+    def _disconnect(self):
+        self.disconnected = True
+        self.buffer.clear()
+        self.broadcast._unsubscribe(self)
+        self._readable.set()
+
+    async def _wait_writable(self, buffer_size: int):
+        while len(self.buffer) >= buffer_size and not self.closed:
+            self._writable.clear()
+            await self._writable
+
+
+class StreamBroadcast:
+    """
+    Fans one stream out to many subscribers, consuming the source only once.
+
+    Attributes:
+        source (AsyncIterator): The broadcasted stream, for example a `StreamHandle`.
+        buffer_size (int): The maximal amount of items buffered for a single subscriber.
+        policy (SlowConsumerPolicy): What happens when the buffer of a subscriber is full.
+            "drop" drops its oldest buffered item, "block" holds the whole broadcast back
+            until it catches up, and "disconnect" detaches it with an error.
+        replay (bool): Whether the emitted items are kept to replay them to late joiners.
+        items (list[Any]): The emitted items, if `replay` is set.
+        subscribers (list[BroadcastSubscriber]): The attached subscribers.
+        done (bool): Whether the source is exhausted.
+        exception (Exception | None): The exception the source failed with, if any.
+        task (Task | None): The task consuming the source.
+    """
+
+    source: AsyncIterator
+    buffer_size: int
+    policy: SlowConsumerPolicy
+    replay: bool
+    items: list[Any]
+    subscribers: list[BroadcastSubscriber]
+    done: bool
+    exception: Exception | None
+    task: Task | None
+
+    def __init__(
+        self,
+        source: AsyncIterator,
+        buffer_size: int = 256,
+        policy: SlowConsumerPolicy = "block",
+        replay: bool = True,
+    ):
+        if buffer_size < 1:
+            raise ValueError("The buffer size must be at least 1")
+
+        if policy not in ("drop", "block", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+
+        self.source = source
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.replay = replay
+        self.items = []
+        self.subscribers = []
+        self.done = False
+        self.exception = None
+        self.task = None
+
+    def subscribe(self, replay: bool = True) -> BroadcastSubscriber:
+        """
+        Attaches a new subscriber, and starts the broadcast if it was not running yet.
+
+        Args:
+            replay (bool): Whether the subscriber receives the already emitted items first.
+        """
+        subscriber = BroadcastSubscriber(self, self.items if replay else [])
+        if not self.done:
+            self.subscribers.append(subscriber)
+
+        self.start()
+        return subscriber
+
+    def start(self):
+        if self.task is None:
+            self.task = get_or_create_event_loop().create_task(self._pump())
+
+    async def cancel(self):
+        """
+        Stops the source, cancelling the generation if it is a `StreamHandle`.
+        """
+        if isinstance(self.source, StreamHandle):
+            await self.source.cancel()
+        elif self.task is not None and not self.task.is_done():
+            self.task.cancel()
+
+    def _unsubscribe(self, subscriber: BroadcastSubscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+
+    async def _pump(self):
+        try:
+            async for item in self.source:
+                if self.replay:
+                    self.items.append(item)
+
+                for subscriber in list(self.subscribers):
+                    if len(subscriber.buffer) >= self.buffer_size:
+                        if self.policy == "block":
+                            await subscriber._wait_writable(self.buffer_size)
+                        elif self.policy == "drop":
+                            subscriber.buffer.popleft()
+                            subscriber.dropped += 1
+                        else:
+                            subscriber._disconnect()
+                            continue
+
+                    if not subscriber.closed:
+                        subscriber._put(item)
+
+        except CancelledError:
+            raise
+
+        except Exception as error:
+            self.exception = error
+
+        finally:
+            self.done = True
+            for subscriber in self.subscribers:
+                subscriber._readable.set()
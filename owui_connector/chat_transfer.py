@@ -0,0 +1,224 @@
+"""
+This module houses the bulk export and import of chats as compressed JSONL files.
+
+Exports stream every chat of the panel into the file while only `concurrency` chats are
+in flight, and imports replay the file through `ApiRequests.create_chat` with rate control
+and a resumable checkpoint.
+"""
+
+from gzip import open as gzip_open
+from io import TextIOWrapper
+from json import dumps, loads
+from os import replace
+from typing import TYPE_CHECKING, Literal, TextIO
+
+from scarletio import get_or_create_event_loop, sleep
+
+from .concurrency import map_bounded
+from .scheduler import PRIORITY_BATCH
+
+if TYPE_CHECKING:
+    from .api_requests import ApiRequests
+
+Compression = Literal["gzip", "zstd"] | None
+
+
+def _detect_compression(path: str) -> Compression:
+    if path.endswith(".gz"):
+        return "gzip"
+
+    if path.endswith(".zst"):
+        return "zstd"
+
+    return None
+
+
+def open_jsonl(path: str, mode: Literal["r", "w"], compression: Compression) -> TextIO:
+    """
+    Opens a (compressed) JSONL file as text.
+
+    Args:
+        path (str): The file to open.
+        mode ("r" | "w"): Whether to read or to write.
+        compression ("gzip" | "zstd" | None): The compression of the file. `zstd` requires
+            the `zstandard` package.
+
+    Returns:
+        TextIO: The opened file.
+    """
+    if compression == "gzip":
+        return gzip_open(path, f"{mode}t", encoding="utf-8")
+
+    if compression == "zstd":
+        try:
+            from zstandard import ZstdCompressor, ZstdDecompressor
+        except ImportError as exception:
+            raise RuntimeError(
+                "zstd compression requires the `zstandard` package"
+            ) from exception
+
+        raw_file = open(path, f"{mode}b")
+        if mode == "w":
+            stream = ZstdCompressor().stream_writer(raw_file)
+        else:
+            stream = ZstdDecompressor().stream_reader(raw_file)
+
+        return TextIOWrapper(stream, encoding="utf-8")
+
+    return open(path, mode, encoding="utf-8")
+
+
+def _read_checkpoint(checkpoint_path: str | None) -> int:
+    if checkpoint_path is None:
+        return 0
+
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as file:
+            return int(loads(file.read())["line"])
+    except FileNotFoundError:
+        return 0
+
+
+def _write_checkpoint(checkpoint_path: str | None, line: int):
+    if checkpoint_path is None:
+        return
+
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(dumps({"line": line}))
+
+    replace(temporary_path, checkpoint_path)
+
+
+async def export_chats(
+    api: "ApiRequests",
+    path: str,
+    concurrency: int = 8,
+    compression: Compression = None,
+    updated_since: int | None = None,
+) -> int:
+    """
+    Exports every chat of the panel to a JSONL file, one full chat per line.
+
+    Args:
+        api (ApiRequests): The api to export from.
+        path (str): The file to write. The compression is detected from the suffix
+            (`.gz`, `.zst`) unless given.
+        concurrency (int): The maximal amount of chats fetched at once.
+        compression ("gzip" | "zstd" | None): The compression of the file.
+        updated_since (int | None): Only export chats updated since this timestamp.
+
+    Returns:
+        int: The amount of exported chats.
+    """
+    if compression is None:
+        compression = _detect_compression(path)
+
+    async def fetch_chat(week_chat) -> dict:
+        return await api.get_chat_by_id(week_chat.id)
+
+    exported = 0
+    chats = map_bounded(
+        fetch_chat, api.iter_chats(updated_since=updated_since), concurrency
+    )
+    try:
+        with open_jsonl(path, "w", compression) as file:
+            async for _, chat, exception in chats:
+                if exception is not None:
+                    raise exception
+
+                file.write(dumps(chat))
+                file.write("\n")
+                exported += 1
+    finally:
+        await chats.aclose()
+
+    return exported
+
+
+async def import_chats(
+    api: "ApiRequests",
+    path: str,
+    rate: float | None = None,
+    concurrency: int = 4,
+    checkpoint_path: str | None = None,
+    checkpoint_interval: int = 100,
+    compression: Compression = None,
+    priority: str = PRIORITY_BATCH,
+) -> int:
+    """
+    Replays a file written by `export_chats` through `ApiRequests.create_chat`.
+
+    The checkpoint stores the amount of leading lines that are fully imported, so an
+    interrupted import continues where it stopped. Chats that were in flight during a
+    failure may be imported twice when resuming (at most `concurrency` of them).
+
+    Args:
+        api (ApiRequests): The api to import into.
+        path (str): The file to read.
+        rate (float | None): The maximal amount of chats created per second.
+        concurrency (int): The maximal amount of chats created at once.
+        checkpoint_path (str | None): The file the progress is stored in.
+        checkpoint_interval (int): Write the checkpoint after this many imported chats.
+        compression ("gzip" | "zstd" | None): The compression of the file.
+        priority (str): The priority class of the chat creations, with a scheduler.
+
+    Returns:
+        int: The amount of chats imported by this call.
+    """
+    if compression is None:
+        compression = _detect_compression(path)
+
+    loop = get_or_create_event_loop()
+    start_line = _read_checkpoint(checkpoint_path)
+    next_start = loop.time()
+
+    async def replay(entry: tuple[int, str]):
+        nonlocal next_start
+
+        if rate:
+            now = loop.time()
+            start = max(now, next_start)
+            next_start = start + 1.0 / rate
+            if start > now:
+                await sleep(start - now, loop)
+
+        record = loads(entry[1])
+        await api.create_chat({"chat": record.get("chat", record)}, priority)
+
+    imported = 0
+    # lines that were handed out, but are not imported yet, and the line after the last one
+    in_flight: set[int] = set()
+    next_line = start_line
+
+    def iter_lines(file: TextIO):
+        nonlocal next_line
+
+        for line_number, line in enumerate(file):
+            if line_number < start_line or not line.strip():
+                continue
+
+            in_flight.add(line_number)
+            next_line = line_number + 1
+            yield line_number, line
+
+    def get_watermark() -> int:
+        return min(in_flight) if in_flight else next_line
+
+    with open_jsonl(path, "r", compression) as file:
+        results = map_bounded(replay, iter_lines(file), concurrency)
+        try:
+            async for (line_number, _), _, exception in results:
+                if exception is not None:
+                    raise exception
+
+                in_flight.discard(line_number)
+                imported += 1
+
+                if imported % checkpoint_interval == 0:
+                    _write_checkpoint(checkpoint_path, get_watermark())
+        finally:
+            await results.aclose()
+            _write_checkpoint(checkpoint_path, get_watermark())
+
+    return imported
@@ -0,0 +1,159 @@
+"""
+This module houses the request body compression of the OWUI Connector.
+
+Syncing a chat posts its whole history, which grows with every turn. Bodies above a size
+threshold are sent zstd compressed, on an executor thread once they are large, and their
+size on the wire is counted in `TransferStats`.
+
+gzip and deflate are not offered: scarletio compresses every body sent with one of those
+as `Content-Encoding` itself, on the event loop while writing it, so a body compressed
+here would be compressed a second time.
+
+The panel itself does not decode compressed request bodies, so this is only useful behind
+a proxy or middleware that does.
+"""
+
+from functools import partial
+from typing import Literal
+
+from scarletio import get_or_create_event_loop
+from scarletio.web_common.compressors import BROTLI_DECOMPRESSOR
+
+Encoding = Literal["zstd"]
+
+
+def get_accept_encoding() -> str:
+    # scarletio decodes brotli responses only if brotli is installed
+    if BROTLI_DECOMPRESSOR is None:
+        return "gzip, deflate"
+
+    return "gzip, deflate, br"
+
+
+class TransferStats:
+    """
+    The counters of the request bodies sent through `BodyCompression`.
+
+    Attributes:
+        requests (int): The amount of sent bodies.
+        compressed_requests (int): The bodies that were sent compressed.
+        raw_bytes (int): The size of every body before the compression.
+        wire_bytes (int): The size of every body on the wire.
+    """
+
+    requests: int
+    compressed_requests: int
+    raw_bytes: int
+    wire_bytes: int
+
+    def __init__(self):
+        self.requests = 0
+        self.compressed_requests = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"<TransferStats requests={self.requests} raw_bytes={self.raw_bytes} "
+            f"saved_bytes={self.saved_bytes}>"
+        )
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.raw_bytes - self.wire_bytes
+
+    @property
+    def ratio(self) -> float:
+        """
+        The size on the wire relative to the raw size.
+        """
+        if not self.raw_bytes:
+            return 1.0
+
+        return self.wire_bytes / self.raw_bytes
+
+    def record(self, raw_size: int, wire_size: int, compressed: bool):
+        self.requests += 1
+        self.raw_bytes += raw_size
+        self.wire_bytes += wire_size
+        if compressed:
+            self.compressed_requests += 1
+
+
+class BodyCompression:
+    """
+    Encodes the bodies of the large requests to the panel. Needs the `zstandard` package.
+
+    Attributes:
+        encoding (Encoding): The content encoding, "zstd".
+        threshold (int): Bodies smaller than this are sent as they are, in bytes.
+        offload_threshold (int): Bodies from this size on are compressed on an executor
+            thread instead of the event loop, in bytes.
+        level (int | None): The compression level, 3 if None.
+        stats (TransferStats): The counters of the sent bodies.
+    """
+
+    encoding: Encoding
+    threshold: int
+    offload_threshold: int
+    level: int | None
+    stats: TransferStats
+
+    def __init__(
+        self,
+        encoding: Encoding = "zstd",
+        threshold: int = 16384,
+        offload_threshold: int = 262144,
+        level: int | None = None,
+    ):
+        if encoding != "zstd":
+            raise ValueError(
+                f"Unsupported content encoding: {encoding}, only zstd is supported, "
+                "because scarletio compresses gzip and deflate bodies itself"
+            )
+
+        # fail early, instead of on the first large request
+        try:
+            import zstandard
+        except ImportError as exception:
+            raise RuntimeError(
+                "Body compression requires the `zstandard` package"
+            ) from exception
+
+        self.encoding = encoding
+        self.threshold = threshold
+        self.offload_threshold = offload_threshold
+        self.level = level
+        self.stats = TransferStats()
+        self._compressor = zstandard
+
+    def _compress(self, body: bytes) -> bytes:
+        # a compressor object is not thread safe, so every call makes its own
+        level = 3 if self.level is None else self.level
+        return self._compressor.ZstdCompressor(level=level).compress(body)
+
+    async def encode(
+        self, body: str | bytes, headers: dict[str, str]
+    ) -> tuple[bytes, dict[str, str]]:
+        """
+        Returns the body to send, with the headers it has to be sent with.
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        headers = {**headers, "Accept-Encoding": get_accept_encoding()}
+
+        if len(body) < self.threshold:
+            self.stats.record(len(body), len(body), False)
+            return body, headers
+
+        if len(body) >= self.offload_threshold:
+            encoded = await get_or_create_event_loop().run_in_executor(
+                partial(self._compress, body)
+            )
+        else:
+            encoded = self._compress(body)
+
+        headers["Content-Encoding"] = self.encoding
+        self.stats.record(len(body), len(encoded), True)
+        return encoded, headers
@@ -0,0 +1,73 @@
+"""
+This module houses small concurrency helpers shared by the bulk operations of the connector.
+"""
+
+from typing import Any, AsyncGenerator, AsyncIterable, Awaitable, Callable, Iterable
+
+from scarletio import AsyncQueue, get_or_create_event_loop
+
+
+async def _as_async_iterator(items: Iterable[Any]):
+    for item in items:
+        yield item
+
+
+async def map_bounded(
+    function: Callable[[Any], Awaitable[Any]],
+    items: Iterable[Any] | AsyncIterable[Any],
+    limit: int,
+) -> AsyncGenerator[tuple[Any, Any, BaseException | None], None]:
+    """
+    Calls `function` on every item with at most `limit` calls in flight, and yields
+    `(item, result, exception)` tuples in completion order.
+
+    Items are pulled lazily and finished results wait for the consumer, so memory stays
+    bounded by `limit` no matter how many items there are.
+    """
+    if limit < 1:
+        raise ValueError("The concurrency limit must be at least 1")
+
+    loop = get_or_create_event_loop()
+    if hasattr(items, "__aiter__"):
+        iterator = items.__aiter__()
+    else:
+        iterator = _as_async_iterator(items)
+
+    # at most `limit` tasks exist at a time, so the queue never holds more than that
+    finished = AsyncQueue(loop)
+    pending = set()
+
+    async def schedule_next() -> bool:
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            return False
+
+        task = loop.create_task(function(item))
+        pending.add(task)
+        task.add_done_callback(lambda done_task: finished.set_result((item, done_task)))
+        return True
+
+    try:
+        while len(pending) < limit and await schedule_next():
+            pass
+
+        while pending:
+            item, task = await finished
+            pending.discard(task)
+
+            exception = task.get_exception()
+            if exception is None:
+                yield item, task.get_result(), None
+            else:
+                yield item, None, exception
+
+            await schedule_next()
+
+    finally:
+        for task in pending:
+            task.cancel()
+
+        close = getattr(iterator, "aclose", None)
+        if close is not None:
+            await close()
@@ -3,14 +3,31 @@ Connector to OpenWebUi
 """
 
 from datetime import datetime
-from typing import Any, AsyncGenerator, Literal
+from typing import TYPE_CHECKING, Any, Callable, Literal
 from uuid import uuid4
 
 from scarletio import get_or_create_event_loop
 from scarletio.http_client.client_response import ClientResponse
 
 from .api_requests import ApiRequests
+from .chat_transfer import Compression, export_chats, import_chats
+from .compression import BodyCompression, Encoding
+from .deadline import PHASE_LOOKUP, Deadline, run_phase
+from .ingestion import (
+    IngestionIndex,
+    IngestionProgress,
+    IngestionResult,
+    KnowledgeIngestion,
+)
+from .model_catalog import ModelCatalog, ModelInfo
+from .replica import ChatReplica
+from .router import ModelReservation, ModelRouter
+from .scheduler import PRIORITY_INTERACTIVE, RequestScheduler
+from .search_index import ChatSearchIndex, SearchResult
+from .session_cache import SessionCache
+from .streaming import ComparisonStream, StopConditions, StreamHandle
 from .models import (
+    BulkDeleteResult,
     Chat,
     ChatReference,
     MessageRoles,
@@ -18,8 +35,16 @@ from .models import (
     OllamaRequest,
     UserChatMessage,
     ModelChatResponseInfo,
+    UploadedFile,
+    WeekChatReference,
 )
 
+if TYPE_CHECKING:
+    import numpy as np
+
+    from .embeddings import EmbeddingCache
+    from .usage import UsageLedger
+
 
 class OpenWebUiConnector:
     api: ApiRequests
@@ -32,6 +57,258 @@ class OpenWebUiConnector:
     def connect(self):
         get_or_create_event_loop().run(self.api.connect())
 
+    def enable_session_cache(
+        self,
+        path: str,
+        user_ttl: float = 3600.0,
+        session_ttl: float = 15.0,
+        resume_session: bool = False,
+    ) -> SessionCache:
+        """
+        Caches the handshake results on the disk, so the next `connect` can skip the
+        round trips that are still valid. Has to be called before `connect`.
+        """
+        self.api.session_cache = SessionCache(
+            path, user_ttl, session_ttl, resume_session
+        )
+        return self.api.session_cache
+
+    def subscribe(self, event: str, callback: Callable[[Any], Any]):
+        """
+        Calls `callback` with the data of every `event` the panel pushes over the websocket,
+        for example "chat-events" or "usage".
+        """
+        self.api.socket.subscribe(event, callback)
+
+    def disconnect(self):
+        get_or_create_event_loop().run(self.api.close())
+
+    def enable_semantic_cache(
+        self,
+        embedding_model: str,
+        threshold: float = 0.92,
+        capacity: int = 1024,
+        path: str | None = None,
+    ):
+        """
+        Puts a semantic response cache in front of every Ollama request. Prompts are embedded
+        with the given embedding model through the panel, so near-duplicate prompts are
+        answered from the cache instead of the model. Only conversations of a single
+        prompt are cached, a follow-up is always answered by the model.
+
+        Requires the `numpy` extra.
+        """
+        from .semantic_cache import SemanticCache
+
+        async def embed(prompt: str) -> "np.ndarray":
+            # goes through the embedding cache, if it is enabled
+            return (await self.api.embed(embedding_model, [prompt]))[0]
+
+        self.api.semantic_cache = SemanticCache(embed, threshold, capacity, path)
+        return self.api.semantic_cache
+
+    def save_semantic_cache(self, path: str | None = None):
+        if self.api.semantic_cache is None:
+            raise ValueError("The semantic cache is not enabled")
+
+        self.api.semantic_cache.save(path)
+
+    def enable_embedding_cache(self, path: str = ":memory:") -> "EmbeddingCache":
+        """
+        Stores every computed embedding, so `embed` only requests the texts it did not
+        see before.
+
+        Requires the `numpy` extra.
+        """
+        from .embeddings import EmbeddingCache
+
+        self.api.embedding_cache = EmbeddingCache(path)
+        return self.api.embedding_cache
+
+    async def embed(
+        self,
+        model: str,
+        texts: list[str],
+        batch_size: int = 256,
+        concurrency: int = 4,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> "np.ndarray":
+        """
+        Embeds the texts, returning a float32 matrix with one row per text.
+
+        Requires the `numpy` extra.
+        """
+        return await self.api.embed(
+            model, texts, batch_size, concurrency, priority, tenant
+        )
+
+    def enable_usage_ledger(self, capacity: int = 1024) -> "UsageLedger":
+        """
+        Records the token usage of every completion, for rolling-window statistics and
+        exports.
+
+        Requires the `numpy` extra.
+        """
+        from .usage import UsageLedger
+
+        self.api.usage_ledger = UsageLedger(capacity)
+        return self.api.usage_ledger
+
+    def enable_direct_ollama(self, ollama_url: str):
+        """
+        Generates on the given Ollama server directly, instead of through the panel. The
+        chats are still created on the panel, and every finished turn is mirrored to it in
+        the background, `disconnect` waits for the pending ones.
+        """
+        self.api.ollama_url = ollama_url.rstrip("/")
+
+    def disable_direct_ollama(self):
+        self.api.ollama_url = None
+
+    def enable_body_compression(
+        self,
+        encoding: Encoding = "zstd",
+        threshold: int = 16384,
+        offload_threshold: int = 262144,
+        level: int | None = None,
+    ) -> BodyCompression:
+        """
+        Compresses the chat syncs sent to the panel with zstd once their body reaches
+        `threshold` bytes, this needs the `zstd` extra. The panel does not decode compressed
+        bodies itself, so this needs a proxy or middleware in front of it that does. The
+        savings are counted in `BodyCompression.stats`.
+        """
+        self.api.body_compression = BodyCompression(
+            encoding, threshold, offload_threshold, level
+        )
+        return self.api.body_compression
+
+    def disable_body_compression(self):
+        self.api.body_compression = None
+
+    def enable_scheduler(
+        self,
+        panel_slots: int = 8,
+        ollama_slots: int = 2,
+        weights: dict[str, float] | None = None,
+    ) -> RequestScheduler:
+        """
+        Limits the requests in flight to the panel and to Ollama. Waiting requests are
+        served by priority class first, so interactive chats go before queued batch work,
+        and by the fair share of their tenant within a class. `weights` sets the share of
+        the tenants, 1.0 by default.
+        """
+        self.api.scheduler = RequestScheduler(panel_slots, ollama_slots, weights)
+        return self.api.scheduler
+
+    def enable_model_router(
+        self,
+        smoothing: float = 0.2,
+        keep_alive: float = 300.0,
+        default_load_duration: float = 5.0,
+    ) -> ModelRouter:
+        """
+        Lets chats use model aliases, routed to one of several models by the statistics of
+        their completions. Add the aliases with `ModelRouter.add_route`.
+        """
+        self.api.model_router = ModelRouter(
+            smoothing, keep_alive, default_load_duration
+        )
+        return self.api.model_router
+
+    def _resolve_model(self, model: str, content: str) -> ModelReservation:
+        if self.api.model_router is None:
+            return ModelReservation(None, model)
+
+        # roughly four characters make a token
+        return self.api.model_router.resolve(model, len(content) // 4)
+
+    def enable_model_catalog(
+        self, ttl: float = 300.0, refresh_interval: float | None = None
+    ) -> ModelCatalog:
+        """
+        Caches the models of the panel, and validates the model of every chat request
+        against them before anything is sent. If `refresh_interval` is given, the catalog
+        is refreshed in the background.
+        """
+        self.api.model_catalog = ModelCatalog(self.api, ttl)
+        if refresh_interval is not None:
+            self.api.model_catalog.start(refresh_interval)
+
+        return self.api.model_catalog
+
+    async def get_models(self) -> dict[str, ModelInfo]:
+        if self.api.model_catalog is None:
+            self.enable_model_catalog()
+
+        return await self.api.model_catalog.get_models()
+
+    def enable_replica(self, path: str = ":memory:", watch: bool = True) -> ChatReplica:
+        """
+        Keeps a local copy of every chat and serves chat lookups from it. Writes done
+        through the connector are applied immediately, changes done elsewhere are pulled
+        by `sync_replica`, or pushed by the panel if `watch` is set.
+        """
+        self.api.replica = ChatReplica(path)
+        if watch:
+            self.api.replica.watch(self.api)
+
+        return self.api.replica
+
+    async def sync_replica(self, concurrency: int = 8, prune: bool = False) -> int:
+        if self.api.replica is None:
+            raise ValueError("The replica is not enabled")
+
+        return await self.api.replica.sync(self.api, concurrency, prune)
+
+    def enable_search_index(self, path: str = ":memory:") -> ChatSearchIndex:
+        """
+        Attaches a local full-text index, that is updated whenever a chat completion is
+        synced to the panel. Use `build_search_index` to fill it with the existing chats.
+        """
+        self.api.search_index = ChatSearchIndex(path)
+        return self.api.search_index
+
+    async def build_search_index(self, concurrency: int = 8) -> int:
+        if self.api.search_index is None:
+            self.enable_search_index()
+
+        return await self.api.search_index.build(self.api, concurrency)
+
+    def enable_ingestion_index(self, path: str = ":memory:") -> IngestionIndex:
+        """
+        Records the files uploaded by `ingest_files` by their content hash. Keep it on the
+        disk, so ingesting the same documents again later does not upload them again.
+        """
+        self.api.ingestion_index = IngestionIndex(path)
+        return self.api.ingestion_index
+
+    async def ingest_files(
+        self,
+        knowledge_id: str,
+        paths: list[str],
+        concurrency: int = 4,
+        retries: int = 3,
+        on_progress: Callable[[IngestionProgress], None] | None = None,
+    ) -> IngestionResult:
+        """
+        Adds files to a knowledge base, skipping the content that was already uploaded.
+        """
+        if self.api.ingestion_index is None:
+            self.enable_ingestion_index()
+
+        ingestion = KnowledgeIngestion(
+            self.api, self.api.ingestion_index, concurrency, retries
+        )
+        return await ingestion.ingest(knowledge_id, paths, on_progress)
+
+    def search(self, query: str, limit: int = 20) -> list[SearchResult]:
+        if self.api.search_index is None:
+            raise ValueError("The search index is not enabled")
+
+        return self.api.search_index.search(query, limit)
+
     async def delete_chat(self, chat_title: str = "", chat_id: str = ""):
         if not chat_title and not chat_id:
             return "No chat id or title provided"
@@ -49,19 +326,167 @@ class OpenWebUiConnector:
         if chat_title:
             return await self.api.delete_chat_by_title(chat_title)
 
+    async def delete_chats(
+        self,
+        predicate: Callable[[WeekChatReference], bool] | None = None,
+        chat_ids: list[str] | None = None,
+        chat_titles: list[str] | None = None,
+        concurrency: int = 8,
+    ) -> BulkDeleteResult:
+        """
+        Deletes every chat matching the predicate, the given ids or the given titles.
+
+        The chats are resolved against a single listing of the panel, and then deleted
+        with at most `concurrency` requests in flight. Every chat sharing a given title
+        is deleted. Titles that match no chat are reported as failed.
+        """
+        chat_ids = list(chat_ids or [])
+
+        if predicate is not None or chat_titles:
+            wanted_titles = set(chat_titles or [])
+            found_titles = set()
+            wanted_ids = set(chat_ids)
+
+            async for week_chat in self.api.iter_chats():
+                if week_chat.id in wanted_ids:
+                    continue
+
+                if week_chat.title in wanted_titles:
+                    found_titles.add(week_chat.title)
+                elif predicate is None or not predicate(week_chat):
+                    continue
+
+                wanted_ids.add(week_chat.id)
+                chat_ids.append(week_chat.id)
+
+            missing_titles = wanted_titles - found_titles
+        else:
+            missing_titles = set()
+
+        result = await self.api.delete_chats_by_id(chat_ids, concurrency)
+        for chat_title in missing_titles:
+            result.failed[chat_title] = ValueError("Chat not found")
+
+        return result
+
+    async def export_chats(
+        self,
+        path: str,
+        concurrency: int = 8,
+        compression: Compression = None,
+        updated_since: int | None = None,
+    ) -> int:
+        return await export_chats(
+            self.api, path, concurrency, compression, updated_since
+        )
+
+    async def import_chats(
+        self,
+        path: str,
+        rate: float | None = None,
+        concurrency: int = 4,
+        checkpoint_path: str | None = None,
+        compression: Compression = None,
+    ) -> int:
+        return await import_chats(
+            self.api,
+            path,
+            rate=rate,
+            concurrency=concurrency,
+            checkpoint_path=checkpoint_path,
+            compression=compression,
+        )
+
     async def chat(
         self,
         chat_title: str,
         model: str,
         content: str,
         stream: bool = True,
+        stop_conditions: StopConditions | None = None,
+        files: list[str | UploadedFile] | None = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
     ):
-        chat = await self.api.get_chat_by_title(chat_title)
-        if not chat:
-            # we want to create a chat
-            return await self.create_chat(chat_title, model, content, stream)
+        """
+        Sends a message to a chat, creating the chat if needed. Streamed responses are
+        returned as a `StreamHandle`, that can cancel the generation. `files` are attached
+        to the message, paths are uploaded first. `model` can be an alias of the model
+        router. With a scheduler, pass `priority="batch"` for bulk jobs, so they do not
+        hold up the interactive chats.
+
+        A `deadline` bounds the whole call, split into budgets for the lookup, the
+        generation and the sync. A phase out of time raises a `TimeoutError`, and the
+        phases after it are not started.
+        """
+        # the model is counted in flight from here on, so concurrent calls spread out
+        reservation = self._resolve_model(model, content)
+        model = reservation.model
+        try:
+            chat = await run_phase(
+                deadline, PHASE_LOOKUP, self.api.get_chat_by_title(chat_title)
+            )
+            if not chat:
+                # we want to create a chat
+                return await self.create_chat(
+                    chat_title,
+                    model,
+                    content,
+                    stream,
+                    stop_conditions,
+                    files,
+                    priority,
+                    tenant,
+                    deadline,
+                    reservation,
+                )
 
-        return await self.respond_to_chat(chat_title, content, model, stream)
+            return await self.respond_to_chat(
+                chat_title,
+                content,
+                model,
+                stream,
+                stop_conditions,
+                files,
+                priority,
+                tenant,
+                deadline,
+                reservation,
+            )
+        except BaseException:
+            # the request never reached the model
+            reservation.cancel()
+            raise
+
+    async def upload_files(
+        self, paths: list[str], concurrency: int = 4
+    ) -> list[UploadedFile]:
+        """
+        Uploads files to the panel, streaming them from the disk with at most
+        `concurrency` uploads at a time.
+        """
+        return await self.api.upload_files(paths, concurrency)
+
+    async def _resolve_files(
+        self,
+        files: list[str | UploadedFile] | None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+    ) -> list[UploadedFile]:
+        if not files:
+            return []
+
+        paths = [file for file in files if isinstance(file, str)]
+        uploaded_files = iter(
+            await self.api.upload_files(paths, priority=priority, tenant=tenant)
+            if paths
+            else []
+        )
+
+        return [
+            next(uploaded_files) if isinstance(file, str) else file for file in files
+        ]
 
     async def create_chat(
         self,
@@ -69,102 +494,141 @@ class OpenWebUiConnector:
         model: str,
         content: str,
         stream: bool = True,
-    ) -> AsyncGenerator[Any, Any] | dict[Any, Any]:
-        user_msg_id = str(uuid4())
-        model_msg_id = str(uuid4())
-        current_timestamp: int = int(datetime.now().timestamp())
-        chat_reference = ChatReference(
-            chat_id="",
-            title=str(chat_title),
-            models=[model],
-            params={},
-            messages=[
-                UserChatMessage(
-                    message_id=user_msg_id,
-                    parent_id=None,
-                    children_ids=[model_msg_id],
-                    role=MessageRoles.USER.value,
-                    content=content,
-                    timestamp=current_timestamp,
-                    models=[model],
-                ),
-                ModelChatResponse(
-                    parent_id=user_msg_id,
-                    message_id=model_msg_id,
-                    children_ids=[],
-                    role=MessageRoles.ASSISTENT.value,
-                    content="",
-                    model=model,
-                    model_name=model,
-                    user_context=None,
-                    timestamp=current_timestamp,
-                    last_sentence="",
-                    done=False,
-                    context=None,
-                    info=None,
-                ),
-            ],
-            history=None,
-            tags=[],
-            timestamp=current_timestamp,
-        )
-
-        chat = Chat(
-            chat=chat_reference,
-        )
-
-        chat_request: ClientResponse = await self.api.create_chat(chat)
-        chat_request_json: dict | None = await chat_request.json()
-
-        if not chat_request_json or not chat_request_json["id"]:
-            raise RuntimeError("Could not create chat!")
-
-        chat_reference.id = chat_request_json["id"]
-
-        # build the ollama request body
-        ollama_request = OllamaRequest(
-            stream=stream,
-            model=model,
-            messages=[
-                {
-                    "role": MessageRoles.USER.value,
-                    "content": content,
-                },
-            ],
-            options={},
-            chat_id=chat_reference.id,
-            request_id=str(uuid4()),
-        )
+        stop_conditions: StopConditions | None = None,
+        files: list[str | UploadedFile] | None = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+        reservation: ModelReservation | None = None,
+    ) -> StreamHandle | dict[Any, Any]:
+        if reservation is None:
+            reservation = self._resolve_model(model, content)
+
+        model = reservation.model
+        try:
+            # lets make sure the model exists before we persist a chat for it
+            if self.api.model_catalog is not None:
+                await run_phase(
+                    deadline, PHASE_LOOKUP, self.api.model_catalog.validate(model)
+                )
 
-        # lets do the request
-        response = await self.api.send_ollama_request(
-            ollama_request, chat_reference, stream=stream
-        )
+            uploaded_files = await run_phase(
+                deadline, PHASE_LOOKUP, self._resolve_files(files, priority, tenant)
+            )
+
+            user_msg_id = str(uuid4())
+            model_msg_id = str(uuid4())
+            current_timestamp: int = int(datetime.now().timestamp())
+            chat_reference = ChatReference(
+                chat_id="",
+                title=str(chat_title),
+                models=[model],
+                params={},
+                messages=[
+                    UserChatMessage(
+                        message_id=user_msg_id,
+                        parent_id=None,
+                        children_ids=[model_msg_id],
+                        role=MessageRoles.USER.value,
+                        content=content,
+                        timestamp=current_timestamp,
+                        models=[model],
+                        files=uploaded_files,
+                    ),
+                    ModelChatResponse(
+                        parent_id=user_msg_id,
+                        message_id=model_msg_id,
+                        children_ids=[],
+                        role=MessageRoles.ASSISTENT.value,
+                        content="",
+                        model=model,
+                        model_name=model,
+                        user_context=None,
+                        timestamp=current_timestamp,
+                        last_sentence="",
+                        done=False,
+                        context=None,
+                        info=None,
+                    ),
+                ],
+                history=None,
+                tags=[],
+                timestamp=current_timestamp,
+            )
+
+            chat = Chat(
+                chat=chat_reference,
+            )
+
+            chat_request: ClientResponse = await run_phase(
+                deadline, PHASE_LOOKUP, self.api.create_chat(chat, priority, tenant)
+            )
+            chat_request_json: dict | None = await run_phase(
+                deadline, PHASE_LOOKUP, chat_request.json()
+            )
+
+            if not chat_request_json or not chat_request_json["id"]:
+                raise RuntimeError("Could not create chat!")
+
+            chat_reference.id = chat_request_json["id"]
+
+            # build the ollama request body
+            ollama_request = OllamaRequest(
+                stream=stream,
+                model=model,
+                messages=[
+                    {
+                        "role": MessageRoles.USER.value,
+                        "content": content,
+                    },
+                ],
+                options={},
+                chat_id=chat_reference.id,
+                request_id=str(uuid4()),
+            )
+
+            # lets do the request
+            response = await self.api.send_ollama_request(
+                ollama_request,
+                chat_reference,
+                stream=stream,
+                stop_conditions=stop_conditions,
+                priority=priority,
+                tenant=tenant,
+                deadline=deadline,
+                reservation=reservation,
+            )
+
+            if stream:
+                return response
 
-        if stream:
             return response
-
-        return response
-
-    async def respond_to_chat(
-        self,
-        chat_title: str,
-        content: str,
-        model: str,
-        stream: bool = True,
-    ):
-        chat = await self.api.get_chat_by_title(chat_title)
-        if not chat:
-            raise ValueError("Chat not found")
-
-        user_msg_id = str(uuid4())
-        model_msg_id = str(uuid4())
-        current_timestamp: int = int(datetime.now().timestamp())
+        except BaseException:
+            # the request never reached the model
+            reservation.cancel()
+            raise
+
+    def _messages_from_chat(
+        self, chat: dict, model: str
+    ) -> list[ModelChatResponse | UserChatMessage]:
+        """
+        Converts the messages of a chat record of the panel to message objects.
+
+        The messages list of the record only holds the branches the connector wrote, so
+        the messages only found in the history, like regenerations done in the panel, are
+        added as well. History entries lack the details of a response, so they are
+        defaulted.
+        """
+        records = list(chat["chat"]["messages"])
+        known_ids = {record["id"] for record in records}
+        history = chat["chat"].get("history") or {}
+        for message_id, record in (history.get("messages") or {}).items():
+            if message_id not in known_ids:
+                records.append(record)
 
         messages: list[ModelChatResponse | UserChatMessage] = []
 
-        for message in chat["chat"]["messages"]:
-            print(message)
+        for message in records:
             if message["role"] == MessageRoles.USER.value:
                 messages.append(
                     UserChatMessage(
@@ -175,12 +639,16 @@ class OpenWebUiConnector:
                         content=message["content"],
                         timestamp=message["timestamp"],
                         models=[model],
+                        files=[
+                            UploadedFile.from_dict(file)
+                            for file in message.get("files") or []
+                            if file.get("id")
+                        ],
                     )
                 )
-            elif message["role"] == MessageRoles.ASSISTENT.value:
-                print("-------------------")
-                print(message)
-                print("-------------------")
+            # the panel itself spells the role of its responses correctly
+            elif message["role"] in (MessageRoles.ASSISTENT.value, "assistant"):
+                info = message.get("info") or {}
                 messages.append(
                     ModelChatResponse(
                         parent_id=message["parentId"],
@@ -189,47 +657,110 @@ class OpenWebUiConnector:
                         role=message["role"],
                         content=message["content"],
                         model=message["model"],
-                        model_name=message["modelName"],
-                        user_context=message["userContext"],
+                        model_name=message.get("modelName", message["model"]),
+                        user_context=message.get("userContext"),
                         timestamp=message["timestamp"],
-                        last_sentence=(
-                            message["lastSentance"] if "lastSentance" in message else ""
+                        # older versions stored the field misspelled
+                        last_sentence=message.get(
+                            "lastSentence", message.get("lastSentance", "")
                         ),
-                        done=message["done"],
-                        context=message["context"],
+                        done=message.get("done", True),
+                        context=message.get("context"),
                         info=ModelChatResponseInfo(
-                            total_duration=message["info"].get("total_duration", 0),
-                            load_duration=message["info"].get("load_duration", 0),
-                            prompt_eval_count=message["info"].get(
-                                "prompt_eval_count", 0
-                            ),
-                            prompt_eval_duration=message["info"].get(
-                                "prompt_eval_duration", 0
-                            ),
-                            eval_count=message["info"].get("eval_count", 0),
-                            eval_duration=message["info"].get("eval_duration", 0),
+                            total_duration=info.get("total_duration", 0),
+                            load_duration=info.get("load_duration", 0),
+                            prompt_eval_count=info.get("prompt_eval_count", 0),
+                            prompt_eval_duration=info.get("prompt_eval_duration", 0),
+                            eval_count=info.get("eval_count", 0),
+                            eval_duration=info.get("eval_duration", 0),
                         ),
+                        cancelled=message.get("cancelled", False),
                     )
                 )
 
         messages.sort(key=lambda msg: msg.timestamp)
 
-        chat_reference = ChatReference(
+        return messages
+
+    def _chat_reference_from_chat(
+        self, chat: dict, chat_title: str, models: list[str], timestamp: int
+    ) -> ChatReference:
+        """
+        Loads a chat record of the panel, continuing the branch the panel shows.
+        """
+        history = chat["chat"].get("history") or {}
+        return ChatReference(
             chat_id=chat["id"],
             title=str(chat_title),
-            models=[model],
+            models=list(models),
             params={},
-            messages=[
-                *messages,
+            messages=self._messages_from_chat(chat, models[0]),
+            history=None,
+            tags=[],
+            timestamp=timestamp,
+            current_id=history.get("currentId"),
+        )
+
+    async def respond_to_chat(
+        self,
+        chat_title: str,
+        content: str,
+        model: str,
+        stream: bool = True,
+        stop_conditions: StopConditions | None = None,
+        files: list[str | UploadedFile] | None = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+        reservation: ModelReservation | None = None,
+    ):
+        if reservation is None:
+            reservation = self._resolve_model(model, content)
+
+        model = reservation.model
+        try:
+            if self.api.model_catalog is not None:
+                await run_phase(
+                    deadline, PHASE_LOOKUP, self.api.model_catalog.validate(model)
+                )
+
+            chat = await run_phase(
+                deadline, PHASE_LOOKUP, self.api.get_chat_by_title(chat_title)
+            )
+            if not chat:
+                raise ValueError("Chat not found")
+
+            uploaded_files = await run_phase(
+                deadline, PHASE_LOOKUP, self._resolve_files(files, priority, tenant)
+            )
+
+            user_msg_id = str(uuid4())
+            model_msg_id = str(uuid4())
+            current_timestamp: int = int(datetime.now().timestamp())
+
+            chat_reference = self._chat_reference_from_chat(
+                chat, chat_title, [model], current_timestamp
+            )
+            chat_reference.add_message(
                 UserChatMessage(
                     message_id=user_msg_id,
-                    parent_id=messages[-1].id,
+                    parent_id=chat_reference.tree.current_id,
                     children_ids=[model_msg_id],
                     role=MessageRoles.USER.value,
                     content=content,
                     timestamp=current_timestamp,
                     models=[model],
-                ),
+                    files=uploaded_files,
+                )
+            )
+
+            # the prompt is the branch leading to the new message, not every message
+            ollama_messages = [
+                {"role": message.role, "content": message.content}
+                for message in chat_reference.tree.active_path
+            ]
+
+            chat_reference.add_message(
                 ModelChatResponse(
                     parent_id=user_msg_id,
                     message_id=model_msg_id,
@@ -244,52 +775,177 @@ class OpenWebUiConnector:
                     done=False,
                     context=None,
                     info=None,
-                ),
-            ],
-            history=None,
-            tags=[],
-            timestamp=current_timestamp,
-        )
+                )
+            )
+
+            ollama_request = OllamaRequest(
+                stream=stream,
+                model=model,
+                messages=ollama_messages,
+                options={},
+                chat_id=chat_reference.id,
+                request_id=str(uuid4()),
+            )
+
+            # lets do the request
+            response = await self.api.send_ollama_request(
+                ollama_request,
+                chat_reference,
+                stream=stream,
+                stop_conditions=stop_conditions,
+                priority=priority,
+                tenant=tenant,
+                deadline=deadline,
+                reservation=reservation,
+            )
+
+            if stream:
+                return response
 
-        # lets do the ollama request
-        ollama_messages = []
-        for message in chat_reference.messages:
-            if isinstance(message, UserChatMessage):
-                ollama_messages.append(
-                    {
-                        "role": message.role,
-                        "content": message.content,
-                    }
+            return response
+        except BaseException:
+            # the request never reached the model
+            reservation.cancel()
+            raise
+
+    async def compare(
+        self,
+        chat_title: str,
+        models: list[str],
+        content: str,
+        stop_conditions: StopConditions | None = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+    ) -> ComparisonStream:
+        """
+        Sends one message to several models at once, creating the chat if needed.
+
+        The replies are streamed in parallel and recorded as sibling responses of the
+        message, iterate the returned stream for `(model, chunk)` tuples. Router aliases
+        are resolved for every model, and the `deadline` applies to every reply.
+        """
+        if not models or len(set(models)) != len(models):
+            raise ValueError("Provide at least one model, and every model only once")
+
+        reservations = [self._resolve_model(model, content) for model in models]
+        try:
+            models = [reservation.model for reservation in reservations]
+            if len(set(models)) != len(models):
+                raise ValueError("The models resolve to the same model more than once")
+
+            if self.api.model_catalog is not None:
+                for model in models:
+                    await run_phase(
+                        deadline, PHASE_LOOKUP, self.api.model_catalog.validate(model)
+                    )
+
+            chat = await run_phase(
+                deadline, PHASE_LOOKUP, self.api.get_chat_by_title(chat_title)
+            )
+
+            user_msg_id = str(uuid4())
+            model_msg_ids = [str(uuid4()) for _ in models]
+            current_timestamp: int = int(datetime.now().timestamp())
+
+            if chat:
+                chat_reference = self._chat_reference_from_chat(
+                    chat, chat_title, models, current_timestamp
+                )
+            else:
+                chat_reference = ChatReference(
+                    chat_id="",
+                    title=str(chat_title),
+                    models=list(models),
+                    params={},
+                    messages=[],
+                    history=None,
+                    tags=[],
+                    timestamp=current_timestamp,
                 )
 
-            if isinstance(message, ModelChatResponse):
-                ollama_messages.append(
-                    {
-                        "role": message.role,
-                        "content": message.content,
-                    }
+            chat_reference.add_message(
+                UserChatMessage(
+                    message_id=user_msg_id,
+                    parent_id=chat_reference.tree.current_id,
+                    children_ids=model_msg_ids,
+                    role=MessageRoles.USER.value,
+                    content=content,
+                    timestamp=current_timestamp,
+                    models=list(models),
                 )
-        ollama_request = OllamaRequest(
-            stream=stream,
-            model=model,
-            messages=[
-                *ollama_messages,
-                {
-                    "role": MessageRoles.USER.value,
-                    "content": content,
-                },
-            ],
-            options={},
-            chat_id=chat_reference.id,
-            request_id=str(uuid4()),
-        )
+            )
 
-        # lets do the request
-        response = await self.api.send_ollama_request(
-            ollama_request, chat_reference, stream=stream
-        )
+            ollama_messages = [
+                {"role": message.role, "content": message.content}
+                for message in chat_reference.tree.active_path
+            ]
 
-        if stream:
-            return response
+            replies = [
+                ModelChatResponse(
+                    parent_id=user_msg_id,
+                    message_id=model_msg_id,
+                    children_ids=[],
+                    role=MessageRoles.ASSISTENT.value,
+                    content="",
+                    model=model,
+                    model_name=model,
+                    user_context=None,
+                    timestamp=current_timestamp,
+                    last_sentence="",
+                    done=False,
+                    context=None,
+                    info=None,
+                )
+                for model, model_msg_id in zip(models, model_msg_ids, strict=True)
+            ]
+
+            # the reply of the first model continues the active branch
+            for reply in reversed(replies):
+                chat_reference.add_message(reply)
+
+            if not chat:
+                chat_request: ClientResponse = await run_phase(
+                    deadline,
+                    PHASE_LOOKUP,
+                    self.api.create_chat(Chat(chat=chat_reference), priority, tenant),
+                )
+                chat_request_json: dict | None = await run_phase(
+                    deadline, PHASE_LOOKUP, chat_request.json()
+                )
+
+                if not chat_request_json or not chat_request_json["id"]:
+                    raise RuntimeError("Could not create chat!")
+
+                chat_reference.id = chat_request_json["id"]
 
-        return response
+            # every model answers the same request
+            request_id = str(uuid4())
+            ollama_requests = [
+                OllamaRequest(
+                    stream=True,
+                    model=model,
+                    messages=ollama_messages,
+                    options={},
+                    chat_id=chat_reference.id,
+                    request_id=request_id,
+                )
+                for model in models
+            ]
+
+            return self.api.send_comparison_requests(
+                ollama_requests,
+                chat_reference,
+                replies,
+                stop_conditions,
+                priority,
+                tenant,
+                deadline,
+                reservations,
+            )
+        except BaseException:
+            # the requests never reached the models
+            for reservation in reservations:
+                reservation.cancel()
+
+            raise
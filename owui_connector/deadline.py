@@ -0,0 +1,183 @@
+"""
+This module houses the deadlines of the chat calls of the OWUI Connector.
+
+A chat call runs in three phases: the lookup, which finds or creates the chat and uploads
+its files, the generation by Ollama, and the sync of the reply to the panel. A `Deadline`
+splits the time of the whole call into a budget for every phase. The lookup may use at most
+its share of the total, and the sync keeps its share reserved at the end, so the generation
+gets whatever the lookup left over. A phase running out of time raises a `TimeoutError`,
+and the phases after it are never started.
+
+Streams additionally have their own timeouts: until the response headers arrive, until the
+first chunk arrives, and between two chunks.
+"""
+
+from inspect import iscoroutine
+from time import monotonic
+from typing import Any, Awaitable
+
+from scarletio import get_or_create_event_loop
+
+PHASE_LOOKUP = "lookup"
+PHASE_GENERATION = "generation"
+PHASE_SYNC = "sync"
+
+
+class Deadline:
+    """
+    The time budget of one chat call, split into its phases.
+
+    Attributes:
+        started_at (float): When the call started, on the monotonic clock.
+        expires_at (float): When the whole call has to be finished, on the monotonic clock.
+        lookup_share (float): The share of the total the lookup may use at most.
+        sync_share (float): The share of the total reserved for the sync at the end.
+        connect_timeout (float | None): How long a generation may wait for the response
+            headers, in seconds.
+        first_byte_timeout (float | None): How long a stream may wait for its first chunk
+            after the headers, in seconds.
+        idle_timeout (float | None): How long a stream may wait between two chunks, in
+            seconds.
+    """
+
+    started_at: float
+    expires_at: float
+    lookup_share: float
+    sync_share: float
+    connect_timeout: float | None
+    first_byte_timeout: float | None
+    idle_timeout: float | None
+
+    def __init__(
+        self,
+        expires_at: float,
+        lookup_share: float = 0.2,
+        sync_share: float = 0.2,
+        connect_timeout: float | None = None,
+        first_byte_timeout: float | None = None,
+        idle_timeout: float | None = None,
+    ):
+        if lookup_share < 0.0 or sync_share < 0.0 or lookup_share + sync_share >= 1.0:
+            raise ValueError(
+                "The lookup and sync shares must be positive, and leave time for the generation"
+            )
+
+        self.started_at = monotonic()
+        self.expires_at = expires_at
+        self.lookup_share = lookup_share
+        self.sync_share = sync_share
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.idle_timeout = idle_timeout
+
+    def __repr__(self) -> str:
+        return f"<Deadline remaining={self.remaining():.3f}>"
+
+    @classmethod
+    def after(
+        cls,
+        timeout: float,
+        lookup_share: float = 0.2,
+        sync_share: float = 0.2,
+        connect_timeout: float | None = None,
+        first_byte_timeout: float | None = None,
+        idle_timeout: float | None = None,
+    ) -> "Deadline":
+        return cls(
+            monotonic() + timeout,
+            lookup_share,
+            sync_share,
+            connect_timeout,
+            first_byte_timeout,
+            idle_timeout,
+        )
+
+    @property
+    def total(self) -> float:
+        return self.expires_at - self.started_at
+
+    def get_phase_end(self, phase: str) -> float:
+        """
+        When the phase has to be finished, on the monotonic clock.
+        """
+        if phase == PHASE_LOOKUP:
+            return self.started_at + self.total * self.lookup_share
+
+        if phase == PHASE_GENERATION:
+            return self.expires_at - self.total * self.sync_share
+
+        if phase == PHASE_SYNC:
+            return self.expires_at
+
+        raise ValueError(f"Unknown phase: {phase}")
+
+    def remaining(self, phase: str = PHASE_SYNC) -> float:
+        return max(self.get_phase_end(phase) - monotonic(), 0.0)
+
+    def get_connect_timeout(self) -> float:
+        """
+        How long a generation may wait for its response headers, capped by the generation
+        phase.
+        """
+        timeout = self.remaining(PHASE_GENERATION)
+        if self.connect_timeout is not None:
+            timeout = min(timeout, self.connect_timeout)
+
+        return timeout
+
+
+async def _await(awaitable: Awaitable) -> Any:
+    return await awaitable
+
+
+async def _run_with_timeout(
+    timeout: float, description: str, awaitable: Awaitable
+) -> Any:
+    """
+    Runs the awaitable in its own task, which is cancelled with a `TimeoutError` once
+    `timeout` seconds passed. The awaiting task itself is never cancelled.
+    """
+    if timeout <= 0.0:
+        raise TimeoutError(f"The {description} ran out of time")
+
+    if not iscoroutine(awaitable):
+        awaitable = _await(awaitable)
+
+    loop = get_or_create_event_loop()
+    task = loop.create_task(awaitable)
+    handle = loop.call_after(
+        timeout, task.cancel_with, TimeoutError(f"The {description} ran out of time")
+    )
+    try:
+        return await task
+    finally:
+        handle.cancel()
+
+
+async def _run_within(
+    timeout: float | None, description: str, awaitable: Awaitable
+) -> Any:
+    try:
+        if timeout is None:
+            return await awaitable
+
+        return await _run_with_timeout(timeout, description, awaitable)
+    finally:
+        # an awaitable out of time before it started is never awaited
+        close = getattr(awaitable, "close", None)
+        if close is not None:
+            close()
+
+
+async def run_phase(deadline: Deadline | None, phase: str, awaitable: Awaitable) -> Any:
+    timeout = None if deadline is None else deadline.remaining(phase)
+    return await _run_within(timeout, f"{phase} phase", awaitable)
+
+
+async def run_connect(deadline: Deadline | None, awaitable: Awaitable) -> Any:
+    """
+    Waits for the response headers of a generation, within the connect timeout of the
+    deadline.
+    """
+    timeout = None if deadline is None else deadline.get_connect_timeout()
+    return await _run_within(timeout, "connection", awaitable)
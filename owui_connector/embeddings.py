@@ -0,0 +1,202 @@
+"""
+This module houses the batched embedding of texts through the panels Ollama endpoint.
+
+The texts are deduplicated, looked up in an optional persistent cache keyed by the model
+and the hash of the text, and only the missing ones are sent to the panel, split into
+evenly sized batches that run concurrently. The vectors are written straight into one
+contiguous float32 matrix, with one row per text.
+"""
+
+from hashlib import sha256
+from math import ceil
+from sqlite3 import Connection, connect
+from threading import RLock
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .concurrency import map_bounded
+from .scheduler import PRIORITY_INTERACTIVE
+
+if TYPE_CHECKING:
+    from .api_requests import ApiRequests
+
+# SQLite limits the amount of variables of one statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+def hash_text(text: str) -> str:
+    return sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    A SQLite store of computed embeddings, keyed by the model and the hash of the text.
+
+    Attributes:
+        path (str): The database file, or ":memory:" for a throwaway cache.
+        connection (Connection): The SQLite connection.
+        lock (RLock): Serializes the access to the connection across threads.
+    """
+
+    path: str
+    connection: Connection
+    lock: RLock
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        # the event loop of the connector runs in its own thread
+        self.connection = connect(path, check_same_thread=False)
+        self.lock = RLock()
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            );
+            """
+        )
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, np.ndarray]:
+        vectors = {}
+        with self.lock:
+            for start in range(0, len(hashes), LOOKUP_CHUNK_SIZE):
+                chunk = hashes[start : start + LOOKUP_CHUNK_SIZE]
+                rows = self.connection.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({', '.join('?' * len(chunk))})",
+                    (model, *chunk),
+                )
+                for content_hash, vector in rows:
+                    vectors[content_hash] = np.frombuffer(vector, dtype=np.float32)
+
+        return vectors
+
+    def put_many(self, model: str, hashes: list[str], vectors: np.ndarray):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                (
+                    (model, content_hash, vector.tobytes())
+                    for content_hash, vector in zip(hashes, vectors, strict=True)
+                ),
+            )
+
+    def clear(self, model: str | None = None):
+        with self.lock, self.connection:
+            if model is None:
+                self.connection.execute("DELETE FROM embeddings")
+            else:
+                self.connection.execute(
+                    "DELETE FROM embeddings WHERE model = ?", (model,)
+                )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def split_batches(items: list, batch_size: int) -> list[list]:
+    """
+    Splits the items into the least amount of batches of at most `batch_size` items, with
+    sizes as even as possible, so no batch is left mostly empty.
+    """
+    if not items:
+        return []
+
+    batch_count = ceil(len(items) / batch_size)
+    size = ceil(len(items) / batch_count)
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+async def embed_texts(
+    api: "ApiRequests",
+    model: str,
+    texts: list[str],
+    batch_size: int = 256,
+    concurrency: int = 4,
+    cache: EmbeddingCache | None = None,
+    priority: str = PRIORITY_INTERACTIVE,
+    tenant: str | None = None,
+) -> np.ndarray:
+    """
+    Embeds the texts, returning a contiguous float32 matrix with one row per text.
+
+    Args:
+        api (ApiRequests): The api the embeddings are requested with.
+        model (str): The embedding model.
+        texts (list[str]): The texts to embed.
+        batch_size (int): The maximal amount of texts of one request.
+        concurrency (int): The maximal amount of requests in flight.
+        cache (EmbeddingCache | None): The store the embeddings are looked up in first.
+        priority (str): The priority class of the requests, with a scheduler.
+        tenant (str | None): The caller the requests are accounted to, with a scheduler.
+    """
+    if batch_size < 1:
+        raise ValueError("The batch size must be at least 1")
+
+    # every distinct text is only embedded once
+    rows: dict[str, int] = {}
+    inverse = np.fromiter(
+        (rows.setdefault(text, len(rows)) for text in texts),
+        dtype=np.intp,
+        count=len(texts),
+    )
+    unique_texts = list(rows)
+    hashes = [hash_text(text) for text in unique_texts]
+
+    cached = cache.get_many(model, hashes) if cache is not None else {}
+    missing = [
+        row for row, content_hash in enumerate(hashes) if content_hash not in cached
+    ]
+
+    matrix: np.ndarray | None = None
+
+    def get_matrix(dimensions: int) -> np.ndarray:
+        nonlocal matrix
+        if matrix is None:
+            matrix = np.empty((len(unique_texts), dimensions), dtype=np.float32)
+        elif matrix.shape[1] != dimensions:
+            raise ValueError(
+                f"The model {model} returned embeddings of different dimensions"
+            )
+
+        return matrix
+
+    for row, content_hash in enumerate(hashes):
+        vector = cached.get(content_hash)
+        if vector is not None:
+            get_matrix(vector.shape[0])[row] = vector
+
+    async def embed_batch(batch: list[int]) -> np.ndarray:
+        embeddings = await api.get_embeddings(
+            model, [unique_texts[row] for row in batch], priority, tenant
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    results = map_bounded(embed_batch, split_batches(missing, batch_size), concurrency)
+    try:
+        async for batch, vectors, exception in results:
+            if exception is not None:
+                raise exception
+
+            if vectors.shape[0] != len(batch):
+                raise ConnectionError(
+                    "Failed to get the embeddings. The panel returned a wrong amount."
+                )
+
+            get_matrix(vectors.shape[1])[batch] = vectors
+            if cache is not None:
+                cache.put_many(model, [hashes[row] for row in batch], vectors)
+    finally:
+        await results.aclose()
+
+    if matrix is None:
+        return np.empty((0, 0), dtype=np.float32)
+
+    if len(unique_texts) == len(texts):
+        # the texts were distinct, so the rows are already in order
+        return matrix
+
+    return matrix[inverse]
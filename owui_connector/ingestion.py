@@ -0,0 +1,390 @@
+"""
+This module houses the bulk ingestion of documents into the knowledge bases of the panel.
+
+Every file is hashed before it is uploaded, and the hashes of the uploaded files are kept in
+a local SQLite index with the file ids the panel gave them. A file whose content was already
+uploaded is only linked to the knowledge base, and a file already linked is skipped, so
+ingesting an unchanged corpus again transfers nothing. The hashes of unchanged files are
+cached by their size and modification time, so they are not even read again.
+"""
+
+from functools import partial
+from hashlib import sha256
+from os import stat
+from sqlite3 import Connection, connect
+from threading import RLock
+from time import perf_counter, time
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+from scarletio import Task, get_or_create_event_loop, sleep
+
+from .concurrency import map_bounded
+from .scheduler import PRIORITY_BATCH
+
+if TYPE_CHECKING:
+    from .api_requests import ApiRequests
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class IngestionIndex:
+    """
+    The local record of the uploaded files, by the hash of their content.
+
+    Attributes:
+        path (str): The database file, or ":memory:" for a throwaway index.
+        connection (Connection): The SQLite connection.
+        lock (RLock): Serializes the access to the connection across threads.
+    """
+
+    path: str
+    connection: Connection
+    lock: RLock
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        # the hashing runs on executor threads, next to the event loop thread
+        self.connection = connect(path, check_same_thread=False)
+        self.lock = RLock()
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                hash TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                uploaded_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS knowledge_files (
+                knowledge_id TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (knowledge_id, hash)
+            );
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                modified_at INTEGER NOT NULL,
+                hash TEXT NOT NULL
+            );
+            """
+        )
+
+    def get_file_id(self, content_hash: str) -> str | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT file_id FROM files WHERE hash = ?", (content_hash,)
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def add_file(self, content_hash: str, file_id: str, size: int):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (hash, file_id, size, uploaded_at) VALUES (?, ?, ?, ?)",
+                (content_hash, file_id, size, time()),
+            )
+
+    def remove_file(self, content_hash: str):
+        """
+        Forgets an uploaded file, for example after it was deleted on the panel.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM files WHERE hash = ?", (content_hash,))
+            self.connection.execute(
+                "DELETE FROM knowledge_files WHERE hash = ?", (content_hash,)
+            )
+
+    def is_linked(self, knowledge_id: str, content_hash: str) -> bool:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM knowledge_files WHERE knowledge_id = ? AND hash = ?",
+                (knowledge_id, content_hash),
+            ).fetchone()
+
+        return row is not None
+
+    def link(self, knowledge_id: str, content_hash: str):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO knowledge_files (knowledge_id, hash) VALUES (?, ?)",
+                (knowledge_id, content_hash),
+            )
+
+    def hash_file(self, path: str) -> str:
+        """
+        Returns the hash of the file, reading it only if it changed since it was hashed.
+
+        This blocks, run it on an executor thread.
+        """
+        file_stat = stat(path)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT hash FROM hashes WHERE path = ? AND size = ? AND modified_at = ?",
+                (path, file_stat.st_size, file_stat.st_mtime_ns),
+            ).fetchone()
+
+        if row is not None:
+            return row[0]
+
+        content_hash = hash_file(path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO hashes (path, size, modified_at, hash) VALUES (?, ?, ?, ?)",
+                (path, file_stat.st_size, file_stat.st_mtime_ns, content_hash),
+            )
+
+        return content_hash
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class IngestionProgress:
+    """
+    The progress of an ingestion, updated after every file.
+
+    Attributes:
+        total (int): The amount of files to ingest.
+        uploaded (int): The files that were uploaded.
+        linked (int): The files whose content was already uploaded, and were only linked.
+        skipped (int): The files already in the knowledge base.
+        failed (int): The files that could not be ingested.
+        bytes_uploaded (int): The amount of uploaded bytes.
+        started_at (float): When the ingestion started, on the performance counter.
+    """
+
+    total: int
+    uploaded: int
+    linked: int
+    skipped: int
+    failed: int
+    bytes_uploaded: int
+    started_at: float
+
+    def __init__(self, total: int):
+        self.total = total
+        self.uploaded = 0
+        self.linked = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes_uploaded = 0
+        self.started_at = perf_counter()
+
+    def __repr__(self) -> str:
+        return (
+            f"<IngestionProgress {self.done}/{self.total} uploaded={self.uploaded} "
+            f"linked={self.linked} skipped={self.skipped} failed={self.failed}>"
+        )
+
+    @property
+    def done(self) -> int:
+        return self.uploaded + self.linked + self.skipped + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return perf_counter() - self.started_at
+
+    @property
+    def files_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.bytes_uploaded / elapsed if elapsed else 0.0
+
+
+class IngestionResult:
+    """
+    The outcome of an ingestion.
+
+    Attributes:
+        file_ids (dict[str, str]): The panel file id of every ingested path.
+        failed (dict[str, BaseException]): The paths that could not be ingested.
+        progress (IngestionProgress): The final counters of the ingestion.
+    """
+
+    file_ids: dict[str, str]
+    failed: dict[str, BaseException]
+    progress: IngestionProgress
+
+    def __init__(
+        self,
+        file_ids: dict[str, str],
+        failed: dict[str, BaseException],
+        progress: IngestionProgress,
+    ):
+        self.file_ids = file_ids
+        self.failed = failed
+        self.progress = progress
+
+
+class KnowledgeIngestion:
+    """
+    Ingests files into the knowledge bases of the panel, uploading every content only once.
+
+    Attributes:
+        api (ApiRequests): The api the files are uploaded with.
+        index (IngestionIndex): The record of the uploaded files.
+        concurrency (int): The maximal amount of files processed at once.
+        retries (int): How often a failed request is retried.
+        retry_delay (float): The first delay before a retry, doubled with every attempt.
+        priority (str): The priority class of the requests, with a scheduler.
+        tenant (str | None): The caller the requests are accounted to, with a scheduler.
+    """
+
+    api: "ApiRequests"
+    index: IngestionIndex
+    concurrency: int
+    retries: int
+    retry_delay: float
+    priority: str
+    tenant: str | None
+
+    def __init__(
+        self,
+        api: "ApiRequests",
+        index: IngestionIndex,
+        concurrency: int = 4,
+        retries: int = 3,
+        retry_delay: float = 1.0,
+        priority: str = PRIORITY_BATCH,
+        tenant: str | None = None,
+    ):
+        self.api = api
+        self.index = index
+        self.concurrency = concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.priority = priority
+        self.tenant = tenant
+        self._pending: dict[str | tuple[str, str], Task] = {}
+
+    async def ingest(
+        self,
+        knowledge_id: str,
+        paths: list[str],
+        on_progress: Callable[[IngestionProgress], None] | None = None,
+    ) -> IngestionResult:
+        """
+        Adds the files to the knowledge base, uploading only the content the panel does not
+        have yet.
+
+        Args:
+            knowledge_id (str): The id of the knowledge base.
+            paths (list[str]): The files to ingest.
+            on_progress (Callable[[IngestionProgress], None] | None): Called after every file.
+        """
+        paths = list(dict.fromkeys(paths))
+        progress = IngestionProgress(len(paths))
+        result = IngestionResult({}, {}, progress)
+
+        results = map_bounded(
+            partial(self._ingest_file, knowledge_id, progress),
+            paths,
+            self.concurrency,
+        )
+        try:
+            async for path, file_id, exception in results:
+                if exception is None:
+                    result.file_ids[path] = file_id
+                else:
+                    progress.failed += 1
+                    result.failed[path] = exception
+
+                if on_progress is not None:
+                    on_progress(progress)
+        finally:
+            await results.aclose()
+
+        return result
+
+    async def _ingest_file(
+        self, knowledge_id: str, progress: IngestionProgress, path: str
+    ) -> str:
+        loop = get_or_create_event_loop()
+        content_hash = await loop.run_in_executor(partial(self.index.hash_file, path))
+
+        if self.index.is_linked(knowledge_id, content_hash):
+            progress.skipped += 1
+            return self.index.get_file_id(content_hash)
+
+        file_id = self.index.get_file_id(content_hash)
+        uploaded = False
+        if file_id is None:
+            upload, uploaded = self._share(
+                content_hash, lambda: self._upload(content_hash, path, progress)
+            )
+            file_id = await upload
+
+        link, _ = self._share(
+            (knowledge_id, content_hash),
+            lambda: self._link(knowledge_id, content_hash, file_id),
+        )
+        await link
+
+        if uploaded:
+            progress.uploaded += 1
+        else:
+            progress.linked += 1
+
+        return file_id
+
+    def _share(
+        self, key: str | tuple[str, str], request: Callable[[], Awaitable]
+    ) -> tuple[Task, bool]:
+        # copies of a file in one run wait for the request of the first copy
+        task = self._pending.get(key)
+        if task is not None:
+            return task, False
+
+        task = get_or_create_event_loop().create_task(request())
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return task, True
+
+    async def _upload(
+        self, content_hash: str, path: str, progress: IngestionProgress
+    ) -> str:
+        uploaded_file = await self._retry(
+            lambda: self.api.upload_file(
+                path, priority=self.priority, tenant=self.tenant
+            )
+        )
+        self.index.add_file(content_hash, uploaded_file.id, uploaded_file.size)
+        progress.bytes_uploaded += uploaded_file.size
+        return uploaded_file.id
+
+    async def _link(self, knowledge_id: str, content_hash: str, file_id: str):
+        if not self.index.is_linked(knowledge_id, content_hash):
+            await self._retry(
+                lambda: self.api.add_file_to_knowledge(
+                    knowledge_id, file_id, self.priority, self.tenant
+                )
+            )
+            self.index.link(knowledge_id, content_hash)
+
+    async def _retry(self, request: Callable[[], Awaitable]):
+        loop = get_or_create_event_loop()
+        delay = self.retry_delay
+
+        for attempt in range(self.retries + 1):
+            try:
+                return await request()
+            except (ConnectionError, TimeoutError) as error:
+                if attempt == self.retries:
+                    raise
+
+                print(
+                    f"OpenWebUI Connector - Retrying in {delay}s, the request failed: {error!r}"
+                )
+                await sleep(delay, loop)
+                delay *= 2
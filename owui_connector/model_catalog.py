@@ -0,0 +1,209 @@
+"""
+This module houses the model catalog of the OWUI Connector.
+
+The catalog caches the Ollama models known to the panel, so a request for a misspelled or
+not pulled model fails before a chat is created for it. It also exposes the metadata of the
+models, like their size and context length.
+"""
+
+from time import monotonic
+from typing import TYPE_CHECKING
+
+from scarletio import Task, get_or_create_event_loop, sleep
+
+if TYPE_CHECKING:
+    from .api_requests import ApiRequests
+
+
+class ModelInfo:
+    """
+    ModelInfo holds the metadata of one Ollama model.
+
+    Attributes:
+        name (str): The name of the model, including its tag.
+        size (int): The size of the model on the disk, in bytes.
+        family (str): The model family, for example "llama".
+        parameter_size (str): The parameter count, for example "8.0B".
+        quantization_level (str): The quantization, for example "Q4_0".
+        modified_at (str): When the model was pulled or modified.
+        context_length (int | None): The context length of the model, None until it was
+            requested with `ModelCatalog.get_context_length`.
+    """
+
+    name: str
+    size: int
+    family: str
+    parameter_size: str
+    quantization_level: str
+    modified_at: str
+    context_length: int | None
+
+    def __init__(
+        self,
+        name: str,
+        size: int,
+        family: str,
+        parameter_size: str,
+        quantization_level: str,
+        modified_at: str,
+        context_length: int | None = None,
+    ):
+        self.name = name
+        self.size = size
+        self.family = family
+        self.parameter_size = parameter_size
+        self.quantization_level = quantization_level
+        self.modified_at = modified_at
+        self.context_length = context_length
+
+    def __repr__(self) -> str:
+        return f"<ModelInfo name={self.name!r} size={self.size}>"
+
+
+def normalize_model_name(model: str) -> str:
+    # Ollama treats a model without a tag as its latest tag
+    return model if ":" in model else f"{model}:latest"
+
+
+class ModelCatalog:
+    """
+    A cache of the Ollama models of the panel.
+
+    Attributes:
+        api (ApiRequests): The api the models are fetched with.
+        ttl (float): How long the fetched models are served without a refresh, in seconds.
+            Once stale they are still served, while a refresh runs in the background.
+        models (dict[str, ModelInfo]): The models by their name.
+        fetched_at (float): When the models were fetched, on the monotonic clock.
+        refresh_task (Task | None): The running refresh, shared by every caller.
+        update_task (Task | None): The task refreshing the catalog periodically.
+    """
+
+    api: "ApiRequests"
+    ttl: float
+    models: dict[str, ModelInfo]
+    fetched_at: float
+    refresh_task: Task | None
+    update_task: Task | None
+
+    def __init__(self, api: "ApiRequests", ttl: float = 300.0):
+        self.api = api
+        self.ttl = ttl
+        self.models = {}
+        self.fetched_at = 0.0
+        self.refresh_task = None
+        self.update_task = None
+
+    @property
+    def is_stale(self) -> bool:
+        return monotonic() - self.fetched_at >= self.ttl
+
+    async def refresh(self) -> dict[str, ModelInfo]:
+        """
+        Fetches the models from the panel. Concurrent calls share one request.
+        """
+        if self.refresh_task is None or self.refresh_task.is_done():
+            self.refresh_task = get_or_create_event_loop().create_task(self._fetch())
+
+        return await self.refresh_task
+
+    async def _fetch(self) -> dict[str, ModelInfo]:
+        models = {}
+        for model in await self.api.get_ollama_models():
+            details = model.get("details") or {}
+            name = model.get("name") or model["model"]
+
+            old_model = self.models.get(name)
+            models[name] = ModelInfo(
+                name,
+                model.get("size", 0),
+                details.get("family", ""),
+                details.get("parameter_size", ""),
+                details.get("quantization_level", ""),
+                model.get("modified_at", ""),
+                # the model did not change, so its context length did not either
+                (
+                    old_model.context_length
+                    if old_model is not None
+                    and old_model.modified_at == model.get("modified_at", "")
+                    else None
+                ),
+            )
+
+        self.models = models
+        self.fetched_at = monotonic()
+        return models
+
+    async def get_models(self) -> dict[str, ModelInfo]:
+        if not self.models:
+            return await self.refresh()
+
+        if self.is_stale and (self.refresh_task is None or self.refresh_task.is_done()):
+            get_or_create_event_loop().create_task(self._refresh_quietly())
+
+        return self.models
+
+    async def get(self, model: str) -> ModelInfo | None:
+        models = await self.get_models()
+        return models.get(model) or models.get(normalize_model_name(model))
+
+    async def validate(self, model: str) -> ModelInfo:
+        """
+        Returns the model, or raises ValueError if the panel does not have it.
+
+        A model missing from the cache might have been pulled since, so the catalog is
+        refreshed once before the model is rejected.
+        """
+        model_info = await self.get(model)
+        if model_info is None:
+            await self.refresh()
+            model_info = await self.get(model)
+
+        if model_info is None:
+            raise ValueError(
+                f"The model {model} is not available on the OpenWebUi panel"
+            )
+
+        return model_info
+
+    async def get_context_length(self, model: str) -> int | None:
+        """
+        Returns the context length of the model, asking the panel for it only once.
+        """
+        model_info = await self.validate(model)
+        if model_info.context_length is None:
+            details = await self.api.show_ollama_model(model_info.name)
+            for key, value in (details.get("model_info") or {}).items():
+                if key.endswith(".context_length"):
+                    model_info.context_length = int(value)
+                    break
+
+        return model_info.context_length
+
+    def start(self, interval: float | None = None):
+        """
+        Refreshes the catalog in the background every `interval` seconds, the ttl by default.
+        """
+        if self.update_task is None or self.update_task.is_done():
+            self.update_task = get_or_create_event_loop().create_task(
+                self._update(self.ttl if interval is None else interval)
+            )
+
+    def stop(self):
+        if self.update_task is not None and not self.update_task.is_done():
+            self.update_task.cancel()
+
+        self.update_task = None
+
+    async def _refresh_quietly(self):
+        try:
+            await self.refresh()
+        except ConnectionError as error:
+            print(f"OpenWebUI Connector - Failed to refresh the models: {error!r}")
+
+    async def _update(self, interval: float):
+        loop = get_or_create_event_loop()
+
+        while True:
+            await self._refresh_quietly()
+            await sleep(interval, loop)
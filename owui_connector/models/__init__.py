@@ -1,4 +1,5 @@
 from .message_roles import MessageRoles
+from .bulk_delete import BulkDeleteResult
 from .chat import (
     Chat,
     ChatReference,
@@ -10,7 +11,9 @@ from .chat import (
     CompletedUserMessage,
     CompletedModelMessage,
     CompletedModelMessageInfo,
+    MessageTree,
 )
+from .file import UploadedFile
 from .ollama import OllamaRequest
 from .user import User
 
@@ -28,4 +31,7 @@ __all__ = [
     "CompletedUserMessage",
     "CompletedModelMessage",
     "CompletedModelMessageInfo",
+    "BulkDeleteResult",
+    "MessageTree",
+    "UploadedFile",
 ]
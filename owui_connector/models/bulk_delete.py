@@ -0,0 +1,26 @@
+"""
+This file holds the result model of a bulk delete.
+"""
+
+
+class BulkDeleteResult:
+    """
+    BulkDeleteResult reports the outcome of deleting many chats at once.
+
+    Attributes:
+        deleted (list[str]): The ids of the deleted chats.
+        failed (dict[str, Exception]): The ids (or titles that could not be resolved)
+            mapped to the exception that stopped their deletion.
+    """
+
+    deleted: list[str]
+    failed: dict[str, Exception]
+
+    def __init__(self, deleted: list[str], failed: dict[str, Exception]):
+        self.deleted = deleted
+        self.failed = failed
+
+    def __repr__(self):
+        return (
+            f"<BulkDeleteResult deleted={len(self.deleted)} failed={len(self.failed)}>"
+        )
@@ -1,4 +1,5 @@
 from .chat import Chat, ChatReference, WeekChatReference
+from .message_tree import MessageTree
 from .model_response import ModelChatResponse, ModelChatResponseInfo
 from .user_message import UserChatMessage
 from .completed import (
@@ -19,4 +20,5 @@ __all__ = [
     "CompletedUserMessage",
     "CompletedModelMessage",
     "CompletedModelMessageInfo",
+    "MessageTree",
 ]
@@ -4,6 +4,7 @@ This module defines classes for managing chat references and chat sessions.
 
 from typing import Any
 
+from .message_tree import MessageTree
 from .model_response import ModelChatResponse
 from .user_message import UserChatMessage
 
@@ -45,6 +46,7 @@ class ChatReference:
         history (dict[str, Any]): History of the chat messages.
         tags (list[str]): List of tags associated with the chat.
         timestamp (int): Timestamp of the chat creation.
+        tree (MessageTree): The messages indexed by id, with the active branch of the chat.
     """
 
     id: str
@@ -55,6 +57,7 @@ class ChatReference:
     history: dict[str, Any]
     tags: list[str]
     timestamp: int
+    tree: MessageTree
 
     def __init__(
         self,
@@ -66,16 +69,18 @@ class ChatReference:
         history: dict[str, Any] | None,
         tags: list[str],
         timestamp: int,
+        current_id: str | None = None,
     ):
         self.id = chat_id
         self.title = title
         self.models = models
         self.messages = messages
         self.params = params
+        self.tree = MessageTree(messages, current_id)
 
         if not history:
-            history_result = self.chat_messages_to_history(messages)
-            self.history = history_result
+            # the tree keeps the history up to date from now on
+            self.history = self.tree.history
         else:
             # TODO: check if there is already a history, and append it
             self.history = history
@@ -83,6 +88,13 @@ class ChatReference:
         self.tags = tags
         self.timestamp = timestamp
 
+    def add_message(self, message: UserChatMessage | ModelChatResponse):
+        """
+        Appends a message to the chat, and makes it the end of the active branch.
+        """
+        self.messages.append(message)
+        self.tree.add(message)
+
     def chat_messages_to_history(
         self, messages: list[UserChatMessage | ModelChatResponse]
     ) -> dict[str, Any]:
@@ -120,6 +132,8 @@ class ChatReference:
                   correctly and messages converted to dictionaries.
         """
         chat_dict = self.__dict__.copy()
+        # the tree is only an index, its content is in the messages and the history
+        del chat_dict["tree"]
         # convert the var names to the correct format
         messages_list = [
             message.to_dict(is_new)
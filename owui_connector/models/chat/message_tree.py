@@ -0,0 +1,147 @@
+"""
+This module defines the MessageTree class, which indexes the messages of a chat by their id.
+
+A chat is a tree: every regeneration or compared model adds a sibling response, and the
+panel shows the branch ending in its `currentId`. The tree keeps the active branch and the
+history of the panel up to date while messages are appended, instead of rebuilding them.
+"""
+
+from typing import Any
+
+from .model_response import ModelChatResponse
+from .user_message import UserChatMessage
+
+Message = UserChatMessage | ModelChatResponse
+
+
+class MessageTree:
+    """
+    MessageTree indexes the messages of a chat by id, with their parent and child links.
+
+    Attributes:
+        messages (dict[str, UserChatMessage | ModelChatResponse]): The messages by id.
+        current_id (str | None): The id of the last message of the active branch.
+        history (dict[str, Any]): The history of the chat in the format of the panel, with
+            the "messages" by id and the "currentId".
+    """
+
+    messages: dict[str, Message]
+    current_id: str | None
+    history: dict[str, Any]
+
+    def __init__(
+        self, messages: list[Message] | None = None, current_id: str | None = None
+    ):
+        self.messages = {}
+        self.current_id = None
+        self.history = {"messages": {}, "currentId": None}
+        self._active_path: list[Message] | None = []
+
+        for message in messages or []:
+            self.add(message, make_current=False)
+
+        if current_id is not None and current_id in self.messages:
+            self.set_current(current_id)
+        elif messages:
+            self.set_current(messages[-1].id)
+
+    def __contains__(self, message_id: str) -> bool:
+        return message_id in self.messages
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def get(self, message_id: str | None) -> Message | None:
+        if message_id is None:
+            return None
+
+        return self.messages.get(message_id)
+
+    def add(self, message: Message, make_current: bool = True):
+        """
+        Adds a message, linking it into the children of its parent.
+
+        Args:
+            message (UserChatMessage | ModelChatResponse): The message to add.
+            make_current (bool): Whether the message becomes the end of the active branch.
+        """
+        self.messages[message.id] = message
+        self.history["messages"][message.id] = message.to_dict(True)
+
+        parent = self.get(message.parent_id)
+        if parent is not None and message.id not in parent.children_ids:
+            parent.children_ids.append(message.id)
+            self.history["messages"][parent.id] = parent.to_dict(True)
+
+        if make_current:
+            if self._active_path is not None and message.parent_id == self.current_id:
+                # the common case, the active branch grows by one message
+                self._active_path.append(message)
+            else:
+                self._active_path = None
+
+            self.current_id = message.id
+            self.history["currentId"] = message.id
+
+    def update(self, message: Message):
+        """
+        Refreshes the history entry of a message, after its content changed.
+        """
+        self.history["messages"][message.id] = message.to_dict(True)
+
+    def set_current(self, message_id: str):
+        if message_id not in self.messages:
+            raise ValueError("Message not found")
+
+        if message_id != self.current_id:
+            self.current_id = message_id
+            self.history["currentId"] = message_id
+            self._active_path = None
+
+    def get_path(self, message_id: str | None = None) -> list[Message]:
+        """
+        Returns the messages from the root of the chat to the given message, the end of the
+        active branch by default.
+        """
+        if message_id is None or message_id == self.current_id:
+            return list(self.active_path)
+
+        return self._walk(message_id)
+
+    def _walk(self, message_id: str) -> list[Message]:
+        path = []
+        message = self.get(message_id)
+        while message is not None:
+            path.append(message)
+            message = self.get(message.parent_id)
+
+        path.reverse()
+        return path
+
+    @property
+    def active_path(self) -> list[Message]:
+        """
+        The messages of the active branch, from the root to `current_id`. The branch is
+        cached, and only walked again after switching to another one.
+        """
+        if self._active_path is None:
+            self._active_path = (
+                self._walk(self.current_id) if self.current_id is not None else []
+            )
+
+        return self._active_path
+
+    def get_leaf(self, message_id: str) -> Message:
+        """
+        Returns the end of the branch starting at the message, following the newest
+        children, like the panel does when switching branches.
+        """
+        message = self.messages[message_id]
+        while message.children_ids:
+            child = self.get(message.children_ids[-1])
+            if child is None:
+                break
+
+            message = child
+
+        return message
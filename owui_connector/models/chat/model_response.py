@@ -92,6 +92,7 @@ class ModelChatResponse:
         done (bool): Indicates if the message is the final one.
         context (str | None): The context of the message.
         info (ModelChatResponseInfo | None): Additional information about the response.
+        cancelled (bool): Indicates if the generation was cancelled before it finished.
     """
 
     parent_id: str
@@ -107,6 +108,7 @@ class ModelChatResponse:
     done: bool
     context: str | None
     info: ModelChatResponseInfo | None
+    cancelled: bool
 
     def __init__(
         self,
@@ -123,6 +125,7 @@ class ModelChatResponse:
         done: bool,
         context: str | None,
         info: ModelChatResponseInfo | None,
+        cancelled: bool = False,
     ):
         self.parent_id = parent_id
         self.id = message_id
@@ -133,10 +136,11 @@ class ModelChatResponse:
         self.model_name = model_name
         self.user_context = user_context
         self.timestamp = timestamp
-        self.last_sentance = last_sentence
+        self.last_sentence = last_sentence
         self.done = done
         self.context = context
         self.info = info
+        self.cancelled = cancelled
 
     def to_dict(self, is_new: bool = False):
         """
@@ -152,7 +156,7 @@ class ModelChatResponse:
         Notes:
             - Keys with underscores will have the underscore removed and the following
               character capitalized.
-            - If `is_new` is True, the keys 'done', 'context', 'info', and 'lastSentance'
+            - If `is_new` is True, the keys 'done', 'context', 'info', and 'lastSentence'
               will be removed.
             - Ensures 'userContext' is properly renamed from 'user_context' if it exists.
         """
@@ -176,7 +180,7 @@ class ModelChatResponse:
             chat_dict.pop("done", None)
             chat_dict.pop("context", None)
             chat_dict.pop("info", None)
-            chat_dict.pop("lastSentance", None)
+            chat_dict.pop("lastSentence", None)
 
         # Ensure userContext is properly renamed
         if "userContext" not in chat_dict and "user_context" in self.__dict__:
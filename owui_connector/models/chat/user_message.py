@@ -2,6 +2,8 @@
 This module defines a class for using chat messages in the chat model.
 """
 
+from ..file import UploadedFile
+
 
 class UserChatMessage:
     """
@@ -16,6 +18,7 @@ class UserChatMessage:
         content (str): Content of the message.
         timestamp (int): Timestamp of when the message was created.
         models (list[str]): List of models associated with the message.
+        files (list[UploadedFile]): The files attached to the message.
     """
 
     id: str
@@ -25,6 +28,7 @@ class UserChatMessage:
     content: str
     timestamp: int
     models: list[str]
+    files: list[UploadedFile]
 
     def __init__(
         self,
@@ -35,6 +39,7 @@ class UserChatMessage:
         content: str,
         timestamp: int,
         models: list[str],
+        files: list[UploadedFile] | None = None,
     ):
         self.id = message_id
         self.parent_id = parent_id
@@ -43,6 +48,7 @@ class UserChatMessage:
         self.content = content
         self.timestamp = timestamp
         self.models = models
+        self.files = files or []
 
     def to_dict(self, _):
         """
@@ -67,4 +73,9 @@ class UserChatMessage:
                 )
                 chat_dict[new_key] = chat_dict.pop(key)
 
+        # the panel only expects the files of messages that have some
+        files = chat_dict.pop("files")
+        if files:
+            chat_dict["files"] = [file.to_dict() for file in files]
+
         return chat_dict
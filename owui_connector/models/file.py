@@ -0,0 +1,70 @@
+"""
+This module defines the UploadedFile class, a file stored on the panel.
+"""
+
+from typing import Any
+
+
+class UploadedFile:
+    """
+    UploadedFile represents a file uploaded to the panel, that can be attached to messages.
+
+    Attributes:
+        id (str): Unique identifier of the file on the panel.
+        filename (str): The name of the file.
+        size (int): The size of the file, in bytes.
+        content_type (str): The MIME type of the file.
+    """
+
+    id: str
+    filename: str
+    size: int
+    content_type: str
+
+    def __init__(self, file_id: str, filename: str, size: int, content_type: str):
+        self.id = file_id
+        self.filename = filename
+        self.size = size
+        self.content_type = content_type
+
+    def __repr__(self) -> str:
+        return f"<UploadedFile id={self.id!r} filename={self.filename!r}>"
+
+    @classmethod
+    def from_response(cls, response: dict[str, Any]) -> "UploadedFile":
+        """
+        Creates the file from the response of the panel to its upload.
+        """
+        meta = response.get("meta") or {}
+        return cls(
+            response["id"],
+            response.get("filename") or meta.get("name", ""),
+            meta.get("size", 0),
+            meta.get("content_type") or "application/octet-stream",
+        )
+
+    @classmethod
+    def from_dict(cls, file: dict[str, Any]) -> "UploadedFile":
+        """
+        Creates the file from its entry in the files of a message.
+        """
+        return cls(
+            file["id"],
+            file.get("name", ""),
+            file.get("size", 0),
+            file.get("contentType") or "application/octet-stream",
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Converts the file to the entry the panel expects in the files of a message.
+        """
+        return {
+            "type": "file",
+            "id": self.id,
+            "name": self.filename,
+            "url": f"/api/v1/files/{self.id}",
+            "size": self.size,
+            "contentType": self.content_type,
+            "status": "uploaded",
+        }
@@ -0,0 +1,215 @@
+"""
+This module houses a local SQLite replica of the chat store of the panel.
+
+The replica is synced incrementally: only chats whose `updated_at` moved past the stored
+watermark are downloaded again. Writes done through the connector are applied to it right
+away, so reads can be served locally.
+"""
+
+from json import dumps, loads
+from sqlite3 import Connection, connect
+from threading import RLock
+from typing import TYPE_CHECKING
+
+from scarletio import get_or_create_event_loop, sleep
+
+from .concurrency import map_bounded
+
+if TYPE_CHECKING:
+    from .api_requests import ApiRequests
+
+
+class ChatReplica:
+    """
+    A local copy of every chat of the panel, stored as the panels chat records.
+
+    Attributes:
+        path (str): The database file, or ":memory:" for a throwaway replica.
+        connection (Connection): The SQLite connection.
+        lock (RLock): Serializes the access to the connection across threads.
+        pending_refreshes (set[str]): The chats with a scheduled refresh.
+    """
+
+    path: str
+    connection: Connection
+    lock: RLock
+    pending_refreshes: set[str]
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        # the event loop of the connector runs in its own thread
+        self.connection = connect(path, check_same_thread=False)
+        self.lock = RLock()
+        self.pending_refreshes = set()
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chats (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                updated_at INTEGER NOT NULL,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chats_title ON chats (title, updated_at);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+    @property
+    def watermark(self) -> int | None:
+        """
+        The newest `updated_at` that was synced, or None if the replica was never synced.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'watermark'"
+            ).fetchone()
+
+        return None if row is None else int(row[0])
+
+    def _set_watermark(self, watermark: int):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('watermark', ?)",
+                (str(watermark),),
+            )
+
+    def get_chat_by_id(self, chat_id: str) -> dict | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body FROM chats WHERE id = ?", (chat_id,)
+            ).fetchone()
+
+        return None if row is None else loads(row[0])
+
+    def get_chat_by_title(self, chat_title: str) -> dict | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body FROM chats WHERE title = ? ORDER BY updated_at DESC LIMIT 1",
+                (chat_title,),
+            ).fetchone()
+
+        return None if row is None else loads(row[0])
+
+    def get_updated_at(self, chat_id: str) -> int | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT updated_at FROM chats WHERE id = ?", (chat_id,)
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def upsert_chat(self, chat: dict):
+        """
+        Stores a chat record as returned by the panel, replacing the older copy.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO chats (id, title, updated_at, body) VALUES (?, ?, ?, ?)",
+                (
+                    chat["id"],
+                    chat.get("title") or chat["chat"].get("title", ""),
+                    int(chat.get("updated_at") or 0),
+                    dumps(chat),
+                ),
+            )
+
+    def remove_chat(self, chat_id: str):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+
+    async def sync(
+        self, api: "ApiRequests", concurrency: int = 8, prune: bool = False
+    ) -> int:
+        """
+        Downloads every chat that changed since the last sync.
+
+        Args:
+            api (ApiRequests): The api to sync from.
+            concurrency (int): The maximal amount of chats fetched at once.
+            prune (bool): Walk the whole chat list and drop local chats that were deleted on
+                the panel. Deletions are invisible to a delta sync, so do this now and then.
+
+        Returns:
+            int: The amount of downloaded chats.
+        """
+        since = None if prune else self.watermark
+        newest = since or 0
+        seen_ids: set[str] = set()
+
+        async def iter_changed_chats():
+            nonlocal newest
+
+            async for week_chat in api.iter_chats(updated_since=since):
+                updated_at = int(week_chat.updated_at)
+                newest = max(newest, updated_at)
+                if prune:
+                    seen_ids.add(week_chat.id)
+
+                if self.get_updated_at(week_chat.id) != updated_at:
+                    yield week_chat
+
+        async def fetch_chat(week_chat) -> dict:
+            return await api.get_chat_by_id(week_chat.id, use_replica=False)
+
+        synced = 0
+        chats = map_bounded(fetch_chat, iter_changed_chats(), concurrency)
+        try:
+            async for _, chat, exception in chats:
+                if exception is not None:
+                    raise exception
+
+                self.upsert_chat(chat)
+                synced += 1
+        finally:
+            await chats.aclose()
+
+        if prune:
+            with self.lock, self.connection:
+                local_ids = [
+                    row[0] for row in self.connection.execute("SELECT id FROM chats")
+                ]
+                self.connection.executemany(
+                    "DELETE FROM chats WHERE id = ?",
+                    [(chat_id,) for chat_id in local_ids if chat_id not in seen_ids],
+                )
+
+        self._set_watermark(newest)
+        return synced
+
+    def watch(self, api: "ApiRequests", delay: float = 1.0):
+        """
+        Refreshes chats when the panel pushes a change for them over the websocket.
+
+        A generation pushes an event for every token, so refreshes are delayed by `delay`
+        seconds and every event of the same chat within that time shares one refresh.
+        """
+
+        def on_chat_event(data):
+            if not isinstance(data, dict) or not data.get("chat_id"):
+                return
+
+            chat_id = data["chat_id"]
+            if chat_id in self.pending_refreshes:
+                return
+
+            self.pending_refreshes.add(chat_id)
+            get_or_create_event_loop().create_task(self._refresh(api, chat_id, delay))
+
+        api.socket.subscribe("chat-events", on_chat_event)
+
+    async def _refresh(self, api: "ApiRequests", chat_id: str, delay: float):
+        await sleep(delay, get_or_create_event_loop())
+        self.pending_refreshes.discard(chat_id)
+
+        try:
+            # the api stores the fresh copy in the replica
+            await api.get_chat_by_id(chat_id, use_replica=False)
+        except ConnectionError as error:
+            print(f"OpenWebUI Connector - Failed to refresh chat {chat_id}: {error!r}")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,377 @@
+"""
+This module houses the model router of the OWUI Connector.
+
+A route is an alias standing for several interchangeable models. Whenever the alias is
+used, the router picks one of them with a policy, based on statistics it keeps from the
+completions of every model: the requests in flight, the generation and prompt speed
+reported by Ollama, and how long loading the model took when it was not in memory.
+"""
+
+from time import monotonic
+from typing import Callable
+
+from .models import CompletedModelMessageInfo, ModelChatResponseInfo
+
+# a load taking longer than this means the model was not in memory, in seconds
+COLD_LOAD_THRESHOLD = 0.5
+
+
+class ModelStats:
+    """
+    The live statistics of one model, as exponential moving averages.
+
+    Attributes:
+        model (str): The name of the model.
+        cost (float): The relative cost of one token, for the "cheapest" policy.
+        in_flight (int): The requests of the model that did not finish yet.
+        completions (int): The observed completions.
+        eval_speed (float | None): The generation speed, in tokens per second.
+        prompt_eval_speed (float | None): The prompt processing speed, in tokens per second.
+        reply_duration (float | None): The duration of a reply, in seconds.
+        cold_load_duration (float | None): How long loading the model took, in seconds.
+        last_used (float | None): When the model last finished a request, on the
+            monotonic clock.
+    """
+
+    model: str
+    cost: float
+    in_flight: int
+    completions: int
+    eval_speed: float | None
+    prompt_eval_speed: float | None
+    reply_duration: float | None
+    cold_load_duration: float | None
+    last_used: float | None
+
+    def __init__(self, model: str, cost: float = 1.0):
+        self.model = model
+        self.cost = cost
+        self.in_flight = 0
+        self.completions = 0
+        self.eval_speed = None
+        self.prompt_eval_speed = None
+        self.reply_duration = None
+        self.cold_load_duration = None
+        self.last_used = None
+
+    def __repr__(self) -> str:
+        return (
+            f"<ModelStats model={self.model!r} in_flight={self.in_flight} "
+            f"eval_speed={self.eval_speed}>"
+        )
+
+    def observe(
+        self, info: CompletedModelMessageInfo | ModelChatResponseInfo, smoothing: float
+    ):
+        """
+        Folds the statistics of a finished completion into the averages. The durations
+        reported by Ollama are in nanoseconds.
+        """
+
+        def average(current: float | None, value: float) -> float:
+            if current is None:
+                return value
+
+            return current + smoothing * (value - current)
+
+        self.completions += 1
+        if info.eval_duration > 0:
+            self.eval_speed = average(
+                self.eval_speed, info.eval_count * 1e9 / info.eval_duration
+            )
+
+        if info.prompt_eval_duration > 0:
+            self.prompt_eval_speed = average(
+                self.prompt_eval_speed,
+                info.prompt_eval_count * 1e9 / info.prompt_eval_duration,
+            )
+
+        if info.total_duration > 0:
+            self.reply_duration = average(
+                self.reply_duration, info.total_duration / 1e9
+            )
+
+        load_duration = info.load_duration / 1e9
+        if load_duration >= COLD_LOAD_THRESHOLD:
+            self.cold_load_duration = average(self.cold_load_duration, load_duration)
+
+
+class RoutingContext:
+    """
+    What a policy knows about the request it routes.
+
+    Attributes:
+        prompt_tokens (int): An estimate of the prompt length, in tokens.
+        keep_alive (float): How long Ollama keeps an idle model in memory, in seconds.
+        default_load_duration (float): The assumed load time of a model that was never
+            seen loading, in seconds.
+        now (float): The current time, on the monotonic clock.
+    """
+
+    prompt_tokens: int
+    keep_alive: float
+    default_load_duration: float
+    now: float
+
+    def __init__(
+        self,
+        prompt_tokens: int,
+        keep_alive: float,
+        default_load_duration: float,
+        now: float,
+    ):
+        self.prompt_tokens = prompt_tokens
+        self.keep_alive = keep_alive
+        self.default_load_duration = default_load_duration
+        self.now = now
+
+    def is_cold(self, stats: ModelStats) -> bool:
+        if stats.in_flight:
+            return False
+
+        return stats.last_used is None or self.now - stats.last_used > self.keep_alive
+
+    def expected_first_token(self, stats: ModelStats) -> float:
+        """
+        The expected time until the first token of the model, in seconds: the wait for the
+        requests in flight, loading the model if it is cold, and processing the prompt.
+        """
+        expected = stats.in_flight * (stats.reply_duration or 0.0)
+
+        if self.is_cold(stats):
+            expected += (
+                stats.cold_load_duration
+                if stats.cold_load_duration is not None
+                else self.default_load_duration
+            )
+
+        if stats.prompt_eval_speed:
+            expected += self.prompt_tokens / stats.prompt_eval_speed
+
+        return expected
+
+
+RoutingPolicy = Callable[[list[ModelStats], RoutingContext], ModelStats]
+
+
+def fastest_first_token(candidates: list[ModelStats], context: RoutingContext):
+    # untried models go first, so every model gets measured, and a model busy with its
+    # first requests counts as tried. Without a measured reply duration the wait for the
+    # requests in flight is unknown, so the fewer of them break the ties
+    return min(
+        candidates,
+        key=lambda stats: (
+            stats.completions > 0 or stats.in_flight > 0,
+            context.expected_first_token(stats),
+            stats.in_flight,
+            -(stats.eval_speed or 0.0),
+        ),
+    )
+
+
+def least_loaded(candidates: list[ModelStats], context: RoutingContext):
+    return min(
+        candidates,
+        key=lambda stats: (stats.in_flight, context.is_cold(stats), stats.cost),
+    )
+
+
+def cheapest(candidates: list[ModelStats], context: RoutingContext):
+    return min(candidates, key=lambda stats: (stats.cost, stats.in_flight))
+
+
+POLICIES: dict[str, RoutingPolicy] = {
+    "fastest": fastest_first_token,
+    "least_loaded": least_loaded,
+    "cheapest": cheapest,
+}
+
+
+class ModelRoute:
+    """
+    An alias standing for several interchangeable models.
+
+    Attributes:
+        alias (str): The name used in place of a model.
+        models (list[str]): The candidate models.
+        policy (RoutingPolicy): Picks one of the candidates.
+    """
+
+    alias: str
+    models: list[str]
+    policy: RoutingPolicy
+
+    def __init__(self, alias: str, models: list[str], policy: RoutingPolicy):
+        self.alias = alias
+        self.models = models
+        self.policy = policy
+
+
+class ModelReservation:
+    """
+    A request counted in flight of a model, from the moment its model was picked.
+
+    Attributes:
+        router (ModelRouter | None): The router the request is counted by, None without a
+            router.
+        model (str): The reserved model.
+        released (bool): Whether the reservation was given back.
+    """
+
+    router: "ModelRouter | None"
+    model: str
+    released: bool
+
+    def __init__(self, router: "ModelRouter | None", model: str):
+        self.router = router
+        self.model = model
+        self.released = False
+
+    def __repr__(self) -> str:
+        return f"<ModelReservation model={self.model!r} released={self.released}>"
+
+    def release(
+        self, info: CompletedModelMessageInfo | ModelChatResponseInfo | None = None
+    ):
+        """
+        Gives the reservation back once the model ran the request, learning from its
+        statistics if it completed. Releasing twice does nothing.
+        """
+        if self.released:
+            return
+
+        self.released = True
+        if self.router is not None:
+            self.router.release(self.model, info)
+
+    def cancel(self):
+        """
+        Gives the reservation back without the model having run the request.
+        """
+        if self.released:
+            return
+
+        self.released = True
+        if self.router is not None:
+            self.router.release(self.model, used=False)
+
+
+class ModelRouter:
+    """
+    Resolves model aliases to one of their models, using live statistics.
+
+    Attributes:
+        routes (dict[str, ModelRoute]): The routes by alias.
+        stats (dict[str, ModelStats]): The statistics by model.
+        smoothing (float): The weight of a new completion in the moving averages.
+        keep_alive (float): How long Ollama keeps an idle model in memory, in seconds.
+        default_load_duration (float): The assumed load time of a model that was never
+            seen loading, in seconds.
+    """
+
+    routes: dict[str, ModelRoute]
+    stats: dict[str, ModelStats]
+    smoothing: float
+    keep_alive: float
+    default_load_duration: float
+
+    def __init__(
+        self,
+        smoothing: float = 0.2,
+        keep_alive: float = 300.0,
+        default_load_duration: float = 5.0,
+    ):
+        if not 0.0 < smoothing <= 1.0:
+            raise ValueError("The smoothing has to be in (0, 1]")
+
+        self.routes = {}
+        self.stats = {}
+        self.smoothing = smoothing
+        self.keep_alive = keep_alive
+        self.default_load_duration = default_load_duration
+
+    def add_route(
+        self,
+        alias: str,
+        models: list[str],
+        policy: str | RoutingPolicy = "fastest",
+        costs: dict[str, float] | None = None,
+    ) -> ModelRoute:
+        """
+        Adds an alias, that can be used as the model of a chat.
+
+        Args:
+            alias (str): The name of the alias.
+            models (list[str]): The interchangeable models.
+            policy (str | RoutingPolicy): "fastest", "least_loaded", "cheapest", or a
+                callable picking one of the `ModelStats` of the candidates.
+            costs (dict[str, float] | None): The relative cost of a token of the models.
+        """
+        if not models:
+            raise ValueError("A route needs at least one model")
+
+        if isinstance(policy, str):
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown routing policy: {policy}")
+
+            policy = POLICIES[policy]
+
+        for model in models:
+            stats = self.get_stats(model)
+            if costs is not None and model in costs:
+                stats.cost = costs[model]
+
+        route = ModelRoute(alias, list(models), policy)
+        self.routes[alias] = route
+        return route
+
+    def remove_route(self, alias: str):
+        self.routes.pop(alias, None)
+
+    def get_stats(self, model: str) -> ModelStats:
+        stats = self.stats.get(model)
+        if stats is None:
+            stats = self.stats[model] = ModelStats(model)
+
+        return stats
+
+    def resolve(self, model: str, prompt_tokens: int = 0) -> ModelReservation:
+        """
+        Reserves the model an alias is routed to, or the model itself if it is no alias.
+
+        The request is counted in flight right away, so the requests resolved at once see
+        each other, and are spread over the models. Give the reservation back with
+        `ModelReservation.release` once the request finished, or with
+        `ModelReservation.cancel` if it never reached the model.
+        """
+        route = self.routes.get(model)
+        if route is not None:
+            context = RoutingContext(
+                prompt_tokens, self.keep_alive, self.default_load_duration, monotonic()
+            )
+            candidates = [self.get_stats(candidate) for candidate in route.models]
+            model = route.policy(candidates, context).model
+
+        return self.reserve(model)
+
+    def reserve(self, model: str) -> ModelReservation:
+        self.get_stats(model).in_flight += 1
+        return ModelReservation(self, model)
+
+    def release(
+        self,
+        model: str,
+        info: CompletedModelMessageInfo | ModelChatResponseInfo | None = None,
+        used: bool = True,
+    ):
+        """
+        Marks a request of the model as finished, learning from its statistics if it
+        completed. A request that never reached the model does not count as its use.
+        """
+        stats = self.get_stats(model)
+        stats.in_flight = max(stats.in_flight - 1, 0)
+        if used:
+            stats.last_used = monotonic()
+
+        if info is not None:
+            stats.observe(info, self.smoothing)
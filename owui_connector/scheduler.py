@@ -0,0 +1,396 @@
+"""
+This module houses the request scheduler of the OWUI Connector.
+
+The requests to the panel and to Ollama take a slot of the matching pool before they are
+sent. When a pool is full, the waiting requests are served by their priority class first,
+so a queued interactive chat always goes before queued batch work, and within a class by
+weighted fair queuing across the tenants, so one busy tenant can not starve the others.
+A request still waiting when its deadline passes fails with a `TimeoutError`.
+
+Running requests are never interrupted, a batch request that already holds a slot keeps
+it until it is finished.
+"""
+
+from collections import deque
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic
+
+from scarletio import Future, get_or_create_event_loop
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+
+# the priority classes, the earlier ones are always served first
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+POOL_PANEL = "panel"
+POOL_OLLAMA = "ollama"
+
+DEFAULT_TENANT = "default"
+
+
+class QueueStats:
+    """
+    The time the requests of one priority class spent waiting for a slot.
+
+    Attributes:
+        served (int): The requests that got a slot.
+        expired (int): The requests whose deadline passed while they were waiting.
+        total_wait (float): The summed waiting time of the served requests, in seconds.
+        max_wait (float): The longest waiting time of a served request, in seconds.
+        samples (deque[float]): The waiting times of the last served requests.
+    """
+
+    served: int
+    expired: int
+    total_wait: float
+    max_wait: float
+    samples: deque[float]
+
+    def __init__(self, sample_size: int = 1024):
+        self.served = 0
+        self.expired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def __repr__(self) -> str:
+        return (
+            f"<QueueStats served={self.served} expired={self.expired} "
+            f"mean_wait={self.mean_wait:.3f}>"
+        )
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.served if self.served else 0.0
+
+    def percentile(self, percentile: float) -> float:
+        """
+        The percentile of the waiting time of the last served requests, in seconds.
+        """
+        if not self.samples:
+            return 0.0
+
+        samples = sorted(self.samples)
+        index = round(percentile / 100 * (len(samples) - 1))
+        return samples[min(max(index, 0), len(samples) - 1)]
+
+    def record(self, wait: float):
+        self.served += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.samples.append(wait)
+
+
+class SlotTicket:
+    """
+    A request waiting for, or holding, a slot of a pool.
+
+    Attributes:
+        pool (SlotPool): The pool of the slot.
+        priority (str): The priority class of the request.
+        tenant (str): The tenant the request is accounted to.
+        start (float): The virtual start time of the request, in the fair queue.
+        finish (float): The virtual finish time of the request, in the fair queue.
+        enqueued_at (float): When the request started waiting, on the monotonic clock.
+        granted (bool): Whether the request holds a slot.
+        future (Future): Resolved when the slot is granted.
+    """
+
+    pool: "SlotPool"
+    priority: str
+    tenant: str
+    start: float
+    finish: float
+    enqueued_at: float
+    granted: bool
+    future: Future
+
+    def __init__(
+        self,
+        pool: "SlotPool",
+        priority: str,
+        tenant: str,
+        start: float,
+        finish: float,
+    ):
+        self.pool = pool
+        self.priority = priority
+        self.tenant = tenant
+        self.start = start
+        self.finish = finish
+        self.enqueued_at = monotonic()
+        self.granted = False
+        self.future = Future(get_or_create_event_loop())
+        self._timer = None
+        self._left = False
+
+    def release(self):
+        self.pool.release(self)
+
+
+class SlotPool:
+    """
+    A limited amount of concurrent requests to one backend.
+
+    Attributes:
+        name (str): The name of the pool, "panel" or "ollama".
+        capacity (int): The maximal amount of requests in flight.
+        in_use (int): The requests in flight.
+        stats (dict[str, QueueStats]): The waiting times of the pool, by priority class.
+    """
+
+    name: str
+    capacity: int
+    in_use: int
+    stats: dict[str, QueueStats]
+
+    def __init__(self, scheduler: "RequestScheduler", name: str, capacity: int):
+        if capacity < 1:
+            raise ValueError("A pool needs at least one slot")
+
+        self.scheduler = scheduler
+        self.name = name
+        self.capacity = capacity
+        self.in_use = 0
+        self.stats = {priority: QueueStats() for priority in PRIORITIES}
+        self._queues: dict[str, list[tuple[float, int, SlotTicket]]] = {
+            priority: [] for priority in PRIORITIES
+        }
+        self._virtual_times = {priority: 0.0 for priority in PRIORITIES}
+        self._last_finishes: dict[tuple[str, str], float] = {}
+        self._tenant_tickets: dict[tuple[str, str], int] = {}
+        self._sequence = count()
+
+    def __repr__(self) -> str:
+        return (
+            f"<SlotPool name={self.name!r} in_use={self.in_use}/{self.capacity} "
+            f"queued={self.queued}>"
+        )
+
+    @property
+    def queued(self) -> int:
+        return sum(
+            not ticket.future.is_done()
+            for queue in self._queues.values()
+            for _, _, ticket in queue
+        )
+
+    def enqueue(self, priority: str, tenant: str, cost: float) -> SlotTicket:
+        # the virtual finish time grows slower for the tenants with more weight
+        key = (priority, tenant)
+        start = max(self._virtual_times[priority], self._last_finishes.get(key, 0.0))
+        finish = start + cost / self.scheduler.get_weight(tenant)
+        self._last_finishes[key] = finish
+        self._tenant_tickets[key] = self._tenant_tickets.get(key, 0) + 1
+
+        ticket = SlotTicket(self, priority, tenant, start, finish)
+        heappush(self._queues[priority], (finish, next(self._sequence), ticket))
+        self.dispatch()
+        return ticket
+
+    def dispatch(self):
+        """
+        Grants the free slots to the waiting requests, by priority class and fair share.
+        """
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self.in_use < self.capacity:
+                _, _, ticket = heappop(queue)
+                if ticket.future.is_done():
+                    # expired or cancelled while waiting
+                    continue
+
+                self._virtual_times[priority] = max(
+                    self._virtual_times[priority], ticket.start
+                )
+                self.in_use += 1
+                ticket.granted = True
+                if ticket._timer is not None:
+                    ticket._timer.cancel()
+
+                wait = monotonic() - ticket.enqueued_at
+                self.stats[priority].record(wait)
+                self.scheduler.stats[priority].record(wait)
+                ticket.future.set_result_if_pending(None)
+
+    def expire(self, ticket: SlotTicket):
+        if ticket.granted or ticket.future.is_done():
+            return
+
+        self.stats[ticket.priority].expired += 1
+        self.scheduler.stats[ticket.priority].expired += 1
+        ticket.future.set_exception_if_pending(
+            TimeoutError(
+                f"The deadline passed while waiting for a slot of the {self.name} pool"
+            )
+        )
+        self._leave(ticket)
+
+    def withdraw(self, ticket: SlotTicket):
+        """
+        Gives up a ticket that was not granted yet.
+        """
+        ticket.future.cancel()
+        if ticket._timer is not None:
+            ticket._timer.cancel()
+
+        self._leave(ticket)
+
+    def release(self, ticket: SlotTicket):
+        if not ticket.granted:
+            return
+
+        ticket.granted = False
+        self.in_use -= 1
+        self._leave(ticket)
+        self.dispatch()
+
+    def _leave(self, ticket: SlotTicket):
+        if ticket._left:
+            return
+
+        ticket._left = True
+        key = (ticket.priority, ticket.tenant)
+        tickets = self._tenant_tickets[key] - 1
+        if tickets:
+            self._tenant_tickets[key] = tickets
+            return
+
+        # an idle tenant starts over at the virtual time of its class
+        del self._tenant_tickets[key]
+        del self._last_finishes[key]
+
+
+class RequestScheduler:
+    """
+    Shares the slots of the panel and of Ollama between the priority classes and tenants.
+
+    Attributes:
+        pools (dict[str, SlotPool]): The pools by name.
+        weights (dict[str, float]): The fair share weights of the tenants, 1.0 if unset.
+        stats (dict[str, QueueStats]): The waiting times across the pools, by priority
+            class.
+    """
+
+    pools: dict[str, SlotPool]
+    weights: dict[str, float]
+    stats: dict[str, QueueStats]
+
+    def __init__(
+        self,
+        panel_slots: int = 8,
+        ollama_slots: int = 2,
+        weights: dict[str, float] | None = None,
+    ):
+        self.weights = {}
+        self.stats = {priority: QueueStats() for priority in PRIORITIES}
+        self.pools = {
+            POOL_PANEL: SlotPool(self, POOL_PANEL, panel_slots),
+            POOL_OLLAMA: SlotPool(self, POOL_OLLAMA, ollama_slots),
+        }
+
+        for tenant, weight in (weights or {}).items():
+            self.set_weight(tenant, weight)
+
+    def set_weight(self, tenant: str, weight: float):
+        if weight <= 0.0:
+            raise ValueError("The weight of a tenant must be positive")
+
+        self.weights[tenant] = weight
+
+    def get_weight(self, tenant: str) -> float:
+        return self.weights.get(tenant, 1.0)
+
+    async def acquire(
+        self,
+        pool: str,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: float | None = None,
+        cost: float = 1.0,
+    ) -> SlotTicket:
+        """
+        Waits for a slot of the pool. Release it with `SlotTicket.release`.
+
+        Args:
+            pool (str): "panel" or "ollama".
+            priority (str): "interactive" or "batch".
+            tenant (str | None): The caller the request is accounted to.
+            deadline (float | None): The latest time to get a slot at, on the monotonic
+                clock.
+            cost (float): The relative size of the request, in the fair share.
+
+        Raises:
+            TimeoutError: If the deadline passed before a slot was free.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        slot_pool = self.pools[pool]
+        ticket = slot_pool.enqueue(priority, tenant or DEFAULT_TENANT, cost)
+
+        if not ticket.granted and deadline is not None:
+            ticket._timer = get_or_create_event_loop().call_after(
+                max(deadline - monotonic(), 0.0), slot_pool.expire, ticket
+            )
+
+        try:
+            await ticket.future
+        except BaseException:
+            if ticket.granted:
+                # the slot was granted, but the request does not come to use it
+                ticket.release()
+            else:
+                slot_pool.withdraw(ticket)
+
+            raise
+
+        return ticket
+
+    def slot(
+        self,
+        pool: str,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: float | None = None,
+    ) -> "Slot":
+        return Slot(self, pool, priority, tenant, deadline)
+
+
+class Slot:
+    """
+    Holds a slot of a pool while its `async with` block runs. Does nothing without a
+    scheduler.
+    """
+
+    def __init__(
+        self,
+        scheduler: RequestScheduler | None,
+        pool: str,
+        priority: str,
+        tenant: str | None,
+        deadline: float | None,
+    ):
+        self.scheduler = scheduler
+        self.pool = pool
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.ticket: SlotTicket | None = None
+
+    async def __aenter__(self) -> SlotTicket | None:
+        if self.scheduler is not None:
+            self.ticket = await self.scheduler.acquire(
+                self.pool, self.priority, self.tenant, self.deadline
+            )
+
+        return self.ticket
+
+    async def __aexit__(self, exception_type, exception, traceback):
+        if self.ticket is not None:
+            self.ticket.release()
+            self.ticket = None
+
+        return False
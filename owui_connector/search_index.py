@@ -0,0 +1,206 @@
+"""
+This module houses a local full-text search index over the chats of the panel.
+
+The index is a SQLite FTS5 table with one row per message, so searching never touches the
+network. It is built once from the panel and then kept up to date by the connector
+whenever a chat completion is synced.
+"""
+
+from re import findall
+from sqlite3 import Connection, connect
+from threading import RLock
+from typing import TYPE_CHECKING
+
+from .concurrency import map_bounded
+from .models import ChatReference, ModelChatResponse
+
+if TYPE_CHECKING:
+    from .api_requests import ApiRequests
+
+
+class SearchResult:
+    """
+    SearchResult represents a single message matching a search query.
+
+    Attributes:
+        chat_id (str): The id of the chat the message belongs to.
+        message_id (str): The id of the matching message.
+        title (str): The title of the chat.
+        score (float): The relevance of the match, higher is better.
+    """
+
+    chat_id: str
+    message_id: str
+    title: str
+    score: float
+
+    def __init__(self, chat_id: str, message_id: str, title: str, score: float):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.title = title
+        self.score = score
+
+    def __repr__(self):
+        return f"<SearchResult chat_id={self.chat_id!r} message_id={self.message_id!r} score={self.score:.3f}>"
+
+
+class ChatSearchIndex:
+    """
+    A full-text index of chat messages, backed by SQLite FTS5.
+
+    Attributes:
+        path (str): The database file, or ":memory:" for a throwaway index.
+        connection (Connection): The SQLite connection.
+        lock (RLock): Serializes the access to the connection across threads.
+    """
+
+    path: str
+    connection: Connection
+    lock: RLock
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        # the event loop of the connector runs in its own thread, while searches usually
+        # come from the callers thread
+        self.connection = connect(path, check_same_thread=False)
+        self.lock = RLock()
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS message_rows (
+                row_id INTEGER PRIMARY KEY,
+                chat_id TEXT NOT NULL,
+                message_id TEXT NOT NULL UNIQUE
+            );
+            CREATE INDEX IF NOT EXISTS message_rows_chat_id ON message_rows (chat_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS message_text USING fts5 (title, content);
+            """
+        )
+
+    def index_message(self, chat_id: str, title: str, message_id: str, content: str):
+        """
+        Adds a message to the index, or replaces its text if it is already indexed.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT row_id FROM message_rows WHERE message_id = ?", (message_id,)
+            ).fetchone()
+
+            if row is None:
+                row_id = self.connection.execute(
+                    "INSERT INTO message_rows (chat_id, message_id) VALUES (?, ?)",
+                    (chat_id, message_id),
+                ).lastrowid
+                self.connection.execute(
+                    "INSERT INTO message_text (rowid, title, content) VALUES (?, ?, ?)",
+                    (row_id, title, content),
+                )
+            else:
+                self.connection.execute(
+                    "UPDATE message_text SET title = ?, content = ? WHERE rowid = ?",
+                    (title, content, row[0]),
+                )
+
+    def index_chat(self, chat: dict):
+        """
+        Indexes every message of a chat as returned by `ApiRequests.get_chat_by_id`.
+        """
+        chat_id = chat["id"]
+        title = chat.get("title") or chat["chat"].get("title", "")
+
+        with self.lock, self.connection:
+            for message in chat["chat"].get("messages", []):
+                self.index_message(
+                    chat_id, title, message["id"], message.get("content") or ""
+                )
+
+    def index_completion(
+        self, chat_reference: ChatReference, model_message: ModelChatResponse
+    ):
+        """
+        Indexes the newest turn of a chat, the prompt and the reply to it.
+        """
+        with self.lock, self.connection:
+            for message in chat_reference.messages:
+                if message is model_message or message.id == model_message.parent_id:
+                    self.index_message(
+                        chat_reference.id,
+                        chat_reference.title,
+                        message.id,
+                        message.content,
+                    )
+
+    def remove_chat(self, chat_id: str):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM message_text WHERE rowid IN "
+                "(SELECT row_id FROM message_rows WHERE chat_id = ?)",
+                (chat_id,),
+            )
+            self.connection.execute(
+                "DELETE FROM message_rows WHERE chat_id = ?", (chat_id,)
+            )
+
+    def search(self, query: str, limit: int = 20) -> list[SearchResult]:
+        """
+        Returns the messages matching every word of the query, best match first.
+
+        Args:
+            query (str): Plain text, FTS syntax is not interpreted.
+            limit (int): The maximal amount of results.
+
+        Returns:
+            list[SearchResult]: The matching messages.
+        """
+        words = findall(r"\w+", query)
+        if not words:
+            return []
+
+        match_query = " ".join(f'"{word}"' for word in words)
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT message_rows.chat_id, message_rows.message_id, message_text.title,
+                    bm25(message_text)
+                FROM message_text
+                JOIN message_rows ON message_rows.row_id = message_text.rowid
+                WHERE message_text MATCH ?
+                ORDER BY bm25(message_text)
+                LIMIT ?
+                """,
+                (match_query, limit),
+            ).fetchall()
+
+        # bm25 is lower for better matches, flip it so a higher score is better
+        return [
+            SearchResult(chat_id, message_id, title, -score)
+            for chat_id, message_id, title, score in rows
+        ]
+
+    async def build(self, api: "ApiRequests", concurrency: int = 8) -> int:
+        """
+        Indexes every chat of the panel.
+
+        Returns:
+            int: The amount of indexed chats.
+        """
+
+        async def fetch_chat(week_chat) -> dict:
+            return await api.get_chat_by_id(week_chat.id)
+
+        indexed = 0
+        chats = map_bounded(fetch_chat, api.iter_chats(), concurrency)
+        try:
+            async for _, chat, exception in chats:
+                if exception is not None:
+                    raise exception
+
+                self.index_chat(chat)
+                indexed += 1
+        finally:
+            await chats.aclose()
+
+        return indexed
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
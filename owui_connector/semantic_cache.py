@@ -0,0 +1,270 @@
+"""
+This module houses the semantic response cache of the OWUI Connector.
+
+Prompts are embedded through an embedding function (usually the panels Ollama embedding
+endpoint) and stored as normalized rows of a NumPy matrix, so a lookup is a single
+matrix-vector product followed by a top-k selection.
+"""
+
+from json import dumps, loads
+from os import replace
+from typing import Awaitable, Callable, Sequence
+
+import numpy as np
+
+EmbeddingFunction = Callable[[str], Awaitable[Sequence[float]]]
+
+
+class SemanticCacheHit:
+    """
+    SemanticCacheHit represents a cached answer returned by a semantic lookup.
+
+    Attributes:
+        answer (str): The cached answer.
+        prompt (str): The prompt the answer was originally generated for.
+        similarity (float): The cosine similarity between the two prompts.
+    """
+
+    answer: str
+    prompt: str
+    similarity: float
+
+    def __init__(self, answer: str, prompt: str, similarity: float):
+        self.answer = answer
+        self.prompt = prompt
+        self.similarity = similarity
+
+
+class SemanticCache:
+    """
+    A fixed capacity semantic cache with cosine top-k search and LRU eviction.
+
+    Attributes:
+        embed_function (EmbeddingFunction): Coroutine function turning a prompt into a vector.
+        threshold (float): The minimal cosine similarity a cached answer needs to be returned.
+        capacity (int): The maximal amount of cached answers.
+        path (str | None): The file the index is persisted to, if any.
+        vectors (np.ndarray | None): The normalized prompt vectors, one row per slot.
+        last_used (np.ndarray): The LRU tick of every slot.
+        models (list[str]): The model of every slot.
+        prompts (list[str]): The prompt of every slot.
+        answers (list[str]): The answer of every slot.
+        size (int): The amount of filled slots.
+    """
+
+    embed_function: EmbeddingFunction
+    threshold: float
+    capacity: int
+    path: str | None
+    vectors: np.ndarray | None
+    last_used: np.ndarray
+    models: list[str]
+    prompts: list[str]
+    answers: list[str]
+    size: int
+
+    def __init__(
+        self,
+        embed_function: EmbeddingFunction,
+        threshold: float = 0.92,
+        capacity: int = 1024,
+        path: str | None = None,
+    ):
+        if capacity < 1:
+            raise ValueError("The capacity of the semantic cache must be at least 1")
+
+        self.embed_function = embed_function
+        self.threshold = threshold
+        self.capacity = capacity
+        self.path = path
+
+        self.vectors = None
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.models = []
+        self.prompts = []
+        self.answers = []
+        self.size = 0
+        self._tick = 0
+
+        if path is not None:
+            try:
+                self.load(path)
+            except FileNotFoundError:
+                pass
+
+    async def embed(self, prompt: str) -> np.ndarray:
+        """
+        Embeds the given prompt and normalizes the resulting vector.
+
+        Args:
+            prompt (str): The prompt to embed.
+
+        Returns:
+            np.ndarray: The normalized float32 vector of the prompt.
+        """
+        vector = np.asarray(await self.embed_function(prompt), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+
+        return vector
+
+    def search(
+        self, vector: np.ndarray, model: str, top_k: int = 1
+    ) -> list[tuple[int, float]]:
+        """
+        Returns the `top_k` most similar slots for the given model, best match first.
+
+        Args:
+            vector (np.ndarray): A normalized vector returned by `embed`.
+            model (str): Only slots cached for this model are considered.
+            top_k (int): The amount of slots to return.
+
+        Returns:
+            list[tuple[int, float]]: (slot, similarity) pairs.
+        """
+        if self.vectors is None or not self.size:
+            return []
+
+        if self.vectors.shape[1] != vector.shape[0]:
+            raise ValueError(
+                "The embedding dimension does not match the semantic cache index."
+            )
+
+        similarities = self.vectors[: self.size] @ vector
+        model_mask = np.fromiter(
+            (cached_model == model for cached_model in self.models),
+            dtype=bool,
+            count=self.size,
+        )
+        similarities[~model_mask] = -np.inf
+
+        top_k = min(top_k, self.size)
+        candidates = np.argpartition(-similarities, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-similarities[candidates])]
+
+        return [
+            (int(slot), float(similarities[slot]))
+            for slot in candidates
+            if similarities[slot] != -np.inf
+        ]
+
+    def lookup(self, vector: np.ndarray, model: str) -> SemanticCacheHit | None:
+        """
+        Returns the cached answer for the most similar prompt, if it is above the threshold.
+
+        Args:
+            vector (np.ndarray): A normalized vector returned by `embed`.
+            model (str): The model the answer has to be generated with.
+
+        Returns:
+            SemanticCacheHit | None: The cached answer, or None on a miss.
+        """
+        matches = self.search(vector, model)
+        if not matches:
+            return None
+
+        slot, similarity = matches[0]
+        if similarity < self.threshold:
+            return None
+
+        self._touch(slot)
+        return SemanticCacheHit(self.answers[slot], self.prompts[slot], similarity)
+
+    def store(self, vector: np.ndarray, model: str, prompt: str, answer: str):
+        """
+        Stores an answer, evicting the least recently used one if the cache is full.
+
+        Args:
+            vector (np.ndarray): A normalized vector returned by `embed`.
+            model (str): The model the answer was generated with.
+            prompt (str): The prompt the answer was generated for.
+            answer (str): The generated answer.
+        """
+        if self.vectors is None:
+            self.vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+
+        if self.size < self.capacity:
+            slot = self.size
+            self.size += 1
+            self.models.append(model)
+            self.prompts.append(prompt)
+            self.answers.append(answer)
+        else:
+            slot = int(np.argmin(self.last_used))
+            self.models[slot] = model
+            self.prompts[slot] = prompt
+            self.answers[slot] = answer
+
+        self.vectors[slot] = vector
+        self._touch(slot)
+
+    def _touch(self, slot: int):
+        self._tick += 1
+        self.last_used[slot] = self._tick
+
+    def save(self, path: str | None = None):
+        """
+        Persists the index to disk. The file is written next to the target and then
+        moved in place, so a crash never leaves a half written index behind.
+
+        Args:
+            path (str | None): The file to write to. Defaults to the cache's path.
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path given to save the semantic cache to")
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez(
+                file,
+                vectors=(
+                    self.vectors[: self.size]
+                    if self.vectors is not None
+                    else np.zeros((0, 0), dtype=np.float32)
+                ),
+                last_used=self.last_used[: self.size],
+                meta=np.array(
+                    dumps(
+                        {
+                            "models": self.models,
+                            "prompts": self.prompts,
+                            "answers": self.answers,
+                        }
+                    )
+                ),
+            )
+
+        replace(temporary_path, path)
+
+    def load(self, path: str):
+        """
+        Loads an index previously written by `save`. Entries above the capacity are dropped,
+        keeping the most recently used ones.
+
+        Args:
+            path (str): The file to load from.
+        """
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            last_used = data["last_used"]
+            meta = loads(str(data["meta"]))
+
+        keep = np.argsort(-last_used)[: self.capacity]
+        keep.sort()
+
+        self.size = len(keep)
+        self.models = [meta["models"][index] for index in keep]
+        self.prompts = [meta["prompts"][index] for index in keep]
+        self.answers = [meta["answers"][index] for index in keep]
+
+        self.last_used = np.zeros(self.capacity, dtype=np.int64)
+        self.last_used[: self.size] = last_used[keep]
+        self._tick = int(self.last_used.max(initial=0))
+
+        if self.size:
+            self.vectors = np.zeros((self.capacity, vectors.shape[1]), dtype=np.float32)
+            self.vectors[: self.size] = vectors[keep]
+        else:
+            self.vectors = None
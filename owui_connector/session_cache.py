@@ -0,0 +1,171 @@
+"""
+This module houses the session resumption cache of the OWUI Connector.
+
+The results of the handshake with the panel (the panel user, and the socket.io session)
+are stored in a small JSON file, so a freshly started process can skip the round trips
+that are still valid. Everything read from the cache is validated against the panel url,
+a hash of the token and its age, and the connector falls back to a full handshake when
+anything does not match.
+"""
+
+from hashlib import sha256
+from json import dumps, loads
+from os import getpid, replace
+from time import time
+
+from .models import User
+
+
+class SessionCacheEntry:
+    """
+    SessionCacheEntry holds the handshake results loaded from the cache.
+
+    Attributes:
+        user (User | None): The panel user, if it is still fresh.
+        user_saved_at (float): When the panel user was fetched from the panel.
+        session_id (str | None): The socket.io session id, if it is still fresh.
+        transport_id (str | None): The transport id the session was opened with.
+    """
+
+    user: User | None
+    user_saved_at: float
+    session_id: str | None
+    transport_id: str | None
+
+    def __init__(
+        self,
+        user: User | None,
+        user_saved_at: float,
+        session_id: str | None,
+        transport_id: str | None,
+    ):
+        self.user = user
+        self.user_saved_at = user_saved_at
+        self.session_id = session_id
+        self.transport_id = transport_id
+
+
+class SessionCache:
+    """
+    A JSON file caching the handshake results of one panel and token.
+
+    Attributes:
+        path (str): The cache file.
+        user_ttl (float): How long the cached panel user is trusted, in seconds.
+        session_ttl (float): How long a cached session id is tried, in seconds. The panel
+            drops idle sessions after its ping timeout, so this should stay short.
+        resume_session (bool): Whether session ids are cached at all. Two live processes
+            must never share one session, so only enable this for workers that run one
+            after the other.
+    """
+
+    path: str
+    user_ttl: float
+    session_ttl: float
+    resume_session: bool
+
+    def __init__(
+        self,
+        path: str,
+        user_ttl: float = 3600.0,
+        session_ttl: float = 15.0,
+        resume_session: bool = False,
+    ):
+        self.path = path
+        self.user_ttl = user_ttl
+        self.session_ttl = session_ttl
+        self.resume_session = resume_session
+
+    @staticmethod
+    def _hash_token(token: str) -> str:
+        # never write the token itself to the disk
+        return sha256(token.encode("utf-8")).hexdigest()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = loads(file.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+        return data if isinstance(data, dict) else {}
+
+    def load(self, base_url: str, token: str) -> SessionCacheEntry:
+        """
+        Returns the cached handshake results that are still valid for the given panel.
+        """
+        data = self._read()
+        if data.get("base_url") != base_url:
+            return SessionCacheEntry(None, 0.0, None, None)
+
+        if data.get("token_hash") != self._hash_token(token):
+            return SessionCacheEntry(None, 0.0, None, None)
+
+        now = time()
+
+        user = None
+        user_data = data.get("user")
+        if (
+            isinstance(user_data, dict)
+            and now - data.get("user_saved_at", 0) < self.user_ttl
+        ):
+            try:
+                user = User(
+                    user_data["id"],
+                    user_data["email"],
+                    user_data["name"],
+                    user_data["role"],
+                    user_data["profile_image_url"],
+                )
+            except KeyError:
+                user = None
+
+        session_id = None
+        transport_id = None
+        if (
+            self.resume_session
+            and now - data.get("session_saved_at", 0) < self.session_ttl
+        ):
+            session_id = data.get("session_id") or None
+            transport_id = data.get("transport_id") or None
+
+        return SessionCacheEntry(
+            user, data.get("user_saved_at", 0.0), session_id, transport_id
+        )
+
+    def save(
+        self,
+        base_url: str,
+        token: str,
+        user: User | None,
+        session_id: str | None,
+        transport_id: str | None,
+        user_saved_at: float | None = None,
+    ):
+        """
+        Stores the handshake results. The file is replaced atomically, so concurrently
+        starting workers never read a half written cache.
+        """
+        now = time()
+        data = {
+            "base_url": base_url,
+            "token_hash": self._hash_token(token),
+            "user": user.__dict__ if user is not None else None,
+            "user_saved_at": user_saved_at or now,
+            "session_id": session_id,
+            "transport_id": transport_id,
+            "session_saved_at": now if session_id else 0,
+        }
+
+        temporary_path = f"{self.path}.{getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(dumps(data))
+
+        replace(temporary_path, self.path)
+
+    def forget_session(self, base_url: str, token: str):
+        """
+        Drops the cached session id, keeping the cached panel user.
+        """
+        entry = self.load(base_url, token)
+        self.save(base_url, token, entry.user, None, None, entry.user_saved_at)
@@ -0,0 +1,234 @@
+"""
+This module houses the long-lived socket.io client of the OWUI Connector.
+
+The client keeps the websocket of the panel open in a background task, answers the
+engine.io pings, reconnects with an exponential backoff (re-authenticating the session on
+the way) and dispatches the events of the server to subscribed callbacks.
+"""
+
+from json import dumps
+from typing import TYPE_CHECKING, Any, Callable
+
+from scarletio import (
+    CancelledError,
+    Event,
+    Task,
+    from_json,
+    get_or_create_event_loop,
+    is_coroutine,
+    sleep,
+)
+from scarletio.web_common import ConnectionClosed
+from scarletio.web_socket import WebSocketClient
+
+if TYPE_CHECKING:
+    from .api_requests import ApiRequests
+
+# engine.io packet types
+ENGINE_IO_OPEN = "0"
+ENGINE_IO_CLOSE = "1"
+ENGINE_IO_PING = "2"
+ENGINE_IO_PONG = "3"
+ENGINE_IO_MESSAGE = "4"
+ENGINE_IO_UPGRADE = "5"
+ENGINE_IO_NOOP = "6"
+
+# socket.io packet types, prefixed with the engine.io message type
+SOCKET_IO_EVENT = "42"
+SOCKET_IO_CONNECT_ERROR = "44"
+
+EventCallback = Callable[[Any], Any]
+
+
+class SocketIoClient:
+    """
+    A persistent socket.io connection to the panel.
+
+    Attributes:
+        api (ApiRequests): The api the connection belongs to.
+        subscribers (dict[str, list[EventCallback]]): The callbacks of every event name.
+        web_socket (WebSocketClient | None): The currently open websocket, if any.
+        connected (Event): Set while the websocket is open and upgraded.
+        task (Task | None): The background task keeping the connection alive.
+        initial_reconnect_delay (float): The first delay before reconnecting, in seconds.
+        max_reconnect_delay (float): The upper bound of the reconnect delay, in seconds.
+    """
+
+    api: "ApiRequests"
+    subscribers: dict[str, list[EventCallback]]
+    web_socket: WebSocketClient | None
+    connected: Event
+    task: Task | None
+    initial_reconnect_delay: float
+    max_reconnect_delay: float
+
+    def __init__(
+        self,
+        api: "ApiRequests",
+        initial_reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 60.0,
+    ):
+        self.api = api
+        self.subscribers = {}
+        self.web_socket = None
+        self.connected = Event(get_or_create_event_loop())
+        self.task = None
+        self.initial_reconnect_delay = initial_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+    def subscribe(self, event: str, callback: EventCallback):
+        """
+        Registers a callback for a server event. Coroutine callbacks are scheduled as tasks.
+        """
+        self.subscribers.setdefault(event, []).append(callback)
+
+    def unsubscribe(self, event: str, callback: EventCallback):
+        callbacks = self.subscribers.get(event)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+
+    def start(self, resumed: bool = False):
+        """
+        Starts the background task. If `resumed` is set, the session of the api comes from a
+        cache and is replaced immediately if it turns out to be stale.
+        """
+        if self.task is None or self.task.is_done():
+            self.task = get_or_create_event_loop().create_task(self._run(resumed))
+
+    async def stop(self):
+        task = self.task
+        self.task = None
+        if task is not None and not task.is_done():
+            task.cancel()
+
+        web_socket = self.web_socket
+        if web_socket is not None:
+            await web_socket.close()
+
+    async def emit(self, event: str, data: Any):
+        if self.web_socket is None:
+            raise ConnectionError("The websocket of the OpenWebUi panel is not open")
+
+        await self.web_socket.send(SOCKET_IO_EVENT + dumps([event, data]))
+
+    async def _run(self, resumed: bool):
+        loop = get_or_create_event_loop()
+        delay = self.initial_reconnect_delay
+        reconnecting = False
+
+        while True:
+            try:
+                if reconnecting:
+                    # the old session died with the connection, so lets open a new one
+                    await self.api.open_session()
+
+                await self._connect_once()
+                delay = self.initial_reconnect_delay
+
+            except CancelledError:
+                raise
+
+            except (ConnectionError, ConnectionClosed, OSError, TimeoutError) as error:
+                print(f"OpenWebUI Connector - Websocket connection lost: {error!r}")
+
+            except Exception as error:
+                # a malformed handshake must not end the reconnects either
+                print(f"OpenWebUI Connector - Websocket connection failed: {error!r}")
+
+            reconnecting = True
+            if resumed:
+                resumed = False
+                continue
+
+            await sleep(delay, loop)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _connect_once(self):
+        async with self.api.http_client.connect_web_socket(
+            f"{self.api.ws_url}/ws/socket.io/?EIO=4&transport=websocket&sid={self.api.session_id}",
+        ) as web_socket:
+            if not web_socket:
+                raise ConnectionError("Failed to connect to the OpenWebUi panel")
+
+            try:
+                await web_socket.ensure_open()
+                await self._upgrade(web_socket)
+
+                self.web_socket = web_socket
+                self.api.ws_connection = web_socket
+                self.connected.set()
+
+                await self.emit("user-join", {"auth": {"token": self.api.token}})
+
+                while True:
+                    message = await web_socket.receive()
+                    if not await self._handle_message(web_socket, message):
+                        return
+            finally:
+                self.web_socket = None
+                self.connected.clear()
+
+    async def _upgrade(self, web_socket: WebSocketClient):
+        """
+        Upgrades the polling session to the websocket transport.
+        """
+        await web_socket.send(ENGINE_IO_PING + "probe")
+
+        while True:
+            message = await web_socket.receive()
+            if message == ENGINE_IO_PONG + "probe":
+                await web_socket.send(ENGINE_IO_UPGRADE)
+                return
+
+            if message == ENGINE_IO_PING:
+                await web_socket.send(ENGINE_IO_PONG)
+                continue
+
+            print(f"OpenWebUI Connector - Unhandled Websocket event: {message}")
+
+    async def _handle_message(self, web_socket: WebSocketClient, message) -> bool:
+        """
+        Handles one engine.io packet. Returns False if the server closed the session.
+        """
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            message = bytes(message).decode("utf-8")
+
+        if message == ENGINE_IO_PING:
+            await web_socket.send(ENGINE_IO_PONG)
+            return True
+
+        if message == ENGINE_IO_CLOSE:
+            return False
+
+        if message.startswith(SOCKET_IO_CONNECT_ERROR):
+            raise ConnectionError(
+                f"The OpenWebUi panel refused the socket.io session: {message[2:]}"
+            )
+
+        if message.startswith(SOCKET_IO_EVENT):
+            # events might carry an ack id between the type and the payload
+            payload = from_json(message[2:].lstrip("0123456789"))
+            if isinstance(payload, list) and payload:
+                self._dispatch(payload[0], payload[1] if len(payload) > 1 else None)
+
+        return True
+
+    def _dispatch(self, event: str, data: Any):
+        loop = get_or_create_event_loop()
+
+        for callback in list(self.subscribers.get(event, ())):
+            # a failing callback must not take the connection down with it
+            try:
+                result = callback(data)
+            except Exception as error:
+                print(f"OpenWebUI Connector - The {event} callback failed: {error!r}")
+                continue
+
+            if is_coroutine(result):
+                loop.create_task(self._run_callback(event, result))
+
+    async def _run_callback(self, event: str, coroutine):
+        try:
+            await coroutine
+        except Exception as error:
+            print(f"OpenWebUI Connector - The {event} callback failed: {error!r}")
@@ -0,0 +1,173 @@
+"""
+This module houses the transformation modes of the Ollama stream.
+
+Ollama sends one JSON frame per token, which wakes a consumer up thousands of times per
+reply. The sentence mode yields whole sentences, for text to speech, and the coalesced mode
+merges the frames arriving within a time window, for rendering.
+"""
+
+from re import compile as compile_regex
+from typing import AsyncGenerator, AsyncIterator
+
+from scarletio import Future, get_or_create_event_loop
+
+# the end of a sentence is only known once the whitespace after it arrived
+SENTENCE_END = compile_regex(r"[.!?…]+[\"'”’)\]]*(?=\s)|\n")
+
+
+class SentenceSegmenter:
+    """
+    Splits a text arriving in pieces into sentences.
+
+    Attributes:
+        buffer (str): The text of the unfinished sentence.
+    """
+
+    buffer: str
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        """
+        Adds the next piece of the text, and returns the sentences it finished.
+        """
+        self.buffer += text
+
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            sentence = self.buffer[start : match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+
+            start = match.end()
+
+        if start:
+            self.buffer = self.buffer[start:]
+
+        return sentences
+
+    def flush(self) -> str | None:
+        """
+        Returns the unfinished sentence at the end of the text, if any.
+        """
+        sentence = self.buffer.strip()
+        self.buffer = ""
+        return sentence or None
+
+
+def get_last_sentence(text: str) -> str:
+    segmenter = SentenceSegmenter()
+    sentences = segmenter.feed(text)
+    last_sentence = segmenter.flush()
+    if last_sentence is not None:
+        return last_sentence
+
+    return sentences[-1] if sentences else ""
+
+
+async def iter_sentences(stream: AsyncIterator[dict]) -> AsyncGenerator[str, None]:
+    """
+    Yields the whole sentences of an Ollama stream.
+    """
+    segmenter = SentenceSegmenter()
+
+    async for chunk in stream:
+        for sentence in segmenter.feed(chunk["message"]["content"]):
+            yield sentence
+
+    last_sentence = segmenter.flush()
+    if last_sentence is not None:
+        yield last_sentence
+
+
+def _merge_chunks(chunks: list[dict]) -> dict:
+    # the last chunk carries the done flag and the statistics of the reply
+    last_chunk = chunks[-1]
+    return {
+        **last_chunk,
+        "message": {
+            **last_chunk["message"],
+            "content": "".join(chunk["message"]["content"] for chunk in chunks),
+        },
+    }
+
+
+async def coalesce_stream(
+    stream: AsyncIterator[dict],
+    interval: float = 0.05,
+    max_chars: int | None = None,
+) -> AsyncGenerator[dict, None]:
+    """
+    Merges the Ollama frames arriving within `interval` seconds into one frame.
+
+    Args:
+        stream (AsyncIterator[dict]): The Ollama stream, for example a `StreamHandle`.
+        interval (float): The time window of a merged frame, starting with its first token.
+        max_chars (int | None): Emits the frame early, once it holds this many characters.
+    """
+    loop = get_or_create_event_loop()
+    pending: list[dict] = []
+    pending_chars = 0
+    finished = False
+    exception = None
+    wake_up = None
+
+    def notify():
+        if wake_up is not None:
+            wake_up.set_result_if_pending(None)
+
+    async def read():
+        nonlocal pending_chars, finished, exception
+
+        try:
+            async for chunk in stream:
+                pending.append(chunk)
+                pending_chars += len(chunk["message"]["content"])
+                if (
+                    len(pending) == 1
+                    or chunk.get("done") is True
+                    or (max_chars is not None and pending_chars >= max_chars)
+                ):
+                    notify()
+
+        except Exception as error:
+            exception = error
+
+        finally:
+            finished = True
+            notify()
+
+    reader = loop.create_task(read())
+    try:
+        while True:
+            if not pending:
+                if finished:
+                    break
+
+                wake_up = Future(loop)
+                await wake_up
+                continue
+
+            window_full = finished or pending[-1].get("done") is True
+            if max_chars is not None and pending_chars >= max_chars:
+                window_full = True
+
+            if not window_full:
+                wake_up = Future(loop)
+                timer = loop.call_after(interval, wake_up.set_result_if_pending, None)
+                await wake_up
+                timer.cancel()
+
+            chunks = pending[:]
+            pending.clear()
+            pending_chars = 0
+            yield _merge_chunks(chunks)
+
+        if exception is not None:
+            raise exception
+
+    finally:
+        if not reader.is_done():
+            reader.cancel()
@@ -0,0 +1,370 @@
+"""
+This module houses the control surface of streamed generations.
+
+A streamed request returns a `StreamHandle`. It is iterated like the plain generator it
+wraps, and can cancel the generation at any time: the HTTP response is closed, which makes
+Ollama abort the generation and free the model slot, and the partial reply is persisted to
+the panel marked as cancelled. `StopConditions` end a generation early from the client side.
+"""
+
+from time import monotonic
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Callable, Coroutine
+
+from scarletio import (
+    AsyncQueue,
+    CancelledError,
+    Event,
+    Task,
+    get_or_create_event_loop,
+)
+from scarletio.http_client.client_response import ClientResponse
+
+from .stream_modes import coalesce_stream, iter_sentences
+
+if TYPE_CHECKING:
+    from .models import ModelChatResponse
+
+# the reasons a stream ended before the model finished it
+STOP_REASON_STOP_SEQUENCE = "stop"
+STOP_REASON_MAX_TOKENS = "length"
+STOP_REASON_DEADLINE = "deadline"
+STOP_REASON_TIMEOUT = "timeout"
+STOP_REASON_CANCELLED = "cancelled"
+
+
+class StopConditions:
+    """
+    Client side conditions ending a streamed generation.
+
+    Attributes:
+        stop_sequences (list[str]): The reply is cut before the first of these.
+        max_tokens (int | None): The maximal amount of streamed tokens. Ollama sends one
+            token per chunk, so chunks are counted.
+        deadline (float | None): A `time.monotonic` timestamp after which the generation
+            is stopped, even if the model stalls.
+    """
+
+    stop_sequences: list[str]
+    max_tokens: int | None
+    deadline: float | None
+
+    def __init__(
+        self,
+        stop_sequences: list[str] | None = None,
+        max_tokens: int | None = None,
+        deadline: float | None = None,
+    ):
+        self.stop_sequences = [
+            sequence for sequence in stop_sequences or [] if sequence
+        ]
+        self.max_tokens = max_tokens
+        self.deadline = deadline
+
+    @classmethod
+    def with_timeout(
+        cls,
+        timeout: float,
+        stop_sequences: list[str] | None = None,
+        max_tokens: int | None = None,
+    ) -> "StopConditions":
+        return cls(stop_sequences, max_tokens, monotonic() + timeout)
+
+    def split(self, text: str) -> tuple[str, str, bool]:
+        """
+        Splits the not yet emitted text of a stream.
+
+        A stop sequence might arrive spread over several chunks, so the end of the text
+        that could still turn into one is held back.
+
+        Returns:
+            tuple[str, str, bool]: The text to emit, the text to hold back, and whether a
+                stop sequence was found.
+        """
+        stop_index = -1
+        for sequence in self.stop_sequences:
+            index = text.find(sequence)
+            if index != -1 and (stop_index == -1 or index < stop_index):
+                stop_index = index
+
+        if stop_index != -1:
+            return text[:stop_index], "", True
+
+        held = 0
+        for sequence in self.stop_sequences:
+            for length in range(min(len(sequence) - 1, len(text)), held, -1):
+                if sequence.startswith(text[-length:]):
+                    held = length
+                    break
+
+        return text[: len(text) - held], text[len(text) - held :], False
+
+
+class StreamHandle:
+    """
+    A streamed generation, that can be iterated and cancelled.
+
+    Attributes:
+        stream (AsyncGenerator | None): The generator producing the Ollama chunks.
+        message (ModelChatResponse | None): The message being generated. Its
+            `last_sentence` is kept up to date while streaming.
+        response (ClientResponse | None): The open HTTP response of the generation.
+        stop_reason (str | None): Why the stream ended early, None if the model finished.
+        finished (Event): Set once the stream ended and its persistence was scheduled.
+        completion_task (Task | None): The task persisting the reply to the panel.
+    """
+
+    stream: AsyncGenerator | None
+    message: "ModelChatResponse | None"
+    response: ClientResponse | None
+    stop_reason: str | None
+    finished: Event
+    completion_task: Task | None
+
+    def __init__(self):
+        self.stream = None
+        self.message = None
+        self.response = None
+        self.stop_reason = None
+        self.finished = Event(get_or_create_event_loop())
+        self.completion_task = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.stop_reason == STOP_REASON_CANCELLED
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        return await self.stream.__anext__()
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+    def sentences(self) -> AsyncGenerator[str, None]:
+        """
+        Iterates the reply sentence by sentence, instead of token by token.
+        """
+        return iter_sentences(self)
+
+    def coalesced(
+        self, interval: float = 0.05, max_chars: int | None = None
+    ) -> AsyncGenerator[dict, None]:
+        """
+        Iterates the reply in frames, merging the tokens arriving within `interval` seconds.
+        """
+        return coalesce_stream(self, interval, max_chars)
+
+    def abort(self, reason: str):
+        """
+        Closes the HTTP response, without waiting for the stream to wind down.
+        """
+        if self.stop_reason is None:
+            self.stop_reason = reason
+
+        if self.response is not None:
+            self.response.close()
+
+    async def cancel(self):
+        """
+        Cancels the generation, and waits until the partial reply is persisted.
+        """
+        if not self.finished.is_set():
+            self.abort(STOP_REASON_CANCELLED)
+
+        if self.stream.ag_running:
+            # the consumer is waiting for a chunk, it wakes up with the closed response
+            await self.finished
+        else:
+            await self.stream.aclose()
+
+        if self.completion_task is not None:
+            await self.completion_task
+
+
+class IdleWatchdog:
+    """
+    Aborts a stream whose first chunk, or whose next chunk, takes too long.
+
+    Instead of restarting a timer for every chunk, the timer only checks the time of the
+    last chunk when it fires, and restarts itself for the rest of the timeout.
+
+    Attributes:
+        handle (StreamHandle): The stream to abort.
+        first_byte_timeout (float | None): How long the first chunk may take, in seconds.
+        idle_timeout (float | None): How long the next chunk may take, in seconds.
+        last_chunk_at (float | None): When the last chunk arrived, on the monotonic clock.
+    """
+
+    handle: StreamHandle
+    first_byte_timeout: float | None
+    idle_timeout: float | None
+    last_chunk_at: float | None
+
+    def __init__(
+        self,
+        handle: StreamHandle,
+        first_byte_timeout: float | None,
+        idle_timeout: float | None,
+    ):
+        self.handle = handle
+        self.first_byte_timeout = first_byte_timeout
+        self.idle_timeout = idle_timeout
+        self.last_chunk_at = None
+        self._started_at = monotonic()
+        self._timer = None
+        self._start_timer(
+            first_byte_timeout if first_byte_timeout is not None else idle_timeout
+        )
+
+    def _start_timer(self, delay: float | None):
+        self._timer = (
+            None
+            if delay is None
+            else get_or_create_event_loop().call_after(delay, self._check)
+        )
+
+    def _check(self):
+        if self.last_chunk_at is None:
+            since = self._started_at
+            timeout = (
+                self.first_byte_timeout
+                if self.first_byte_timeout is not None
+                else self.idle_timeout
+            )
+        else:
+            since = self.last_chunk_at
+            timeout = self.idle_timeout
+
+        if timeout is None:
+            self._timer = None
+            return
+
+        remaining = since + timeout - monotonic()
+        if remaining > 0.0:
+            self._start_timer(remaining)
+            return
+
+        self._timer = None
+        self.handle.abort(STOP_REASON_TIMEOUT)
+
+    def feed(self):
+        first = self.last_chunk_at is None
+        self.last_chunk_at = monotonic()
+        if first and self.first_byte_timeout is not None:
+            # the first chunk timer may run far longer than the idle timeout
+            self.stop()
+            self._start_timer(self.idle_timeout)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+class ComparisonStream:
+    """
+    The streams of several models answering the same prompt, merged in arrival order.
+
+    Iterating it yields `(model, chunk)` tuples. Once every stream ended, the replies are
+    synced to the panel together, so the total time is the one of the slowest model.
+
+    Attributes:
+        handles (dict[str, StreamHandle]): The stream of every model.
+        errors (dict[str, Exception]): The models whose stream failed, with the error.
+        completion_task (Task | None): The task syncing the replies to the panel.
+    """
+
+    handles: dict[str, StreamHandle]
+    errors: dict[str, Exception]
+    completion_task: Task | None
+
+    def __init__(
+        self,
+        handles: dict[str, StreamHandle],
+        sync: Callable[[], Coroutine[Any, Any, Any]],
+    ):
+        self.handles = handles
+        self.errors = {}
+        self.completion_task = None
+        self._sync = sync
+        self._stream = self._merge()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple[str, dict]:
+        return await self._stream.__anext__()
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+    async def cancel(self):
+        """
+        Cancels every generation, and waits until the partial replies are persisted.
+        """
+        await self._stream.aclose()
+        if self.completion_task is not None:
+            await self.completion_task
+
+    async def collect(self) -> dict[str, str]:
+        """
+        Waits for every reply, and returns the content of each by model.
+        """
+        contents = {model: "" for model in self.handles}
+        async for model, chunk in self:
+            contents[model] += chunk["message"]["content"]
+
+        if self.completion_task is not None:
+            await self.completion_task
+
+        return contents
+
+    async def _pump(self, model: str, handle: StreamHandle, queue: AsyncQueue):
+        try:
+            async for chunk in handle:
+                queue.set_result((model, chunk))
+
+        except CancelledError:
+            raise
+
+        except Exception as error:
+            self.errors[model] = error
+
+        finally:
+            queue.set_result(None)
+
+    async def _merge(self):
+        loop = get_or_create_event_loop()
+        queue = AsyncQueue(loop)
+        pumps = [
+            loop.create_task(self._pump(model, handle, queue))
+            for model, handle in self.handles.items()
+        ]
+
+        try:
+            remaining = len(pumps)
+            while remaining:
+                item = await queue
+                if item is None:
+                    remaining -= 1
+                    continue
+
+                yield item
+
+        finally:
+            # cancelling a pump cancels its stream, which stores the partial reply
+            for pump in pumps:
+                if not pump.is_done():
+                    pump.cancel()
+
+            self.completion_task = loop.create_task(self._finish(pumps))
+
+    async def _finish(self, pumps: list[Task]):
+        for pump in pumps:
+            try:
+                await pump
+            except CancelledError:
+                pass
+
+        await self._sync()
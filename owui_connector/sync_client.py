@@ -0,0 +1,221 @@
+"""
+This module houses a thread-safe synchronous facade of the OWUI Connector.
+
+scarletio runs its event loop in a dedicated thread, so the facade does not need a loop of
+its own: every blocking call is handed over to the loop of the connector and waited on.
+Calls from any amount of threads share the same connector and the same connection pool.
+"""
+
+from typing import Any, AsyncGenerator, Callable, Iterator
+
+from scarletio import EventThread
+
+from .connector import OpenWebUiConnector
+from .deadline import Deadline
+from .models import BulkDeleteResult, UploadedFile, WeekChatReference
+from .scheduler import PRIORITY_INTERACTIVE
+from .streaming import StopConditions, StreamHandle
+
+
+async def _next_item(async_generator: AsyncGenerator):
+    return await async_generator.__anext__()
+
+
+class SyncStream:
+    """
+    A blocking iterator over an async generator running on the connector loop.
+
+    Every `next` call advances the generator by one item on the loop, so nothing is
+    buffered and a slow consumer slows the producer down instead of piling up items.
+
+    Attributes:
+        loop (EventThread): The loop the generator runs on.
+        async_generator (AsyncGenerator): The wrapped generator.
+        timeout (float | None): The maximal time to wait for a single item, in seconds.
+    """
+
+    loop: EventThread
+    async_generator: AsyncGenerator
+    timeout: float | None
+
+    def __init__(
+        self,
+        loop: EventThread,
+        async_generator: AsyncGenerator,
+        timeout: float | None = None,
+    ):
+        self.loop = loop
+        self.async_generator = async_generator
+        self.timeout = timeout
+        self._closed = False
+
+    def __iter__(self) -> Iterator[Any]:
+        return self
+
+    def __next__(self) -> Any:
+        if self._closed:
+            raise StopIteration
+
+        try:
+            return self.loop.run(_next_item(self.async_generator), self.timeout)
+        except StopAsyncIteration:
+            self._closed = True
+            raise StopIteration from None
+
+    def close(self):
+        """
+        Stops the generator early, running its cleanup on the loop.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        if isinstance(self.async_generator, StreamHandle):
+            # cancelling also aborts the generation and persists the partial reply
+            self.loop.run(self.async_generator.cancel(), self.timeout)
+        else:
+            self.loop.run(self.async_generator.aclose(), self.timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.close()
+
+
+class SyncOpenWebUiConnector:
+    """
+    A blocking, thread-safe wrapper around `OpenWebUiConnector`.
+
+    Attributes:
+        connector (OpenWebUiConnector): The wrapped asynchronous connector.
+        loop (EventThread): The loop of the connector. Every thread calling into the
+            facade uses this one, `get_or_create_event_loop` would give each thread its own.
+        timeout (float | None): The default timeout of blocking calls, in seconds.
+    """
+
+    connector: OpenWebUiConnector
+    loop: EventThread
+    timeout: float | None
+
+    def __init__(
+        self,
+        host: str,
+        token: str,
+        port: int = 8080,
+        is_ssl: bool = False,
+        timeout: float | None = None,
+    ):
+        self.connector = OpenWebUiConnector(host, token, port, is_ssl)
+        self.loop = self.connector.api.http_client.loop
+        self.timeout = timeout
+
+    def _run(self, coroutine) -> Any:
+        return self.loop.run(coroutine, self.timeout)
+
+    def connect(self):
+        self._run(self.connector.api.connect())
+
+    def disconnect(self):
+        self._run(self.connector.api.close())
+
+    def chat(
+        self,
+        chat_title: str,
+        model: str,
+        content: str,
+        stream: bool = True,
+        stop_conditions: StopConditions | None = None,
+        files: list[str | UploadedFile] | None = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+    ) -> SyncStream | dict:
+        """
+        Sends a message to a chat, creating the chat if needed. Streamed responses are
+        returned as a `SyncStream` of Ollama chunks, closing it cancels the generation.
+        """
+        response = self._run(
+            self.connector.chat(
+                chat_title,
+                model,
+                content,
+                stream,
+                stop_conditions,
+                files,
+                priority,
+                tenant,
+                deadline,
+            )
+        )
+        if stream:
+            return SyncStream(self.loop, response, self.timeout)
+
+        return response
+
+    def compare(
+        self,
+        chat_title: str,
+        models: list[str],
+        content: str,
+        stop_conditions: StopConditions | None = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        tenant: str | None = None,
+        deadline: Deadline | None = None,
+    ) -> SyncStream:
+        """
+        Sends one message to several models at once, returning a `SyncStream` of
+        `(model, chunk)` tuples.
+        """
+        comparison = self._run(
+            self.connector.compare(
+                chat_title,
+                models,
+                content,
+                stop_conditions,
+                priority,
+                tenant,
+                deadline,
+            )
+        )
+        return SyncStream(self.loop, comparison, self.timeout)
+
+    def upload_files(
+        self, paths: list[str], concurrency: int = 4
+    ) -> list[UploadedFile]:
+        return self._run(self.connector.upload_files(paths, concurrency))
+
+    def delete_chat(self, chat_title: str = "", chat_id: str = ""):
+        return self._run(self.connector.delete_chat(chat_title, chat_id))
+
+    def delete_chats(
+        self,
+        predicate: Callable[[WeekChatReference], bool] | None = None,
+        chat_ids: list[str] | None = None,
+        chat_titles: list[str] | None = None,
+        concurrency: int = 8,
+    ) -> BulkDeleteResult:
+        return self._run(
+            self.connector.delete_chats(predicate, chat_ids, chat_titles, concurrency)
+        )
+
+    def iter_chats(
+        self, updated_since: int | None = None, title_prefix: str | None = None
+    ) -> SyncStream:
+        return SyncStream(
+            self.loop,
+            self.connector.api.iter_chats(updated_since, title_prefix),
+            self.timeout,
+        )
+
+    def list_chats(
+        self, updated_since: int | None = None, title_prefix: str | None = None
+    ) -> list[WeekChatReference]:
+        with self.iter_chats(updated_since, title_prefix) as chats:
+            return list(chats)
+
+    def get_chat_by_title(self, chat_title: str) -> dict | None:
+        return self._run(self.connector.api.get_chat_by_title(chat_title))
+
+    def get_chat_by_id(self, chat_id: str) -> dict:
+        return self._run(self.connector.api.get_chat_by_id(chat_id))
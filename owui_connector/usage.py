@@ -0,0 +1,259 @@
+"""
+This module houses the token usage ledger of the OWUI Connector.
+
+Every completion synced to the panel is recorded as one row of a set of NumPy columns that
+grow by doubling. Models, chats and users are stored as integer codes, and the timestamps
+only grow, so a rolling window is found with a binary search and aggregated with vectorized
+operations instead of a loop over the rows.
+"""
+
+from csv import writer as csv_writer
+from time import time
+
+import numpy as np
+
+from .models import ModelChatResponseInfo
+
+# the numeric columns of the ledger, with their types
+COLUMNS = {
+    "timestamp": np.float64,
+    "prompt_tokens": np.int64,
+    "completion_tokens": np.int64,
+    "total_duration": np.int64,
+    "load_duration": np.int64,
+    "prompt_eval_duration": np.int64,
+    "eval_duration": np.int64,
+    "cancelled": np.bool_,
+    "model": np.int32,
+    "chat": np.int32,
+    "user": np.int32,
+}
+
+# the columns holding the codes of a name
+NAME_COLUMNS = ("model", "chat", "user")
+
+
+class UsageLedger:
+    """
+    An in-memory, column oriented record of the token usage of every completion.
+
+    Attributes:
+        size (int): The amount of recorded completions.
+        columns (dict[str, np.ndarray]): The columns, only the first `size` rows are used.
+        names (dict[str, list[str]]): The names of the models, chats and users by code.
+    """
+
+    size: int
+    columns: dict[str, np.ndarray]
+    names: dict[str, list[str]]
+
+    def __init__(self, capacity: int = 1024):
+        if capacity < 1:
+            raise ValueError("The capacity of the usage ledger must be at least 1")
+
+        self.size = 0
+        self.columns = {
+            name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS.items()
+        }
+        self.names = {column: [] for column in NAME_COLUMNS}
+        self._codes: dict[str, dict[str, int]] = {column: {} for column in NAME_COLUMNS}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _encode(self, column: str, name: str) -> int:
+        codes = self._codes[column]
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(codes)
+            self.names[column].append(name)
+
+        return code
+
+    def record(
+        self,
+        model: str,
+        chat_id: str,
+        user_id: str,
+        info: ModelChatResponseInfo,
+        cancelled: bool = False,
+        timestamp: float | None = None,
+    ):
+        """
+        Appends one completion to the ledger.
+        """
+        if self.size == len(self.columns["timestamp"]):
+            for name, column in self.columns.items():
+                grown = np.zeros(len(column) * 2, dtype=column.dtype)
+                grown[: self.size] = column
+                self.columns[name] = grown
+
+        timestamp = time() if timestamp is None else timestamp
+        if self.size:
+            # the window lookups rely on sorted timestamps, even if the clock jumps back
+            timestamp = max(timestamp, self.columns["timestamp"][self.size - 1])
+
+        row = self.size
+        self.columns["timestamp"][row] = timestamp
+        self.columns["prompt_tokens"][row] = info.prompt_eval_count
+        self.columns["completion_tokens"][row] = info.eval_count
+        self.columns["total_duration"][row] = info.total_duration
+        self.columns["load_duration"][row] = info.load_duration
+        self.columns["prompt_eval_duration"][row] = info.prompt_eval_duration
+        self.columns["eval_duration"][row] = info.eval_duration
+        self.columns["cancelled"][row] = cancelled
+        self.columns["model"][row] = self._encode("model", model)
+        self.columns["chat"][row] = self._encode("chat", chat_id)
+        self.columns["user"][row] = self._encode("user", user_id)
+        self.size += 1
+
+    def select(
+        self,
+        window: float | None = None,
+        now: float | None = None,
+        model: str | None = None,
+        chat_id: str | None = None,
+        user_id: str | None = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        Returns the columns of the completions of the last `window` seconds, optionally
+        filtered by model, chat and user. Without filters the columns are views.
+        """
+        start = 0
+        if window is not None:
+            now = time() if now is None else now
+            start = int(
+                np.searchsorted(
+                    self.columns["timestamp"][: self.size], now - window, "left"
+                )
+            )
+
+        columns = {
+            name: column[start : self.size] for name, column in self.columns.items()
+        }
+
+        mask = None
+        for column, name in zip(NAME_COLUMNS, (model, chat_id, user_id), strict=True):
+            if name is None:
+                continue
+
+            code = self._codes[column].get(name)
+            matches = (
+                columns[column] == code
+                if code is not None
+                else np.zeros(len(columns[column]), dtype=np.bool_)
+            )
+            mask = matches if mask is None else mask & matches
+
+        if mask is not None:
+            columns = {name: column[mask] for name, column in columns.items()}
+
+        return columns
+
+    def tokens_per_minute(
+        self,
+        window: float = 60.0,
+        now: float | None = None,
+        model: str | None = None,
+        user_id: str | None = None,
+    ) -> float:
+        """
+        The prompt and completion tokens of the last `window` seconds, per minute.
+        """
+        columns = self.select(window, now, model, user_id=user_id)
+        tokens = columns["prompt_tokens"].sum() + columns["completion_tokens"].sum()
+        return float(tokens) * 60.0 / window
+
+    def eval_speed_percentile(
+        self,
+        percentile: float = 95.0,
+        window: float = 300.0,
+        now: float | None = None,
+        model: str | None = None,
+    ) -> float | None:
+        """
+        The percentile of the generation speed in tokens per second, over the completions
+        of the last `window` seconds. None if there were none.
+        """
+        columns = self.select(window, now, model)
+        durations = columns["eval_duration"]
+        measured = durations > 0
+        if not measured.any():
+            return None
+
+        # the durations are in nanoseconds
+        speeds = columns["completion_tokens"][measured] * 1e9 / durations[measured]
+        return float(np.percentile(speeds, percentile))
+
+    def totals(
+        self, by: str = "model", window: float | None = None, now: float | None = None
+    ) -> dict[str, dict[str, int]]:
+        """
+        The requests and tokens of every model, chat or user.
+
+        Args:
+            by (str): One of "model", "chat" and "user".
+            window (float | None): Only counts the last `window` seconds, if given.
+        """
+        if by not in NAME_COLUMNS:
+            raise ValueError(f"Can not group the usage by {by}")
+
+        columns = self.select(window, now)
+        names = self.names[by]
+        codes = columns[by]
+
+        requests = np.bincount(codes, minlength=len(names))
+        prompt_tokens = np.bincount(
+            codes, weights=columns["prompt_tokens"], minlength=len(names)
+        )
+        completion_tokens = np.bincount(
+            codes, weights=columns["completion_tokens"], minlength=len(names)
+        )
+
+        return {
+            names[code]: {
+                "requests": int(requests[code]),
+                "prompt_tokens": int(prompt_tokens[code]),
+                "completion_tokens": int(completion_tokens[code]),
+            }
+            for code in np.flatnonzero(requests)
+        }
+
+    def _export_columns(self) -> dict[str, np.ndarray | list[str]]:
+        columns: dict[str, np.ndarray | list[str]] = {
+            name: column[: self.size] for name, column in self.columns.items()
+        }
+        for column in NAME_COLUMNS:
+            names = np.asarray(self.names[column], dtype=object)
+            columns[column] = names[columns[column]].tolist() if self.size else []
+
+        return columns
+
+    def to_csv(self, path: str):
+        columns = self._export_columns()
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv_writer(file)
+            writer.writerow(columns.keys())
+            writer.writerows(
+                zip(
+                    *(
+                        column.tolist() if isinstance(column, np.ndarray) else column
+                        for column in columns.values()
+                    ),
+                    strict=True,
+                )
+            )
+
+    def to_parquet(self, path: str):
+        """
+        Writes the ledger to a Parquet file. Requires `pyarrow`.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = self._export_columns()
+        for column in NAME_COLUMNS:
+            # the names repeat a lot, so they are stored as dictionaries
+            columns[column] = pa.array(columns[column], pa.string()).dictionary_encode()
+
+        pq.write_table(pa.table(columns), path)
@@ -0,0 +1,321 @@
+"""
+This module houses the multi-process worker mode of the OWUI Connector.
+
+A single event loop is bound by the JSON encoding and decoding of the streams it carries.
+The worker pool starts several processes, each with its own `OpenWebUiConnector`, and
+routes every chat to one of them with consistent hashing, so the state of a chat always
+lives in the same process. The generated tokens are sent back to the parent over a shared
+result queue.
+"""
+
+from bisect import bisect
+from hashlib import md5
+from itertools import count
+from multiprocessing import get_context
+from os import cpu_count
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import monotonic
+from typing import Any, Iterator
+
+# result kinds sent from the workers to the parent
+RESULT_TOKEN = 0
+RESULT_DONE = 1
+RESULT_ERROR = 2
+# sent by the dispatcher to itself, after everything a dead worker managed to send
+RESULT_WORKER_EXITED = 3
+# sent by the pool to the dispatcher, after everything the closed workers sent
+RESULT_POOL_CLOSED = 4
+
+# how often the dispatcher checks whether the workers are still alive, in seconds
+LIVENESS_INTERVAL = 1.0
+
+
+class ConsistentHashRing:
+    """
+    Maps keys to nodes, moving only a small part of the keys when the node count changes.
+
+    Attributes:
+        replicas (int): The amount of points every node has on the ring.
+        points (list[int]): The sorted hashes of the ring.
+        nodes (dict[int, int]): The node of every hash.
+    """
+
+    replicas: int
+    points: list[int]
+    nodes: dict[int, int]
+
+    def __init__(self, node_count: int, replicas: int = 128):
+        self.replicas = replicas
+        self.nodes = {}
+
+        for node in range(node_count):
+            for replica in range(replicas):
+                self.nodes[self._hash(f"{node}:{replica}")] = node
+
+        self.points = sorted(self.nodes)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def get_node(self, key: str) -> int:
+        index = bisect(self.points, self._hash(key)) % len(self.points)
+        return self.nodes[self.points[index]]
+
+
+def _worker_main(host, token, port, is_ssl, job_queue, result_queue):
+    """
+    The entry point of a worker process. Jobs are read on the main thread of the worker and
+    run concurrently on the event loop of its connector.
+    """
+    from .connector import OpenWebUiConnector
+
+    connector = OpenWebUiConnector(host, token, port, is_ssl)
+    loop = connector.api.http_client.loop
+    tasks = set()
+
+    async def run_job(job_id, chat_title, model, content):
+        try:
+            stream = await connector.chat(chat_title, model, content, stream=True)
+            async for chunk in stream:
+                token_content = chunk["message"]["content"]
+                if token_content:
+                    result_queue.put((job_id, RESULT_TOKEN, token_content))
+
+        except Exception as error:
+            result_queue.put((job_id, RESULT_ERROR, repr(error)))
+
+        else:
+            result_queue.put((job_id, RESULT_DONE, None))
+
+            # the reply still has to reach the panel before the worker may close
+            if stream.completion_task is not None:
+                try:
+                    await stream.completion_task
+                except Exception as error:
+                    print(
+                        f"OpenWebUI Connector - Failed to sync a chat to the panel: {error!r}"
+                    )
+
+    async def wait_jobs():
+        while tasks:
+            pending = list(tasks)
+            for task in pending:
+                await task
+
+            tasks.difference_update(pending)
+
+    try:
+        connector.connect()
+
+        while True:
+            job = job_queue.get()
+            if job is None:
+                break
+
+            task = loop.create_task_thread_safe(run_job(*job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # the running generations are finished and synced, not cut off
+        loop.run(wait_jobs())
+        loop.run(connector.api.close())
+    finally:
+        # the thread of the loop would keep a failed worker alive, instead of letting the
+        # parent see it exit
+        loop.stop()
+
+
+class WorkerPool:
+    """
+    A pool of worker processes, each owning its own connector.
+
+    Attributes:
+        process_count (int): The amount of worker processes.
+        ring (ConsistentHashRing): Routes the chats to the workers.
+        processes (list): The worker processes.
+        job_queues (list): The job queue of every worker.
+        result_queue: The queue every worker sends its results to.
+        streams (dict[int, Queue]): The result queue of every running job in the parent.
+        job_workers (dict[int, int]): The worker of every running job.
+        dead_workers (set[int]): The workers whose process exited.
+    """
+
+    process_count: int
+    ring: ConsistentHashRing
+    processes: list
+    job_queues: list
+    result_queue: Any
+    streams: dict[int, Queue]
+    job_workers: dict[int, int]
+    dead_workers: set[int]
+
+    def __init__(
+        self,
+        host: str,
+        token: str,
+        port: int = 8080,
+        is_ssl: bool = False,
+        process_count: int | None = None,
+    ):
+        self.process_count = process_count or cpu_count() or 1
+        self.ring = ConsistentHashRing(self.process_count)
+        self.processes = []
+        self.job_queues = []
+        self.streams = {}
+        self.job_workers = {}
+        self.dead_workers = set()
+
+        self._connection_parameters = (host, token, port, is_ssl)
+        # the connector runs threads, so the workers must not be forked from this process
+        self._context = get_context("spawn")
+        self.result_queue = self._context.Queue()
+        self._job_ids = count()
+        self._lock = Lock()
+        self._dispatcher = None
+
+    def start(self):
+        for _ in range(self.process_count):
+            job_queue = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main,
+                args=(*self._connection_parameters, job_queue, self.result_queue),
+                daemon=True,
+            )
+            process.start()
+            self.job_queues.append(job_queue)
+            self.processes.append(process)
+
+        self._dispatcher = Thread(target=self._dispatch_results, daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch_results(self):
+        checked_at = monotonic()
+        while True:
+            try:
+                result = self.result_queue.get(timeout=LIVENESS_INTERVAL)
+            except Empty:
+                result = ()
+
+            if monotonic() - checked_at >= LIVENESS_INTERVAL:
+                checked_at = monotonic()
+                self._check_workers()
+
+            if result is None:
+                return
+
+            if not result:
+                continue
+
+            job_id, kind, payload = result
+            if kind == RESULT_POOL_CLOSED:
+                self._fail_jobs("The worker pool was closed")
+                continue
+
+            if kind == RESULT_WORKER_EXITED:
+                self._fail_jobs(
+                    f"The worker process exited with the code {payload[1]}",
+                    payload[0],
+                )
+                continue
+
+            with self._lock:
+                stream = self.streams.get(job_id)
+
+            if stream is not None:
+                stream.put(result)
+
+    def _check_workers(self):
+        for worker, process in enumerate(self.processes):
+            if worker in self.dead_workers or process.is_alive():
+                continue
+
+            with self._lock:
+                self.dead_workers.add(worker)
+
+            # the results the worker sent before it died are still queued, so its jobs are
+            # only failed once the dispatcher read past them
+            self.result_queue.put(
+                (None, RESULT_WORKER_EXITED, (worker, process.exitcode))
+            )
+
+    def _fail_jobs(self, reason: str, worker: int | None = None):
+        """
+        Ends the running jobs of a worker, or of every worker, with an error.
+        """
+        with self._lock:
+            streams = [
+                (job_id, stream)
+                for job_id, stream in self.streams.items()
+                if worker is None or self.job_workers[job_id] == worker
+            ]
+
+        for job_id, stream in streams:
+            stream.put((job_id, RESULT_ERROR, reason))
+
+    def stream(self, chat_title: str, model: str, content: str) -> Iterator[str]:
+        """
+        Sends a message to a chat on the worker owning it, and yields the generated tokens.
+        Raises a `RuntimeError` if the worker exits, or the pool is closed, before the
+        reply is finished.
+        """
+        if not self.processes:
+            raise RuntimeError("The worker pool is not started")
+
+        job_id = next(self._job_ids)
+        stream = Queue()
+        worker = self.ring.get_node(chat_title)
+        with self._lock:
+            if worker in self.dead_workers:
+                raise RuntimeError(
+                    f"The worker process owning the chat {chat_title} exited"
+                )
+
+            self.streams[job_id] = stream
+            self.job_workers[job_id] = worker
+
+        self.job_queues[worker].put((job_id, chat_title, model, content))
+
+        try:
+            while True:
+                _, kind, payload = stream.get()
+                if kind == RESULT_TOKEN:
+                    yield payload
+                elif kind == RESULT_DONE:
+                    return
+                else:
+                    raise RuntimeError(f"The worker failed to run the chat: {payload}")
+        finally:
+            with self._lock:
+                del self.streams[job_id]
+                del self.job_workers[job_id]
+
+    def chat(self, chat_title: str, model: str, content: str) -> str:
+        return "".join(self.stream(chat_title, model, content))
+
+    def close(self, timeout: float | None = 10.0):
+        for job_queue in self.job_queues:
+            job_queue.put(None)
+
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+        # the jobs still waiting for a result will not get one anymore, they are failed
+        # once the dispatcher read past the results the workers sent before they exited
+        self.result_queue.put((None, RESULT_POOL_CLOSED, None))
+        self.result_queue.put(None)
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout)
+
+        self.processes = []
+        self.job_queues = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.close()